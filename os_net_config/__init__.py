@@ -18,11 +18,12 @@ import json
 import logging
 import os
 
-from oslo_concurrency import processutils
-
+from os_net_config import common
 from os_net_config import objects
 from os_net_config import utils
 
+processutils = common.lazy_import('oslo_concurrency.processutils')
+
 
 logger = logging.getLogger(__name__)
 
@@ -485,6 +486,14 @@ class NetConfig(object):
         """
         raise NotImplementedError("apply is not implemented.")
 
+    def commit(self):
+        """Make the changes applied by the provider final
+
+        The providers which roll back their own changes on a failure no
+        longer revert the changes made so far.
+        """
+        pass
+
     def execute(self, msg, cmd, *args, **kwargs):
         """Print a message and run a command.
 
@@ -16,8 +16,10 @@
 
 
 import argparse
+import hashlib
 import importlib
 import json
+import logging
 import os
 import sys
 import traceback
@@ -29,13 +31,19 @@ from os_net_config.exit_codes import get_exit_code
 from os_net_config.exit_codes import has_failures
 from os_net_config import objects
 from os_net_config import utils
-from os_net_config import validator
-from os_net_config import version
 
+# jsonschema and pbr are only needed once a config is applied
+validator = common.lazy_import('os_net_config.validator')
+version = common.lazy_import('os_net_config.version')
 
-logger = common.configure_logger()
+logger = logging.getLogger(__name__)
 
 _SYSTEM_CTL_CONFIG_FILE = '/etc/sysctl.d/os-net-sysctl.conf'
+# The libyaml based loader is much faster on the large config files
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+# Options that do not change what is applied, left out of the fingerprint
+_FINGERPRINT_IGNORED_OPTS = ('debug', 'verbose', 'detailed_exit_codes',
+                             'dump_file', 'force', 'interfaces', 'noop')
 _PROVIDERS = {
     'ifcfg': 'IfcfgNetConfig',
     'eni': 'ENINetConfig',
@@ -46,6 +54,19 @@ _PROVIDERS = {
 __all__ = ['ExitCode', 'get_exit_code', 'has_failures']
 
 
+class _VersionAction(argparse.Action):
+    """Prints the version, looking it up only when it is requested."""
+
+    def __init__(self, option_strings, dest=argparse.SUPPRESS,
+                 default=argparse.SUPPRESS, help=None):
+        super(_VersionAction, self).__init__(
+            option_strings=option_strings, dest=dest, default=default,
+            nargs=0, help=help or "show program's version number and exit")
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        parser.exit(message=version.version_info.version_string() + '\n')
+
+
 def parse_opts(argv):
     parser = argparse.ArgumentParser(
         description='Configure host network interfaces using a JSON'
@@ -118,8 +139,7 @@ def parse_opts(argv):
 
     parser.add_argument(
         '--version',
-        action='version',
-        version=version.version_info.version_string())
+        action=_VersionAction)
     parser.add_argument(
         '--noop',
         dest="noop",
@@ -189,6 +209,46 @@ def parse_opts(argv):
         """Disabled by default.""",
         required=False)
 
+    parser.add_argument(
+        '--single-transaction',
+        dest="single_transaction",
+        action='store_true',
+        help="""Apply the interfaces, routes, rules and DNS of """
+        """network_config in a single nmstate transaction instead of one """
+        """transaction per kind. Supported only by the nmstate provider. """
+        """Disabled by default.""",
+        required=False)
+
+    parser.add_argument(
+        '--sriov-concurrency',
+        dest="sriov_concurrency",
+        type=int,
+        help="""Maximum number of SR-IOV PFs configured concurrently. """
+        """Supported only by the nmstate provider.""",
+        default=None,
+        required=False)
+
+    parser.add_argument(
+        '--dump-file',
+        dest="dump_file",
+        metavar='DUMP_FILE',
+        help="""Write the full dumps of the configs and network states """
+        """to this rotating file. The log then has only the truncated """
+        """dumps.""",
+        default=None,
+        required=False)
+
+    parser.add_argument(
+        '--force',
+        dest="force",
+        action='store_true',
+        help="""Apply the configuration even if the config files, options """
+        """and NICs are unchanged since the last successful run. Changes """
+        """made outside of os-net-config, like edited ifcfg files or NM """
+        """profiles, addresses, routes or VF counts, are not detected and """
+        """need --force to be reverted.""",
+        required=False)
+
     opts = parser.parse_args(argv[1:])
 
     return opts
@@ -227,6 +287,97 @@ def get_sriovpf_member_of_bond_ovs_port(obj):
     return net_devs_list
 
 
+def detect_provider(root_dir):
+    """Detects the provider for this operating system
+
+    :param root_dir: the root directory of the system
+    :returns: the name of the provider, or None if none is usable
+    """
+    if is_nmstate_available():
+        return "nmstate"
+    if os.path.exists(f'{root_dir}/etc/sysconfig/network-scripts/'):
+        return "ifcfg"
+    if os.path.exists('%s/etc/network/' % root_dir):
+        return "eni"
+    return None
+
+
+def fingerprint_options(opts):
+    """Returns the options which decide what a run applies."""
+    return {key: value for key, value in vars(opts).items()
+            if key not in _FINGERPRINT_IGNORED_OPTS}
+
+
+def config_fingerprint(options, inventory, provider):
+    """Computes the fingerprint of the inputs of a run
+
+    :param options: the options from fingerprint_options()
+    :param inventory: the utils.NicInventory of the NICs present
+    :param provider: the name of the provider which applies the config
+    :returns: the sha256 hex digest of the os-net-config version, the
+        provider, the config and mapping files, the SR-IOV and DPDK maps,
+        the options and the physical NICs
+    """
+    digest = hashlib.sha256()
+    digest.update(version.version_info.release_string().encode())
+    digest.update(str(provider).encode())
+    for path in (options['config_file'], options['mapping_file'],
+                 common.SRIOV_CONFIG_FILE, common.DPDK_MAPPING_FILE):
+        try:
+            with open(path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        except OSError:
+            digest.update(b'-')
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    digest.update(inventory.digest().encode())
+    return digest.hexdigest()
+
+
+def is_config_unchanged(fingerprint, inventory):
+    """Checks if the last successful run had the same fingerprint
+
+    The links which were up after that run must still be up, so that a
+    network that went down since then is configured again. The state
+    applied by the provider is not checked, so the changes made outside
+    of os-net-config since then are only reverted with --force.
+
+    :param fingerprint: the fingerprint of the current run
+    :param inventory: the utils.NicInventory of the NICs present
+    :returns: True if the run can be skipped
+    """
+    data = common.get_file_data(common.CONFIG_FINGERPRINT_FILE)
+    try:
+        saved = yaml.safe_load(data) if data else None
+    except yaml.YAMLError:
+        saved = None
+    if not isinstance(saved, dict) or saved.get('fingerprint') != fingerprint:
+        return False
+    for name in saved.get('links_up') or []:
+        nic = inventory.get(name)
+        if not nic or nic['operstate'] != 'up':
+            logger.info("%s: not up since the last successful run", name)
+            return False
+    return True
+
+
+def save_config_fingerprint(options, provider):
+    """Records the fingerprint after a successful run"""
+    # The maps modified by the run are part of the fingerprint
+    common.flush_maps()
+    with utils.nic_inventory() as inventory:
+        data = {'fingerprint': config_fingerprint(options, inventory,
+                                                  provider),
+                'links_up': inventory.links_up()}
+    common.write_yaml_config(common.CONFIG_FINGERPRINT_FILE, data)
+
+
+def remove_config_fingerprint():
+    try:
+        os.remove(common.CONFIG_FINGERPRINT_FILE)
+    except FileNotFoundError:
+        pass
+
+
 def load_provider(name, noop, root_dir):
     mod = importlib.import_module(f'os_net_config.impl_{name}')
     provider_class = getattr(mod, _PROVIDERS[name])
@@ -255,16 +406,41 @@ def is_nmstate_available():
     return False
 
 
-def main(argv=sys.argv, main_logger=None):
-    onc_ret_code = ExitCode.SUCCESS
+def commit_run():
+    """Drop the journal of the nmstate providers at the end of the run
+
+    Each provider commits its changes once its section is applied, so
+    only the journal of a failed section that could not be rolled back is
+    left, which shall not leak into a later run in the same process.
+    """
+    impl_nmstate = sys.modules.get('os_net_config.impl_nmstate')
+    if impl_nmstate is not None:
+        impl_nmstate.commit_run()
+
 
+def main(argv=sys.argv, main_logger=None):
     opts = parse_opts(argv)
+    ret_code = ExitCode.ERROR
+    try:
+        ret_code = _main(opts, main_logger)
+        return ret_code
+    finally:
+        commit_run()
+        # A run that failed, or raised, is not skipped when run again
+        if has_failures(ret_code) and not opts.noop:
+            remove_config_fingerprint()
+
+
+def _main(opts, main_logger):
+    onc_ret_code = ExitCode.SUCCESS
 
     common.set_noop(opts.noop)
 
     if not main_logger:
         main_logger = common.configure_logger(log_file=not opts.noop)
     common.logger_level(main_logger, opts.verbose, opts.debug)
+    if opts.dump_file:
+        common.configure_dump_file(opts.dump_file)
     main_logger.info("Using config file at: %s", opts.config_file)
 
     config_data = {
@@ -329,23 +505,49 @@ def main(argv=sys.argv, main_logger=None):
         print(json.dumps(reported_nics))
         return onc_ret_code
 
+    # The config file is parsed once and the sections are validated
+    # together, before any of them is applied
+    config_file = ConfigFile(opts.config_file)
+    sections = {}
     for section in config_data.keys():
-        try:
-            config_data[section] = get_iface_config(
-                section,
-                opts.config_file,
-                iface_mapping,
-                persist_mapping,
-                strict_validate=opts.exit_on_validation_errors,
-            )
-        except objects.InvalidConfigException as e:
-            main_logger.error(
-                "%s: Schema validation failed with error: \n%s", section, e
-            )
-            return get_exit_code(
-                opts.detailed_exit_codes,
-                onc_ret_code | ExitCode.SCHEMA_VALIDATION_FAILED
-            )
+        iface_array = config_file.section(section)
+        if isinstance(iface_array, list):
+            sections[section] = iface_array
+    try:
+        validate_sections(sections,
+                          strict_validate=opts.exit_on_validation_errors)
+    except objects.InvalidConfigException as e:
+        main_logger.error("Schema validation failed with error: \n%s", e)
+        return get_exit_code(
+            opts.detailed_exit_codes,
+            onc_ret_code | ExitCode.SCHEMA_VALIDATION_FAILED
+        )
+
+    # Skip the run if nothing changed since the last successful run, once
+    # the config is known to be valid. The options are captured now, since
+    # the provider gets resolved below.
+    fp_options = fingerprint_options(opts)
+    provider = opts.provider or detect_provider(opts.root_dir)
+    if not opts.noop:
+        with utils.nic_inventory() as inventory:
+            unchanged = not opts.force and is_config_unchanged(
+                config_fingerprint(fp_options, inventory, provider),
+                inventory)
+        if unchanged:
+            main_logger.info("No change in the config, options or NICs "
+                             "since the last successful run, skipping. "
+                             "Use --force to apply the config anyway.")
+            return get_exit_code(opts.detailed_exit_codes, onc_ret_code)
+        remove_config_fingerprint()
+
+    for section in config_data.keys():
+        config_data[section] = get_iface_config(
+            section,
+            config_file,
+            iface_mapping,
+            persist_mapping,
+            validate=False,
+        )
 
     if opts.remove_config:
         if config_data["remove_config"]:
@@ -404,18 +606,12 @@ def main(argv=sys.argv, main_logger=None):
             )
 
     if not opts.provider:
-        ifcfg_path = f'{opts.root_dir}/etc/sysconfig/network-scripts/'
-        if is_nmstate_available():
-            opts.provider = "nmstate"
-        elif os.path.exists(ifcfg_path):
-            opts.provider = "ifcfg"
-        elif os.path.exists('%s/etc/network/' % opts.root_dir):
-            opts.provider = "eni"
-        else:
+        if not provider:
             main_logger.error("Unable to set provider for this operating "
                               "system.")
             return get_exit_code(opts.detailed_exit_codes,
                                  onc_ret_code | ExitCode.ERROR)
+        opts.provider = provider
 
     if opts.minimum_config:
         if config_data["minimum_config"]:
@@ -459,6 +655,8 @@ def main(argv=sys.argv, main_logger=None):
             opts.noop,
             opts.no_activate,
             opts.cleanup,
+            single_transaction=opts.single_transaction,
+            sriov_concurrency=opts.sriov_concurrency,
         )
         if ret_code == ExitCode.ERROR:
             main_logger.error("%s: Network config failed", opts.provider)
@@ -495,6 +693,12 @@ def main(argv=sys.argv, main_logger=None):
             dcb_apply = dcb_config.DcbApplyConfig()
             dcb_apply.apply()
             main_logger.info("%s: DCB config completed", opts.provider)
+
+    # The purge and remove_config runs change the state outside of the
+    # config, so a rerun of the same command is not skipped
+    rerunnable = not opts.purge_provider and not opts.remove_config
+    if rerunnable and not opts.noop and not has_failures(onc_ret_code):
+        save_config_fingerprint(fp_options, opts.provider)
     return get_exit_code(opts.detailed_exit_codes, onc_ret_code)
 
 
@@ -630,6 +834,8 @@ def config_provider(provider_name,
                     noop,
                     no_activate,
                     cleanup,
+                    single_transaction=False,
+                    sriov_concurrency=None,
                     ):
     """Configure network interfaces using the specified provider
 
@@ -641,9 +847,24 @@ def config_provider(provider_name,
     :param no_activate: If True, install config but don't start/stop
         interfaces
     :param cleanup: If True, cleanup unconfigured interfaces
+    :param single_transaction: If True, the provider applies the
+        configuration in a single transaction (nmstate only)
+    :param sriov_concurrency: Maximum number of SR-IOV PFs configured
+        concurrently (nmstate only)
     :returns: ExitCode
 
     """
+    # The SR-IOV and DPDK maps are loaded once and written at the end.
+    # The link attributes are fetched once for all the objects.
+    with common.map_transaction(), utils.link_info_cache():
+        return _config_provider(provider_name, config_name, iface_config,
+                                root_dir, noop, no_activate, cleanup,
+                                single_transaction, sriov_concurrency)
+
+
+def _config_provider(provider_name, config_name, iface_config, root_dir,
+                     noop, no_activate, cleanup, single_transaction,
+                     sriov_concurrency):
     configure_sriov = False
     files_changed = {}
     pf_files_changed = []
@@ -660,20 +881,43 @@ def config_provider(provider_name,
         logger.error("%s: cannot load provider, error %s", provider_name, e)
         return ExitCode.ERROR
 
+    if single_transaction:
+        if hasattr(provider, 'single_transaction'):
+            provider.single_transaction = True
+        else:
+            logger.warning(
+                "%s: single transaction is not supported, ignoring",
+                provider_name
+            )
+    if sriov_concurrency:
+        if hasattr(provider, 'sriov_concurrency'):
+            provider.sriov_concurrency = sriov_concurrency
+        else:
+            logger.warning(
+                "%s: SR-IOV concurrency is not supported, ignoring",
+                provider_name
+            )
+
     # Look for the presence of SriovPF types in the first parse of the json
     # if SriovPFs exists then PF devices needs to be configured so that the VF
     # devices are created.
     # The VFs will not be available now and an exception
     # SriovVfNotFoundException will be raised while fetching the device name.
+    # Such objects are deferred, while the other objects built in the first
+    # parse are retained.
     # After the first parse the SR-IOV PF devices would be configured and the
     # VF devices would be created.
-    # In the second parse, all other objects shall be added
+    # In the second parse, only the deferred objects are built again and all
+    # the objects other than SriovPFs shall be added
     try:
+        iface_objs = []
         for iface_json in iface_config:
             try:
                 obj = objects.object_from_json(iface_json)
             except common.SriovVfNotFoundException:
+                iface_objs.append(None)
                 continue
+            iface_objs.append(obj)
 
             if _is_sriovpf_obj_found(obj):
                 configure_sriov = True
@@ -699,6 +943,9 @@ def config_provider(provider_name,
         # os-net-config skips the ifup <ifcfg-pfs>, since the ifcfgs for PFs
         # wouldn't have changed.
         if configure_sriov:
+            # The PF configuration creates the VFs, which run the udev rules
+            # reading the SR-IOV map from the file
+            common.flush_maps()
             # Skip cleanup while applying PF configuration
             pf_files_changed = provider.apply(cleanup=False,
                                               activate=not no_activate,
@@ -715,16 +962,21 @@ def config_provider(provider_name,
                     execution_from_cli=True,
                     restart_openvswitch=restart_ovs)
 
-        for iface_json in iface_config:
+            # The VFs are created now
+            utils.reset_link_info()
+
+        for iface_json, obj in zip(iface_config, iface_objs):
             # All sriov_pfs at top level or at any member level will be
-            # ignored and all other objects are parsed will be added here.
+            # ignored and all other objects will be added here.
             # The VFs are expected to be available now and an exception
             # SriovVfNotFoundException shall be raised if not available.
-            try:
-                obj = objects.object_from_json(iface_json)
-            except common.SriovVfNotFoundException:
-                if not noop:
-                    raise
+            if obj is None:
+                try:
+                    obj = objects.object_from_json(iface_json)
+                except common.SriovVfNotFoundException:
+                    if not noop:
+                        raise
+                    continue
 
             if not _is_sriovpf_obj_found(obj):
                 provider.add_object(obj)
@@ -732,6 +984,9 @@ def config_provider(provider_name,
         if provider_name == "ifcfg" and configure_sriov and not noop:
             utils.configure_sriov_vfs()
 
+        # The interfaces brought up by the provider could run the udev
+        # rules and scripts reading the maps from the files
+        common.flush_maps()
         files_changed = provider.apply(cleanup=cleanup,
                                        activate=not no_activate)
         logger.info(
@@ -756,52 +1011,120 @@ def config_provider(provider_name,
             print()
             print(data)
             print("----")
+    # The section is applied, a failure of the later sections shall not
+    # roll it back
+    provider.commit()
     if len(files_changed) > 0:
         return ExitCode.FILES_CHANGED
     return ExitCode.SUCCESS
 
 
+class ConfigFile(object):
+    """The config file, read and parsed once for all its sections
+
+    :param path: path of the config file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._config = None
+        self._parsed = False
+
+    def _load(self):
+        if self._config is not None:
+            return
+        self._config = {}
+        if not os.path.exists(self.path):
+            logger.error("The config file %s is not found", self.path)
+            return
+        try:
+            with open(self.path) as cf:
+                config = yaml.load(cf, Loader=_YAML_LOADER)
+        except IOError:
+            logger.error("Error reading file: %s", self.path)
+            return
+        except yaml.YAMLError as e:
+            logger.error("Invalid YAML in config file %s: %s", self.path, e)
+            return
+        self._parsed = True
+        if isinstance(config, dict):
+            self._config = config
+
+    @property
+    def parsed(self):
+        """True if the file was read and parsed successfully"""
+        self._load()
+        return self._parsed
+
+    def section(self, name):
+        """Return the named section of the config, or None"""
+        self._load()
+        return self._config.get(name)
+
+
+def validate_sections(sections, strict_validate=False):
+    """Validate the sections of the config in a single pass
+
+    All the sections are validated before any of them is applied, with
+    the schema validator compiled once.
+
+    :param sections: dict of the section name and the list of interfaces
+    :param strict_validate: raise on validation errors instead of warning
+    :raises InvalidConfigException: with the errors of all the invalid
+        sections, if strict_validate is set
+    """
+    failures = []
+    for name, iface_array in sections.items():
+        if not iface_array:
+            continue
+        validation_errors = validator.validate_config(iface_array)
+        for e in validation_errors:
+            if strict_validate:
+                logger.error("%s: %s", name, e)
+            else:
+                logger.warning("%s: %s", name, e)
+        if validation_errors:
+            failures.append("%s:\n%s" % (name, "\n".join(validation_errors)))
+    if strict_validate and failures:
+        raise objects.InvalidConfigException("\n".join(failures))
+
+
 def get_iface_config(
         config_name,
         config_file,
         iface_map,
         persist_map,
-        strict_validate=False):
-    logger.info("Reading %s for %s section", config_file, config_name)
-    # Read config file containing network configs to apply
-    if os.path.exists(config_file):
-        try:
-            with open(config_file) as cf:
-                iface_array = yaml.safe_load(cf.read()).get(config_name)
-        except IOError:
-            logger.error("Error reading file: %s", config_file)
-            return []
-        except (yaml.scanner.ScannerError, yaml.parser.ParserError) as e:
-            logger.error("Invalid YAML in config file %s: %s", config_file, e)
-            return []
-    else:
-        logger.error("The config file %s is not found", config_file)
-        return []
+        strict_validate=False,
+        validate=True):
+    """Return the interfaces of a section of the config file
+
+    :param config_name: name of the section, e.g. network_config
+    :param config_file: path of the config file, or a ConfigFile so that
+        the file is parsed once for all the sections
+    :param iface_map: the interface mapping added to each interface
+    :param persist_map: the persist mapping flag added to each interface
+    :param strict_validate: raise on validation errors
+    :param validate: validate the section, unset when the sections are
+        validated together with validate_sections()
+    :returns: the list of interfaces, empty on errors
+    """
+    if not isinstance(config_file, ConfigFile):
+        config_file = ConfigFile(config_file)
+    logger.info("Reading %s for %s section", config_file.path, config_name)
+    iface_array = config_file.section(config_name)
 
     if not isinstance(iface_array, list):
-        logger.info(
-            "interfaces are not defined in %s section of %s",
-            config_name,
-            config_file
-        )
+        if config_file.parsed:
+            logger.info(
+                "interfaces are not defined in %s section of %s",
+                config_name,
+                config_file.path
+            )
         return []
 
     common.print_config(iface_array, config_name)
-    validation_errors = validator.validate_config(iface_array)
-    if validation_errors:
-        if strict_validate:
-            for e in validation_errors:
-                logger.error(e)
-            msg = "\n".join(validation_errors)
-            raise objects.InvalidConfigException(msg)
-        else:
-            for e in validation_errors:
-                logger.warning(e)
+    if validate:
+        validate_sections({config_name: iface_array}, strict_validate)
 
     for iface_json in iface_array:
         if iface_json.get('type') != 'route_table':
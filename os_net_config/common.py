@@ -19,15 +19,49 @@
 # As opposed to utils, this is meant to be imported from anywhere. We can't
 # import anything from os_net_config here.
 
+import contextlib
+import functools
+import importlib
 import logging
 import logging.handlers
 import os
-from oslo_concurrency import processutils
 import sys
 import time
 import traceback
 import yaml
 
+
+class _LazyModule(object):
+    """Stands in for a module until one of its attributes is used."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        return "<lazy module '%s'>" % self._name
+
+
+def lazy_import(name):
+    """Defers importing a module until it is first used.
+
+    Heavy dependencies are imported through this so that the quick paths
+    of the cli (the interface report and --version) do not pay for them.
+
+    :param name: the dotted module name
+    :returns: a proxy object resolving attributes from the module
+    """
+    return _LazyModule(name)
+
+
+processutils = lazy_import('oslo_concurrency.processutils')
+pyudev = lazy_import('pyudev')
+
 # File to contain the DPDK mapped nics, as nic name will not be available after
 # binding driver, which is required for correct nic numbering.
 # Format of the file (list mapped nic's details):
@@ -72,13 +106,35 @@ SRIOV_CONFIG_FILE = '/var/lib/os-net-config/sriov_config.yaml'
 
 DCB_CONFIG_FILE = '/var/lib/os-net-config/dcb_config.yaml'
 
+# File to contain the fingerprint of the inputs of the last successful run
+# and the links that were up after it, so that a rerun with the same inputs
+# can be skipped.
+# Format of the file shall be
+# fingerprint: <sha256 hex digest>
+# links_up:
+#   - <link name>
+CONFIG_FINGERPRINT_FILE = '/var/lib/os-net-config/config_fingerprint.yaml'
+
 _SYS_BUS_PCI_DEV = '/sys/bus/pci/devices'
+_SYS_BUS_PCI_DRIVERS_PROBE = '/sys/bus/pci/drivers_probe'
+# Directory of the driver overrides persisted by driverctl
+DRIVERCTL_CONF_DIR = '/etc/driverctl.d'
 SYS_CLASS_NET = '/sys/class/net'
 _LOG_FILE = '/var/log/os-net-config.log'
+# Dumps of configs and states longer than this are truncated in the log,
+# unless debug logging is enabled and no dump file is configured
+MAX_LOG_DUMP_SIZE = 16384
 MLNX_VENDOR_ID = "0x15b3"
 MAC_TABLE_SIZE = 50000
+# Seconds to wait for all the VFs of a PF to be bound with the required driver
+VF_BINDING_TIMEOUT = 30
+# Seconds between the checks of the sysfs targets waited for, since some of
+# the attributes change without any udev event
+SYSFS_POLL_INTERVAL = 0.2
 
 logger = logging.getLogger(__name__)
+# Logger writing the full dumps to the dump file, see configure_dump_file()
+_dump_logger = None
 
 
 class OvsDpdkBindException(ValueError):
@@ -138,10 +194,66 @@ def logger_level(logger, verbose=False, debug=False):
     logger.setLevel(log_level)
 
 
-def print_config(config, msg=""):
+def configure_dump_file(dump_file):
+    """Write the full config and state dumps to a rotating file
+
+    The log then only has the dumps truncated to MAX_LOG_DUMP_SIZE.
+
+    :param dump_file: path of the dump file, None to stop using it
+    """
+    global _dump_logger
+    dump_logger = logging.getLogger("os_net_config_dumps")
+    for handler in dump_logger.handlers:
+        handler.close()
+    dump_logger.handlers.clear()
+    if not dump_file:
+        _dump_logger = None
+        return
+    dump_logger.propagate = False
+    dump_logger.setLevel(logging.DEBUG)
+    file_handler = logging.handlers.RotatingFileHandler(
+        dump_file, maxBytes=10485760, backupCount=3
+    )
+    file_handler.setFormatter(logging.Formatter(
+        fmt='%(asctime)s.%(msecs)03d %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'))
+    dump_logger.addHandler(file_handler)
+    _dump_logger = dump_logger
+
+
+def log_dump(log, level, config, msg, fmt="%s\n%s"):
+    """Log the yaml dump of a config or state
+
+    The config is serialized only if the level is enabled for the logger
+    or a dump file is configured. Dumps larger than MAX_LOG_DUMP_SIZE are
+    truncated in the log, unless debug logging is enabled and there is no
+    dump file with the full dump.
+
+    :param log: the logger
+    :param level: the logging level of the dump
+    :param config: the config or state to be dumped
+    :param msg: the message preceding the dump
+    :param fmt: the log format for the message and the dump
+    """
+    enabled = log.isEnabledFor(level)
+    if not enabled and _dump_logger is None:
+        return
     cfg_dump = yaml.dump(config, default_flow_style=False,
                          allow_unicode=True, encoding=None)
-    logger.info("\n%s:\n%s", msg, cfg_dump)
+    if _dump_logger is not None:
+        _dump_logger.info(fmt, msg, cfg_dump)
+    if not enabled:
+        return
+    if len(cfg_dump) > MAX_LOG_DUMP_SIZE and (
+            _dump_logger is not None or not log.isEnabledFor(logging.DEBUG)):
+        cfg_dump = "%s\n... truncated %d of %d characters" % (
+            cfg_dump[:MAX_LOG_DUMP_SIZE],
+            len(cfg_dump) - MAX_LOG_DUMP_SIZE, len(cfg_dump))
+    log.log(level, fmt, msg, cfg_dump)
+
+
+def print_config(config, msg=""):
+    log_dump(logger, logging.INFO, config, msg, fmt="\n%s:\n%s")
 
 
 def get_timestamp():
@@ -215,8 +327,190 @@ def write_yaml_config(filepath, data):
         logger.info("Writing file %s with content %s", filepath, data)
         return
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    with open(filepath, 'w') as f:
+    # Write to a temporary file and rename it, so that the readers
+    # never see a partially written file
+    tmp_filepath = f"{filepath}.tmp"
+    with open(tmp_filepath, 'w') as f:
         yaml.safe_dump(data, f, default_flow_style=False)
+    os.replace(tmp_filepath, filepath)
+
+
+class MapStore(object):
+    """List of map entries persisted in a yaml file
+
+    Outside a transaction, the file is read for every lookup and written
+    for every save. Within a transaction, the file is loaded only once, the
+    lookups are served from in-memory indexes and the entries are written
+    once when the outermost transaction ends.
+
+    :param get_path: function returning the path of the file. The path is
+        resolved on every access, since it is a module constant which could
+        be changed after the store is created.
+    :param index_keys: dict of index name and a function returning the
+        key of an entry in that index, or None if the entry is not indexed
+    """
+
+    def __init__(self, get_path, index_keys):
+        self._get_path = get_path
+        self._index_keys = index_keys
+        self._depth = 0
+        self._entries = None
+        self._indexes = None
+        self._dirty = False
+
+    @property
+    def path(self):
+        return self._get_path()
+
+    def begin(self):
+        self._depth += 1
+
+    def end(self):
+        self._depth -= 1
+        if self._depth == 0:
+            self.flush()
+            self._entries = None
+            self._indexes = None
+
+    def entries(self):
+        """Return the list of entries
+
+        Within a transaction, the stored list is returned and hence the
+        modifications need to be followed by save().
+        """
+        if self._entries is not None:
+            return self._entries
+        contents = get_file_data(self.path)
+        entries = yaml.safe_load(contents) if contents else []
+        if self._depth:
+            self._entries = entries
+        return entries
+
+    def _index(self, entry):
+        for name, get_key in self._index_keys.items():
+            key = get_key(entry)
+            if key is None:
+                continue
+            # The first entry with the key is retained, unless stale
+            cur_entry = self._indexes[name].get(key)
+            if cur_entry is None or get_key(cur_entry) != key:
+                self._indexes[name][key] = entry
+
+    def lookup(self, index, key, entries=None):
+        """Return the first entry with the given key in the index
+
+        :param index: name of the index
+        :param key: key of the entry
+        :param entries: list of entries returned by entries(), to be
+            searched when outside a transaction
+        :returns: the entry or None if not found
+        """
+        get_key = self._index_keys[index]
+        if not self._depth:
+            if entries is None:
+                entries = self.entries()
+            for entry in entries:
+                if get_key(entry) == key:
+                    return entry
+            return None
+        if self._indexes is None:
+            self._indexes = {name: {} for name in self._index_keys}
+            for entry in self.entries():
+                self._index(entry)
+        entry = self._indexes[index].get(key)
+        if entry is not None and get_key(entry) != key:
+            # The entry is modified after indexing, rebuild the indexes
+            self._indexes = None
+            return self.lookup(index, key)
+        return entry
+
+    def save(self, entries, entry=None):
+        """Save the entries
+
+        :param entries: the complete list of entries
+        :param entry: the only entry added or modified in entries, if any.
+            The indexes are rebuilt on the next lookup otherwise.
+        """
+        if not self._depth:
+            write_yaml_config(self.path, entries)
+            return
+        if entries is not self._entries or entry is None:
+            self._entries = entries
+            self._indexes = None
+        elif self._indexes is not None:
+            self._index(entry)
+        self._dirty = True
+
+    def remove(self):
+        """Remove all the entries along with the file"""
+        if self._depth:
+            self._entries = []
+            self._indexes = None
+            self._dirty = True
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+    def flush(self):
+        """Write the entries modified within the transaction"""
+        if not self._dirty:
+            return
+        self._dirty = False
+        if self._entries:
+            write_yaml_config(self.path, self._entries)
+        elif os.path.exists(self.path):
+            logger.info("%s: Removing the empty map file", self.path)
+            if not get_noop():
+                os.remove(self.path)
+
+
+def _vf_key(entry):
+    if entry.get('device_type') == 'vf':
+        device = entry.get('device', {})
+        return (device.get('name'), device.get('vfid'))
+
+
+def _pf_key(entry):
+    if entry.get('device_type') == 'pf':
+        return entry.get('name')
+
+
+sriov_map_store = MapStore(lambda: SRIOV_CONFIG_FILE, {
+    'name': lambda entry: entry.get('name'),
+    'pf': _pf_key,
+    'vf': _vf_key,
+    'pci_address': lambda entry: entry.get('pci_address'),
+    'mac': lambda entry: entry.get('mac_address', entry.get('macaddr')),
+})
+
+dpdk_map_store = MapStore(lambda: DPDK_MAPPING_FILE, {
+    'name': lambda entry: entry.get('name'),
+    'pci_address': lambda entry: entry.get('pci_address'),
+    'mac': lambda entry: entry.get('mac_address'),
+})
+
+
+@contextlib.contextmanager
+def map_transaction():
+    """Load the SR-IOV and DPDK maps once and write them on exit"""
+    sriov_map_store.begin()
+    dpdk_map_store.begin()
+    try:
+        yield
+    finally:
+        dpdk_map_store.end()
+        sriov_map_store.end()
+
+
+def flush_maps():
+    """Write the SR-IOV and DPDK maps modified in the transaction
+
+    The maps are read from the files by the other processes, like the
+    os-net-config-sriov run by the udev rules and the sriov_config service,
+    so the maps shall be flushed before running anything which could start
+    these processes.
+    """
+    sriov_map_store.flush()
+    dpdk_map_store.flush()
 
 
 def update_dcb_map(device, pci_addr, driver, noop, dscp2prio=None):
@@ -282,17 +576,14 @@ def reset_dcb_map():
 
 
 def get_sriov_map(pf_name=None):
-    contents = get_file_data(SRIOV_CONFIG_FILE)
-    sriov_map = yaml.safe_load(contents) if contents else []
+    sriov_map = sriov_map_store.entries()
     if len(sriov_map) and pf_name:
         return [pf for pf in sriov_map if pf['name'] == pf_name]
     return sriov_map
 
 
 def get_dpdk_map():
-    contents = get_file_data(DPDK_MAPPING_FILE)
-    dpdk_map = yaml.safe_load(contents) if contents else []
-    return dpdk_map
+    return dpdk_map_store.entries()
 
 
 def get_sriov_pfs():
@@ -306,18 +597,15 @@ def get_sriov_pf_names():
 
 
 def get_dpdk_iface_names():
-    contents = get_file_data(DPDK_MAPPING_FILE)
-    dpdk_map = yaml.safe_load(contents) if contents else []
+    dpdk_map = get_dpdk_map()
     iface_names = [item['name'] for item in dpdk_map]
     return iface_names
 
 
 def _get_dpdk_mac_address(name):
-    contents = get_file_data(DPDK_MAPPING_FILE)
-    dpdk_map = yaml.safe_load(contents) if contents else []
-    for item in dpdk_map:
-        if item['name'] == name:
-            return item['mac_address']
+    item = dpdk_map_store.lookup('name', name)
+    if item:
+        return item['mac_address']
 
 
 def interface_mac(name):
@@ -440,16 +728,16 @@ def get_dpdk_pci_address(ifname):
 
 
 def get_sriov_pci_address(name):
-    sriov_map = get_sriov_map(pf_name=name)
-    if sriov_map:
-        return sriov_map[0].get('pci_address', None)
+    item = sriov_map_store.lookup('name', name)
+    if item:
+        return item.get('pci_address', None)
 
 
 def _get_sriov_mac_address(iface_name):
     """Fetch the Mac address from the sriov_map."""
-    sriov_map = get_sriov_map(pf_name=iface_name)
-    if sriov_map:
-        return sriov_map[0].get('mac_address', None)
+    item = sriov_map_store.lookup('name', iface_name)
+    if item:
+        return item.get('mac_address', None)
 
 
 def is_pf_attached_to_guest(iface_name):
@@ -493,26 +781,159 @@ def get_default_vf_driver(pf_name, vfid):
         return None
 
 
+class _UdevEvents(object):
+    """The udev events received by a started pyudev monitor"""
+
+    def __init__(self, monitor):
+        self._monitor = monitor
+
+    def poll(self, timeout=None):
+        return self._monitor.poll(timeout=timeout)
+
+    def close(self):
+        # libudev closes the netlink socket once the monitor is released.
+        # pyudev has no other way to close it.
+        self._monitor = None
+
+
+@contextlib.contextmanager
+def udev_monitor(subsystems):
+    """Monitor the udev events of the given subsystems
+
+    The netlink socket of the monitor is closed on leaving the context.
+    :param subsystems: list of subsystems to be monitored
+    :yields: the udev events, with a poll() like the pyudev monitor, or
+        None if udev is not available
+    """
+    try:
+        context = pyudev.Context()
+        monitor = pyudev.Monitor.from_netlink(context)
+        for subsystem in subsystems:
+            monitor.filter_by(subsystem)
+        monitor.start()
+    except (ImportError, OSError) as exc:
+        logger.warning("Failed to monitor udev events, err %s", exc)
+        yield None
+        return
+    events = _UdevEvents(monitor)
+    del monitor
+    try:
+        yield events
+    finally:
+        events.close()
+
+
+def read_sysfs(path):
+    """Read a sysfs attribute
+
+    :param path: path of the attribute
+    :returns: the stripped value or None if the attribute could not be read
+    """
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def wait_for_sysfs(targets, timeout, subsystems=('net',)):
+    """Wait until all the sysfs targets are satisfied
+
+    The pending targets are checked again on every udev event of the given
+    subsystems, and every SYSFS_POLL_INTERVAL seconds for the attributes
+    changing without any udev event.
+    :param targets: dict of the target name and either the sysfs path
+        that shall exist or a function returning True once satisfied
+    :param timeout: seconds to wait for all the targets together
+    :param subsystems: subsystems whose udev events are monitored
+    :returns: dict of the satisfied target names and the seconds taken.
+        The targets not satisfied within the timeout are not included.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    pending = dict(targets)
+    latencies = {}
+    monitor = None
+    with contextlib.ExitStack() as stack:
+        while True:
+            for name, target in list(pending.items()):
+                if callable(target):
+                    satisfied = target()
+                else:
+                    satisfied = os.path.exists(target)
+                if satisfied:
+                    latencies[name] = time.monotonic() - start
+                    logger.info("%s: ready after %.2f seconds", name,
+                                latencies[name])
+                    del pending[name]
+            remaining = deadline - time.monotonic()
+            if not pending or remaining <= 0:
+                break
+            if monitor is None:
+                # The monitor is started only when a target is pending and
+                # the targets are checked again, so that a change completed
+                # in between is not missed.
+                monitor = stack.enter_context(
+                    udev_monitor(subsystems)) or False
+                continue
+            interval = min(remaining, SYSFS_POLL_INTERVAL)
+            if monitor:
+                if monitor.poll(timeout=interval):
+                    # Consume the burst of events before checking again
+                    while monitor.poll(timeout=0):
+                        pass
+            else:
+                time.sleep(interval)
+    for name in pending:
+        logger.warning("%s: not ready after %s seconds", name, timeout)
+    return latencies
+
+
+def _is_vf_bound(pf, vf, pci_address, req_driver):
+    """Check if the VF is bound with the required driver
+
+    For drivers other than vfio-pci, the VF is considered bound only
+    when its network interface is available in sysfs as well.
+    """
+    try:
+        driver_path = os.readlink(get_pci_dev_path(pci_address, 'driver'))
+    except OSError:
+        return False
+    if os.path.basename(driver_path) != req_driver:
+        return False
+    if req_driver != "vfio-pci":
+        return os.path.exists(get_dev_path(pf, f"virtfn{vf}/net"))
+    return True
+
+
 def wait_for_vf_driver_binding(pf, vfs, req_driver):
-    """Wait for the VF to be bound with the required driver
+    """Wait for the VFs to be bound with the required driver
 
     If the standard device driver is bound with the VF, then wait until the
     sysfs paths corresponding to the network interface is available.
     For vfio-pci driver, wait until the device is bound with the driver.
+    All the VFs are waited for together with wait_for_sysfs(), on the udev
+    events of the pci and net subsystems, for VF_BINDING_TIMEOUT seconds.
     :params pf: PF device name
     :params vfs: list of VF that are bound with req_driver
     :parans req_driver: The driver which shall be bound with the device
     """
+    pci_addresses = {}
+    targets = {}
     for vf in vfs:
-        driver = None
         pci_address = get_pci_address(f"sriov:{pf}:{vf}")
-        for i in range(30):
-            driver = get_pci_device_driver(pci_address)
-            if driver == req_driver:
-                logger.info("%s-%s: verified binding with %s", pf, vf, driver)
-                break
-            time.sleep(1)
-        else:
+        pci_addresses[vf] = pci_address
+        targets[f"{pf}-{vf}"] = functools.partial(
+            _is_vf_bound, pf, vf, pci_address, req_driver)
+
+    bound = wait_for_sysfs(targets, VF_BINDING_TIMEOUT,
+                           subsystems=('pci', 'net'))
+    pending_vfs = {vf: pci_address
+                   for vf, pci_address in pci_addresses.items()
+                   if f"{pf}-{vf}" not in bound}
+    for vf, pci_address in pending_vfs.items():
+        driver = get_pci_device_driver(pci_address)
+        if driver != req_driver:
             logger.error(
                 "%s-%s: bound with %s instead of %s",
                 pf,
@@ -521,18 +942,12 @@ def wait_for_vf_driver_binding(pf, vfs, req_driver):
                 req_driver,
             )
         if driver != "vfio-pci":
-            vf_path = get_dev_path(pf, f"virtfn{vf}/net")
-            for i in range(30):
-                if os.path.exists(vf_path):
-                    break
-                time.sleep(1)
-            else:
-                logger.warning(
-                    "%s-%s: device path %s is not available yet",
-                    pf,
-                    vf,
-                    vf_path,
-                )
+            logger.warning(
+                "%s-%s: device path %s is not available yet",
+                pf,
+                vf,
+                get_dev_path(pf, f"virtfn{vf}/net"),
+            )
 
 
 def is_vf_driver_change_required(pf, linux_vfs, dpdk_vfs):
@@ -567,90 +982,161 @@ def is_vf_driver_change_required(pf, linux_vfs, dpdk_vfs):
     return False
 
 
-def _has_driverctl_override(pci_address):
-    """Check if a PCI address has a driver override set.
+def get_pci_device_drivers(pci_addresses):
+    """Fetch the drivers attached to a set of devices in one sysfs pass
 
-    :param pci_address: PCI address to check
-    :returns: True if override exists, False otherwise
+    :param pci_addresses: PCI addresses of the devices
+    :returns: dict of PCI address and the driver attached to the device,
+        or None if the device is not bound with any driver
     """
-    try:
-        cmd = ["driverctl", "list-overrides"]
-        logger.debug("%s: running %s", pci_address, " ".join(cmd))
-        out, err = processutils.execute(*cmd)
+    drivers = {}
+    for pci_address in pci_addresses:
+        try:
+            driver = os.readlink(get_pci_dev_path(pci_address, 'driver'))
+            drivers[pci_address] = os.path.basename(driver)
+        except OSError:
+            drivers[pci_address] = None
+    return drivers
 
-        # Parse the output to check if our PCI address is listed
-        for line in out.splitlines():
-            if line.strip().startswith(pci_address):
-                return True
-        return False
-    except processutils.ProcessExecutionError as exc:
-        logger.warning(
-            "%s: Failed to check driver override status: %s",
-            pci_address, exc
-        )
-        # If we can't check, assume override exists to be safe
-        return True
+
+def _write_sysfs(path, value):
+    with open(path, 'w') as f:
+        f.write(value)
+
+
+def _driverctl_conf_path(pci_address):
+    return os.path.join(DRIVERCTL_CONF_DIR, f"pci-{pci_address}")
+
+
+def _save_driver_override(pci_address, driver):
+    """Persist the driver override the way driverctl does
+
+    The udev rule of driverctl applies the override saved for the device,
+    whenever the device is added.
+    """
+    conf_path = _driverctl_conf_path(pci_address)
+    if driver is None:
+        if os.path.exists(conf_path):
+            os.remove(conf_path)
+        return
+    os.makedirs(DRIVERCTL_CONF_DIR, exist_ok=True)
+    _write_sysfs(conf_path, f"{driver}\n")
+
+
+def bind_driver_overrides(overrides, save=None):
+    """Bind a set of PCI devices with the given drivers
+
+    The driver_override of all the devices are written first, the devices
+    are unbound from their current drivers and probed again, without
+    forking driverctl for every device. The overrides are saved in the
+    driverctl format, so that driverctl and its udev rule manage them.
+    A device failing to be bound is logged and the others are bound still.
+
+    :param overrides: dict of PCI address and the driver to be bound, or
+        None to remove the override and bind the default driver
+    :param save: True to persist the overrides across reboots. By default,
+        the overrides are persisted for all the devices other than VFs.
+    :returns: tuple of the list of the PCI addresses rebound and the list
+        of the PCI addresses that could not be bound with the driver
+    """
+    if get_noop():
+        logger.info("Setting driver overrides %s", overrides)
+        return [], []
+    drivers = get_pci_device_drivers(overrides)
+    pending = {}
+    for pci_address, driver in overrides.items():
+        if driver is not None and drivers[pci_address] == driver:
+            logger.info("%s: %s is already bound", pci_address, driver)
+            continue
+        pending[pci_address] = driver
+    if not pending:
+        return [], []
+
+    failed = []
+    for pci_address, driver in pending.items():
+        logger.info("%s: Setting driver override to %s", pci_address, driver)
+        try:
+            # A newline clears the driver override
+            _write_sysfs(get_pci_dev_path(pci_address, 'driver_override'),
+                         driver or "\n")
+            if drivers[pci_address]:
+                _write_sysfs(get_pci_dev_path(pci_address, 'driver/unbind'),
+                             pci_address)
+        except OSError as exc:
+            logger.error("%s: Failed to set driver override. %s",
+                         pci_address, exc)
+            failed.append(pci_address)
+
+    for pci_address in pending:
+        if pci_address in failed:
+            continue
+        try:
+            _write_sysfs(_SYS_BUS_PCI_DRIVERS_PROBE, pci_address)
+        except OSError as exc:
+            # Without driver autoprobing, the default driver could not be
+            # bound back once the override is removed
+            logger.info("%s: Failed to probe the driver. %s",
+                        pci_address, exc)
+
+    drivers = get_pci_device_drivers(pending)
+    for pci_address, driver in pending.items():
+        if pci_address in failed:
+            continue
+        if driver is not None and drivers[pci_address] != driver:
+            logger.error("%s: Failed to bind with %s, bound with %s",
+                         pci_address, driver, drivers[pci_address])
+            failed.append(pci_address)
+            continue
+        persist = save if save is not None else not is_vf(pci_address)
+        if persist or driver is None:
+            try:
+                _save_driver_override(pci_address, driver)
+            except OSError as exc:
+                logger.error("%s: Failed to save driver override. %s",
+                             pci_address, exc)
+                failed.append(pci_address)
+    rebound = [pci_address for pci_address in pending
+               if pci_address not in failed]
+    return rebound, failed
+
+
+def set_driver_overrides(overrides, save=None):
+    """Bind a set of PCI devices with the given drivers
+
+    See bind_driver_overrides().
+    :param overrides: dict of PCI address and the driver to be bound, or
+        None to remove the override and bind the default driver
+    :param save: True to persist the overrides across reboots. By default,
+        the overrides are persisted for all the devices other than VFs.
+    :returns: list of the PCI addresses rebound
+    :raises OvsDpdkBindException: if a device could not be bound with the
+        driver
+    """
+    rebound, failed = bind_driver_overrides(overrides, save=save)
+    if failed:
+        msg = f"{', '.join(failed)}: Failed to bind the driver overrides"
+        raise OvsDpdkBindException(msg)
+    return rebound
 
 
 def unset_driverctl_override(pci_address):
-    cmd = ["driverctl", "unset-override", pci_address]
+    logger.info("%s: Removing driver override", pci_address)
     try:
-        logger.info("%s: running %s", pci_address, " ".join(cmd))
-        out, err = processutils.execute(*cmd)
-        if err:
-            logger.error("%s: Failed to unbind dpdk interface.", pci_address)
-            return 1
-        return 0
-    except processutils.ProcessExecutionError as exc:
-        # Treat "failed to bind device" as success since the device is
-        # already unbound. When driver autoprobing is disabled, driverctl
-        # could not bind the device to the previous driver, leading to the
-        # exception. Lets check if the override was actually removed.
-        if not _has_driverctl_override(pci_address):
-            logger.info(
-                "%s: Driver override successfully removed despite driverctl "
-                "error (likely bind-back failure when "
-                "sriov_drivers_autoprobe=0)",
-                pci_address
-            )
-            return 0
-
+        set_driver_overrides({pci_address: None})
+    except OvsDpdkBindException as exc:
         logger.error(
             "%s: Failed to remove driver override. %s", pci_address, exc
         )
         return 1
+    return 0
 
 
 def set_driverctl_override(pci_address, driver):
     if driver is None:
         logger.info("%s: Driver override is not required.", pci_address)
         return False
-    iface_driver = get_pci_device_driver(pci_address)
-    if iface_driver == driver:
-        logger.info("%s: %s is already bound", pci_address, driver)
-        return False
-    try:
-        if is_vf(pci_address):
-            cmd = [
-                "driverctl",
-                "--nosave",
-                "set-override",
-                pci_address,
-                driver,
-            ]
-        else:
-            cmd = ["driverctl", "set-override", pci_address, driver]
-        logger.info(
-            "%s: Binding with %s\n%s", pci_address, driver, " ".join(cmd)
-        )
-        out, err = processutils.execute(*cmd)
-        if err:
-            msg = f"{pci_address}: Failed to bind dpdk interface. err - {err}"
-            raise OvsDpdkBindException(msg)
-    except processutils.ProcessExecutionError:
-        msg = f"{pci_address}: Failed to bind interface with dpdk"
-        raise OvsDpdkBindException(msg)
-    return err
+    logger.info("%s: Binding with %s", pci_address, driver)
+    set_driver_overrides({pci_address: driver})
 
 
 def list_kmods(mods: list) -> list:
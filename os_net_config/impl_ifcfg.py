@@ -14,6 +14,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from concurrent import futures
 import glob
 import itertools
 import logging
@@ -50,6 +51,8 @@ _ROUTE_TABLE_DEFAULT = """# reserved values
 #1\tinr.ruhep\n"""
 
 BACKUP_IFCFG_FILES_PATH = '/var/lib/os-net-config/ifcfg-purge/'
+# Maximum number of interfaces brought up or down concurrently
+IFUP_CONCURRENCY = 4
 NETWORK_SCRIPTS_PATH = '/etc/sysconfig/network-scripts/'
 
 _OVS_TYPE_MAP = {
@@ -233,6 +236,9 @@ class IfcfgNetConfig(os_net_config.NetConfig):
             "sriov_pf": [],
             "dpdk_port": [],  # PCI address of the DPDK port is added here
         }
+        # Maximum number of interfaces brought up or down concurrently
+        # by apply(), the dependent interfaces are still run in order
+        self.ifup_concurrency = IFUP_CONCURRENCY
         logger.info('Ifcfg net config provider created.')
 
     def parse_ifcfg(self, ifcfg_data):
@@ -553,6 +559,59 @@ class IfcfgNetConfig(os_net_config.NetConfig):
             pass
         return children
 
+    def restart_levels(self, names):
+        """Group the interfaces to be restarted into dependency levels
+
+        An interface depends on the interfaces listed before it which are
+        its members, or which it is a member of, directly or through other
+        members, e.g. a bond and its members. The interfaces of a level
+        are independent of each other, and the dependent interfaces are
+        placed in later levels, so that they keep the order of the list.
+
+        :param names: ordered list of interface names
+        :returns: list of the levels, each a list of interface names
+        """
+        levels = []
+        level_of = {}
+        children = {}
+        for name in names:
+            if name in level_of:
+                continue
+            children[name] = self.child_members(name)
+            level = 0
+            for other in level_of:
+                if other in children[name] or name in children[other]:
+                    level = max(level, level_of[other] + 1)
+            level_of[name] = level
+            if level == len(levels):
+                levels.append([])
+            levels[level].append(name)
+        return levels
+
+    def restart(self, action, names, **kwargs):
+        """Run ifup or ifdown on the interfaces, in dependency order
+
+        The levels from restart_levels() are run one after the other and
+        the interfaces of a level concurrently, limited by
+        `ifup_concurrency`. The failures of ifup() are collected in
+        `errors`, while an ifdown() failure is raised once its level is
+        done.
+
+        :param action: self.ifup or self.ifdown
+        :param names: ordered list of interface names
+        :param kwargs: keyword arguments of the action, e.g. iftype
+        """
+        for level in self.restart_levels(names):
+            if self.noop or self.ifup_concurrency <= 1 or len(level) == 1:
+                for name in level:
+                    action(name, **kwargs)
+                continue
+            workers = min(self.ifup_concurrency, len(level))
+            with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                for job in [executor.submit(action, name, **kwargs)
+                            for name in level]:
+                    job.result()
+
     def _del_common(self, base_opt):
         self.del_device["iface"].append(base_opt.name)
 
@@ -2462,30 +2521,26 @@ class IfcfgNetConfig(os_net_config.NetConfig):
                             self.child_members(interface[0]))
                         break
 
-            for vlan in restart_vlans:
-                self.ifdown(vlan)
+            self.restart(self.ifdown, restart_vlans)
 
-            for ib_child in restart_ib_childs:
-                self.ifdown(ib_child)
+            self.restart(self.ifdown, restart_ib_childs)
 
             for interface in restart_interfaces:
-                self.ifdown(interface)
                 for bond in linux_bond_children:
                     if interface in linux_bond_children[bond]:
                         if bond not in restart_linux_bonds:
                             start_linux_bonds.append(bond)
+            self.restart(self.ifdown, restart_interfaces)
 
-            for linux_bond in restart_linux_bonds:
-                self.ifdown(linux_bond)
+            self.restart(self.ifdown, restart_linux_bonds)
 
-            for linux_team in restart_linux_teams:
-                self.ifdown(linux_team)
+            self.restart(self.ifdown, restart_linux_teams)
 
-            for bridge in restart_bridges:
-                self.ifdown(bridge, iftype='bridge')
+            self.restart(self.ifdown, restart_bridges, iftype='bridge')
 
-            for vpp_interface in vpp_interfaces:
-                self.ifdown(vpp_interface.name)
+            self.restart(self.ifdown,
+                         [vpp_interface.name
+                          for vpp_interface in vpp_interfaces])
 
             for oldname, newname in self.renamed_interfaces.items():
                 self.ifrename(oldname, newname)
@@ -2528,11 +2583,9 @@ class IfcfgNetConfig(os_net_config.NetConfig):
                              'restart', 'nfvswitch')
 
         if activate:
-            for linux_team in restart_linux_teams:
-                self.ifup(linux_team)
+            self.restart(self.ifup, restart_linux_teams)
 
-            for bridge in restart_bridges:
-                self.ifup(bridge, iftype='bridge')
+            self.restart(self.ifup, restart_bridges, iftype='bridge')
 
             # If dhclient is running and dhcp not set, stop dhclient
             for interface in stop_dhclient_interfaces:
@@ -2542,15 +2595,13 @@ class IfcfgNetConfig(os_net_config.NetConfig):
                 if not self.noop:
                     stop_dhclient_process(interface)
 
-            for interface in restart_interfaces:
-                self.ifup(interface)
+            self.restart(self.ifup, restart_interfaces)
 
             for linux_bond in start_linux_bonds:
                 if linux_bond not in restart_linux_bonds:
                     restart_linux_bonds.append(linux_bond)
 
-            for linux_bond in restart_linux_bonds:
-                self.ifup(linux_bond)
+            self.restart(self.ifup, restart_linux_bonds)
 
             for bond in self.bond_primary_ifaces:
                 self.ovs_appctl('bond/set-active-slave', bond,
@@ -2563,10 +2614,8 @@ class IfcfgNetConfig(os_net_config.NetConfig):
                     ivs_uplinks,
                     ivs_interfaces,
                 )
-                for ivs_uplink in ivs_uplinks:
-                    self.ifup(ivs_uplink)
-                for ivs_interface in ivs_interfaces:
-                    self.ifup(ivs_interface)
+                self.restart(self.ifup, ivs_uplinks)
+                self.restart(self.ifup, ivs_interfaces)
 
             if nfvswitch_interfaces or nfvswitch_internal_ifaces:
                 logger.info(
@@ -2576,16 +2625,12 @@ class IfcfgNetConfig(os_net_config.NetConfig):
                     nfvswitch_interfaces,
                     nfvswitch_internal_ifaces,
                 )
-                for nfvswitch_interface in nfvswitch_interfaces:
-                    self.ifup(nfvswitch_interface)
-                for nfvswitch_internal in nfvswitch_internal_ifaces:
-                    self.ifup(nfvswitch_internal)
+                self.restart(self.ifup, nfvswitch_interfaces)
+                self.restart(self.ifup, nfvswitch_internal_ifaces)
 
-            for ib_child in restart_ib_childs:
-                self.ifup(ib_child)
+            self.restart(self.ifup, restart_ib_childs)
 
-            for vlan in restart_vlans:
-                self.ifup(vlan)
+            self.restart(self.ifup, restart_vlans)
 
             if not self.noop:
                 if restart_vpp:
@@ -14,8 +14,10 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from concurrent import futures
+import copy
+import itertools
 from libnmstate import error
-from libnmstate import gen_diff
 from libnmstate import netapplier
 from libnmstate import netinfo
 from libnmstate.schema import Bond
@@ -39,6 +41,7 @@ import logging
 import netaddr
 import os
 import re
+import threading
 import yaml
 
 import os_net_config
@@ -51,9 +54,6 @@ from os_net_config import utils
 
 logger = logging.getLogger(__name__)
 
-# Import the raw NetConfig object so we can call its methods
-netconfig = os_net_config.NetConfig()
-
 DISPATCHER_SCRIPT_PREFIX = r"""
 set +e
 set -x
@@ -113,6 +113,17 @@ DISPATCH = 'dispatch'
 LOOPBACK = "lo"
 CONFIG_RULES_FILE = '/var/lib/os-net-config/nmstate_files/rules.yaml'
 BACKUP_NMSTATE_FILES_PATH = '/var/lib/os-net-config/nmstate_files'
+# Default number of PFs configured concurrently
+SRIOV_CONCURRENCY = 4
+# The rule properties nmstate reports even when they are not configured,
+# with any value
+RULE_DEFAULTED_KEYS = {NMRouteRule.FAMILY: None, NMRouteRule.PRIORITY: None}
+# The route properties nmstate reports even when they are not configured,
+# with their default value
+ROUTE_DEFAULTED_KEYS = {NMRoute.METRIC: 0, NMRoute.TABLE_ID: 254}
+# The route and rule properties with integer values
+ROUTE_NUMERIC_KEYS = (NMRoute.METRIC, NMRoute.TABLE_ID,
+                      NMRouteRule.PRIORITY, NMRouteRule.ROUTE_TABLE)
 
 
 class RemoveDeviceNmstateData:
@@ -150,6 +161,150 @@ def get_route_options(route_options, key):
     return
 
 
+# Properties identifying the entries of the lists in the nmstate schema,
+# e.g. the OVS ports, the VFs and the IP addresses
+LIST_ENTRY_ID_KEYS = ('name', 'id', 'ip')
+
+
+def _frozen(value):
+    """Hashable form of a state value, equal iff the values are equal"""
+    if isinstance(value, dict):
+        return frozenset((key, _frozen(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_frozen(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+def _entry_id(entry):
+    """Return the (property, value) identifying a list entry, or None"""
+    if not isinstance(entry, dict):
+        return None
+    for key in LIST_ENTRY_ID_KEYS:
+        if key in entry:
+            try:
+                hash(entry[key])
+            except TypeError:
+                return None
+            return (key, entry[key])
+    return None
+
+
+class _ListIndex(object):
+    """Present list entries indexed by their frozen form and identity
+
+    The index is built once per list, so that each desired entry is looked
+    up among the present entries with the same name, id or ip, instead of
+    comparing it with all of them.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.frozen = set()
+        self.by_id = {}
+        # Entries without the identity property, which could match any
+        # desired entry whose identity property is empty
+        self.no_id = {}
+        for entry in entries:
+            self.frozen.add(_frozen(entry))
+            if not isinstance(entry, dict):
+                continue
+            for key in LIST_ENTRY_ID_KEYS:
+                if key not in entry:
+                    self.no_id.setdefault(key, []).append(entry)
+                    continue
+                try:
+                    self.by_id.setdefault(
+                        (key, entry[key]), []).append(entry)
+                except TypeError:
+                    self.no_id.setdefault(key, []).append(entry)
+
+    def candidates(self, entry):
+        entry_id = _entry_id(entry)
+        if entry_id is None:
+            return [item for item in self.entries if isinstance(item, dict)]
+        candidates = list(self.by_id.get(entry_id, []))
+        if not entry_id[1]:
+            candidates.extend(self.no_id.get(entry_id[0], []))
+        return candidates
+
+    def __contains__(self, entry):
+        return _frozen(entry) in self.frozen
+
+
+def _format_entry_path(path, key, entry):
+    entry_id = _entry_id(entry)
+    if entry_id is None:
+        return f"{path}{key}[]"
+    return f"{path}{key}[{entry_id[0]}={entry_id[1]}]"
+
+
+def _state_differences(superset, subset, path, differences):
+    if superset == subset:
+        return
+    if not (superset and subset) or \
+            not isinstance(superset, (dict, list, str)):
+        differences.append(path.rstrip('.') or '*')
+        return
+    for key, value in subset.items():
+        if key not in superset:
+            # Items which are empty or false
+            # shall be considered as absent
+            if value:
+                differences.append(f"{path}{key}")
+            continue
+        if not isinstance(superset, dict):
+            differences.append(f"{path}{key}")
+            continue
+        present = superset[key]
+        if isinstance(value, dict):
+            _state_differences(present, value, f"{path}{key}.", differences)
+        elif isinstance(value, list):
+            try:
+                if not set(value) <= set(present):
+                    differences.append(f"{path}{key}")
+                continue
+            except TypeError:
+                if not isinstance(present, list):
+                    if value:
+                        differences.append(f"{path}{key}")
+                    continue
+            index = _ListIndex(present)
+            for item in value:
+                if item in index:
+                    continue
+                if isinstance(item, dict) and any(
+                        not state_differences(candidate, item)
+                        for candidate in index.candidates(item)):
+                    continue
+                differences.append(_format_entry_path(path, key, item))
+        elif isinstance(value, set):
+            if not value <= present:
+                differences.append(f"{path}{key}")
+        elif value != present:
+            differences.append(f"{path}{key}")
+
+
+def state_differences(superset, subset):
+    """Find the properties of the desired state not in the present state
+
+    The lists of dicts, e.g. the VFs, OVS ports or IP addresses, are
+    indexed by the name, id or ip of their entries, so that the comparison
+    is linear in the size of the states.
+
+    :param superset: The bigger config, typically the present state
+    :param subset: The smaller config, typically the desired state
+    :returns: list of the paths of the differing properties, e.g.
+        'ethernet.sr-iov.vfs[id=2]', or '*' if the present state is empty.
+        An empty list indicates that the desired state is already
+        configured.
+    """
+    differences = []
+    _state_differences(superset, subset, '', differences)
+    return differences
+
+
 def is_dict_subset(superset, subset):
     """Check to see if one dict is a subset of another dict.
 
@@ -158,50 +313,7 @@ def is_dict_subset(superset, subset):
     :returns: A boolean indicating if the desired state is already
         configured
     """
-
-    if superset == subset:
-        return True
-    if superset and subset:
-        for key, value in subset.items():
-            if key not in superset:
-                # Items which are empty or false
-                # shall be considered as absent
-                if value:
-                    return False
-                else:
-                    continue
-            if isinstance(value, dict):
-                if not is_dict_subset(superset[key], value):
-                    return False
-            elif isinstance(value, int):
-                if value != superset[key]:
-                    return False
-            elif isinstance(value, str):
-                if value != superset[key]:
-                    return False
-            elif isinstance(value, list):
-                try:
-                    if not set(value) <= set(superset[key]):
-                        return False
-                except TypeError:
-                    for item in value:
-                        if item not in superset[key]:
-                            if isinstance(item, dict):
-                                for s_items in superset[key]:
-                                    if is_dict_subset(s_items, item):
-                                        break
-                                else:
-                                    return False
-                            else:
-                                return False
-            elif isinstance(value, set):
-                if not value <= superset[key]:
-                    return False
-            else:
-                if not value == superset[key]:
-                    return False
-        return True
-    return False
+    return not state_differences(superset, subset)
 
 
 def _add_sub_tree(data, subtree):
@@ -331,6 +443,349 @@ def _is_any_ip_addr(address):
     return False
 
 
+def _canonical_value(key, value):
+    """Canonical form of a route or rule property value
+
+    The numeric properties given as strings are converted to int and the IP
+    addresses and networks are normalized, e.g. 2001:DB8::0/64 to
+    2001:db8::/64.
+    """
+    if not isinstance(value, str):
+        return value
+    if key in ROUTE_NUMERIC_KEYS and value.isdigit():
+        return int(value)
+    if '.' in value or ':' in value:
+        try:
+            if '/' in value:
+                return str(netaddr.IPNetwork(value).cidr)
+            return str(netaddr.IPAddress(value))
+        except (netaddr.AddrFormatError, ValueError):
+            pass
+    return value
+
+
+def route_key(entry, ignore_keys=()):
+    """Hashable canonical form of a route or rule, without its state
+
+    :param entry: the route or rule in nmstate schema
+    :param ignore_keys: properties to be left out of the key
+    :returns: a frozenset of the canonical (property, value) pairs
+    """
+    return frozenset(
+        (key, _canonical_value(key, value)) for key, value in entry.items()
+        if key != NMRoute.STATE and key not in ignore_keys)
+
+
+def _route_keys(entry, defaulted_keys):
+    """Keys of a present route or rule, with and without the defaults
+
+    The present state reports the properties which nmstate defaults, so
+    the entry also matches a desired one without these properties. A
+    property with a default value is left out only when it has this value,
+    so that an entry whose property is removed from the config is changed.
+    """
+    present = [key for key, default in defaulted_keys.items()
+               if key in entry and (
+                   default is None or
+                   _canonical_value(key, entry[key]) == default)]
+    for count in range(len(present) + 1):
+        for ignore_keys in itertools.combinations(present, count):
+            yield route_key(entry, ignore_keys)
+
+
+def route_delta(curr_entries, desired_entries, defaulted_keys={}):
+    """Computes the minimal change from the present to the desired entries
+
+    The desired entries are indexed by their canonical key, so that the
+    delta is computed in a single pass over the present entries.
+
+    :param curr_entries: the present routes or rules
+    :param desired_entries: the desired routes or rules
+    :param defaulted_keys: dict of the properties which nmstate reports
+        even when the desired entry did not set them, and of their default
+        value, or None when any value is defaulted
+    :returns: tuple of the desired entries not present, including the ones
+        to be made absent, and the present entries not desired
+    """
+    desired_keys = set(
+        route_key(entry) for entry in desired_entries
+        if entry.get(NMRoute.STATE) != NMRoute.STATE_ABSENT)
+    matched_keys = set()
+    stale_entries = []
+    for entry in curr_entries:
+        for key in _route_keys(entry, defaulted_keys):
+            if key in desired_keys:
+                matched_keys.add(key)
+                break
+        else:
+            stale_entries.append(entry)
+    missing_entries = [
+        entry for entry in desired_entries
+        if entry.get(NMRoute.STATE) == NMRoute.STATE_ABSENT or
+        route_key(entry) not in matched_keys]
+    return missing_entries, stale_entries
+
+
+class NmstateStateSnapshot(object):
+    """Snapshot of the nmstate running config with lookup indexes
+
+    Querying the running config is a full NetworkManager/nmstate dump.
+    The snapshot is fetched lazily on the first lookup and indexed by
+    interface name, interface type and route next hop interface, so that
+    the repeated lookups made while preparing and applying the config are
+    served from memory. The snapshot shall be invalidated whenever the
+    running config is modified. The lookups return copies, so that the
+    callers could modify them without altering the snapshot.
+
+    :param state: the running config, when the snapshot is made of an
+        already fetched running config
+    """
+
+    def __init__(self, state=None):
+        self._state = None
+        self._ifaces = []
+        self._ifaces_by_name = {}
+        self._ifaces_by_type = {}
+        self._routes = []
+        self._routes_by_iface = {}
+        self._rules = []
+        self._relations = None
+        if state is not None:
+            self._index(state)
+
+    def invalidate(self):
+        """Drop the snapshot, so that the next lookup fetches it again"""
+        if self._state is not None:
+            logger.debug("Invalidating the running config snapshot")
+        self._state = None
+
+    def _load(self):
+        if self._state is None:
+            self._index(netinfo.show_running_config())
+
+    def _index(self, state):
+        self._state = state
+        self._relations = None
+        self._ifaces = self._state.get(Interface.KEY, [])
+        self._ifaces_by_name = {}
+        self._ifaces_by_type = {}
+        for iface in self._ifaces:
+            # Device names are not unique across types in nmstate, e.g. an
+            # ovs-bridge and its ovs-interface. Keep the listing order.
+            self._ifaces_by_name.setdefault(
+                iface.get(Interface.NAME), []).append(iface)
+            self._ifaces_by_type.setdefault(
+                iface.get(Interface.TYPE), []).append(iface)
+        self._routes = self._state.get(NMRoute.KEY, {}).get(
+            NMRoute.CONFIG, [])
+        self._routes_by_iface = {}
+        for route in self._routes:
+            self._routes_by_iface.setdefault(
+                route.get(NMRoute.NEXT_HOP_INTERFACE), []).append(route)
+        self._rules = self._state.get(NMRouteRule.KEY, {}).get(
+            NMRouteRule.CONFIG, [])
+
+    @property
+    def loaded(self):
+        return self._state is not None
+
+    @property
+    def state(self):
+        """The running config, which shall not be modified"""
+        self._load()
+        return self._state
+
+    def frozen(self):
+        """Return a snapshot of the running config that is never refreshed"""
+        self._load()
+        return NmstateStateSnapshot(state=self._state)
+
+    def iface(self, name, type=None):
+        """Return a copy of the state of the named interface, or None
+
+        :param name: name of the interface
+        :param type: when given, only the interface of this type is matched
+        """
+        self._load()
+        for iface in self._ifaces_by_name.get(name, []):
+            if type is None or iface.get(Interface.TYPE) == type:
+                return copy.deepcopy(iface)
+        return None
+
+    def ifaces_by_name(self, name):
+        """Return a copy of the interfaces of the given name, of any type"""
+        self._load()
+        return copy.deepcopy(self._ifaces_by_name.get(name, []))
+
+    def ifaces(self, type=None):
+        """Return a copy of the interfaces, optionally of the given type"""
+        self._load()
+        if type is None:
+            return copy.deepcopy(self._ifaces)
+        return copy.deepcopy(self._ifaces_by_type.get(type, []))
+
+    def routes(self, name=''):
+        """Return a copy of the routes, optionally of the given interface"""
+        self._load()
+        if name != '':
+            routes = self._routes_by_iface.get(name, [])
+        else:
+            routes = self._routes
+        return copy.deepcopy(routes)
+
+    def rules(self):
+        """Return a copy of the ip rules"""
+        self._load()
+        return copy.deepcopy(self._rules)
+
+    def relations(self, dependencies):
+        """Return the graph of the related interfaces
+
+        The graph is built once for the snapshot.
+        :param dependencies: function returning the (name, dependent name)
+            tuples of an interface state
+        :returns: dict of the interface names and the set of the names of
+            the interfaces related to them, in either direction
+        """
+        self._load()
+        if self._relations is None:
+            self._relations = {}
+            for iface in self._ifaces:
+                for name, dependent in dependencies(iface):
+                    self._relations.setdefault(name, set()).add(dependent)
+                    self._relations.setdefault(dependent, set()).add(name)
+        return self._relations
+
+
+class NmstateStateService(object):
+    """Running config shared by all the nmstate providers of the process
+
+    A run creates a provider for each of remove_config, minimum_config,
+    network_config and fallback_config. They share the running config
+    snapshot, and the journal for rolling back the changes. Each applied
+    change records its inverse delta in the journal, i.e. the previous
+    state of the interfaces, routes, rules and DNS it touched. Only the
+    first change of an entry is recorded, so replaying the journal in the
+    reverse order restores the state before the uncommitted changes. Each
+    provider commits the journal once its section is applied successfully,
+    so that a failure rolls back only the changes of the failed section.
+    The previous state of the entries is looked up in the baseline, the
+    running config as of the first uncommitted change, so that the running
+    config is not queried again for every change.
+    """
+
+    def __init__(self):
+        self.running_state = NmstateStateSnapshot()
+        self._journal = []
+        self._journaled = set()
+        self._baseline = None
+        self._lock = threading.Lock()
+
+    @property
+    def journal(self):
+        """The inverse deltas of the uncommitted changes, oldest first"""
+        return list(self._journal)
+
+    def baseline(self):
+        """The running config before the uncommitted changes
+
+        :returns: NmstateStateSnapshot taken from the running config
+            snapshot on the first call after a commit
+        """
+        with self._lock:
+            if self._baseline is None:
+                self._baseline = self.running_state.frozen()
+            return self._baseline
+
+    def is_journaled(self, key):
+        """Check if the previous state of the entry is already recorded"""
+        return key in self._journaled
+
+    def record(self, inverse_state, keys):
+        """Record the inverse delta of a change applied successfully
+
+        :param inverse_state: desired state reverting the change
+        :param keys: keys of the entries reverted by inverse_state
+        """
+        if not any(inverse_state.values()):
+            return
+        with self._lock:
+            self._journal.append(inverse_state)
+            self._journaled.update(keys)
+
+    def commit(self):
+        """Make the changes final, a rollback no longer reverts them"""
+        with self._lock:
+            self._journal = []
+            self._journaled = set()
+            self._baseline = None
+
+    def reset(self):
+        """Drop the snapshot, the journal and the baseline"""
+        self.running_state.invalidate()
+        self.commit()
+
+
+# The nmstate state service of the process
+_state_service = NmstateStateService()
+
+
+def state_service():
+    """Return the nmstate state service shared by the providers"""
+    return _state_service
+
+
+def commit_run():
+    """Drop the journal left by a failed section, at the end of the run"""
+    _state_service.commit()
+
+
+class ManagedRules(object):
+    """The ip rules added by os-net-config, persisted in CONFIG_RULES_FILE
+
+    The file is loaded once, on the first lookup, and the rules are kept
+    as a set of canonical keys, so that checking if a rule is managed does
+    not depend on the number of managed rules.
+    """
+
+    def __init__(self):
+        self._keys = None
+
+    def _load(self):
+        self._keys = set()
+        data = common.get_file_data(CONFIG_RULES_FILE)
+        if not data:
+            return
+        try:
+            state = yaml.safe_load(data)
+            rules = state[NMRouteRule.KEY][NMRouteRule.CONFIG] or []
+        except (yaml.YAMLError, KeyError, TypeError):
+            logger.warning("Unable to parse the managed ip rules in %s",
+                           CONFIG_RULES_FILE)
+            return
+        self._keys = set(route_key(rule) for rule in rules)
+
+    def is_managed(self, rule):
+        """Check if the present rule was added by os-net-config
+
+        :param rule: the present rule in nmstate schema
+        :returns: True if the rule is managed
+        """
+        if self._keys is None:
+            self._load()
+        return any(key in self._keys
+                   for key in _route_keys(rule, RULE_DEFAULTED_KEYS))
+
+    def save(self, rules):
+        """Persist the rules as the managed rules
+
+        :param rules: list of the rules in nmstate schema
+        """
+        common.write_yaml_config(
+            CONFIG_RULES_FILE, {NMRouteRule.KEY: {NMRouteRule.CONFIG: rules}})
+        self._keys = set(route_key(rule) for rule in rules)
+
+
 class NmstateNetConfig(os_net_config.NetConfig):
     """Configure network interfaces using NetworkManager via nmstate API."""
 
@@ -344,6 +799,7 @@ class NmstateNetConfig(os_net_config.NetConfig):
         self.route_data = {}
         # List of the rules data
         self.rules_data = []
+        self.managed_rules = ManagedRules()
         self.dns_data = {'server': [], 'domain': []}
         # Dict of the ovs bridges, with keys being the device name
         self.bridge_data = {}
@@ -360,6 +816,8 @@ class NmstateNetConfig(os_net_config.NetConfig):
         # SR-IOV VF configurations inline with nmstate schema
         # {pf1: [list of vf configs of pf1], pf2: [list of vf configs of pf2]}
         self.sriov_vf_data = {}
+        # PF of the SR-IOV VFs, {vf1_name: pf1, vf2_name: pf1}
+        self.sriov_vf_pfs = {}
         # SR-IOV VF drivers that needs override.
         #  {pf1: {vfid1: driver, vfid2: driver},
         #   pf2: {vfid1: driver, vfid2: driver}}
@@ -384,10 +842,19 @@ class NmstateNetConfig(os_net_config.NetConfig):
         # separately if the flag is set. It will be applicable
         # only for NIC Partitioning use cases.
         self.need_vf_config = False
-        self.initial_state = netinfo.show_running_config()
-        self.__dump_key_config(
-            self.initial_state, msg='Initial network settings'
-        )
+        # Boolean flag to apply the interfaces, routes, rules and DNS
+        # of apply() in a single nmstate transaction
+        self.single_transaction = False
+        # Maximum number of PFs configured concurrently during the
+        # SR-IOV PF and VF configuration
+        self.sriov_concurrency = SRIOV_CONCURRENCY
+        self.nmstate_apply_lock = threading.Lock()
+        # Running config of the devices, shared by the providers and
+        # refreshed only after the running config is modified. Other
+        # providers could have modified it before this one is created.
+        self.state_service = state_service()
+        self.running_state = self.state_service.running_state
+        self.running_state.invalidate()
         logger.info('nmstate net config provider created.')
 
     def rollback_to_initial_settings(self):
@@ -401,25 +868,148 @@ class NmstateNetConfig(os_net_config.NetConfig):
         and as such the failure needs to be handled so that the
         initial settings is restored.
         """
+        journal = self.state_service.journal
+        if not journal:
+            logger.info("No change to roll back to initial settings.")
+            return
         logger.info("Rolling back to initial settings.")
-        cur_state = netinfo.show_running_config()
-        diff_state = gen_diff.generate_differences(self.initial_state,
-                                                   cur_state)
-        msg = "Applying the difference to go back to initial settings "
-        self.__dump_key_config(diff_state, msg=msg)
-        netapplier.apply(diff_state, verify_change=True)
+        # The journal holds the previous state of each entry as of its
+        # first change, so the oldest deltas are merged last and win.
+        rollback_state = self.merge_states(reversed(journal))
+        msg = "Applying the journal to go back to initial settings "
+        self.__dump_key_config(rollback_state, msg=msg)
+        try:
+            netapplier.apply(rollback_state, verify_change=True)
+        finally:
+            self.running_state.invalidate()
+        self.state_service.commit()
+
+    def commit(self):
+        """Make the changes applied by the provider final
+
+        The journal is dropped, so that the rollback of a later section of
+        the run does not revert the changes of this provider.
+        """
+        self.state_service.commit()
+
+    def _inverse_entry(self, entry):
+        """Return the route or rule entry reverting the given one"""
+        inverse = {key: value for key, value in entry.items()
+                   if key != NMRoute.STATE}
+        if entry.get(NMRoute.STATE) != NMRoute.STATE_ABSENT:
+            inverse[NMRoute.STATE] = NMRoute.STATE_ABSENT
+        return inverse
+
+    def _inverse_state(self, new_state):
+        """Compute the inverse delta of the desired state
+
+        The previous state of the interfaces is taken from the baseline of
+        the uncommitted changes, without querying the running config again.
+        Along with the desired interfaces, the previous state of their
+        controllers, ports, VLANs and base interfaces is taken, since
+        nmstate could modify or bring them down as a side effect, and so
+        are all the routes of these interfaces. The desired
+        routes and rules are simply flipped between present and absent,
+        since they are the delta from the running config. The entries
+        already changed by an uncommitted change are skipped.
+
+        :param new_state: desired state to be applied
+        :returns: tuple of the inverse state and the keys of its entries
+        """
+        service = self.state_service
+        baseline = service.baseline()
+        keys = set()
+
+        def first_change(key):
+            if key in keys or service.is_journaled(key):
+                return False
+            keys.add(key)
+            return True
+
+        desired_ifaces = new_state.get(Interface.KEY, [])
+        related = {}
+        if desired_ifaces:
+            related = baseline.relations(self._state_dependencies)
+
+        ifaces = []
+        routes = []
+        rules = []
+        touched = set()
+        pending = []
+        for iface in desired_ifaces:
+            name = iface[Interface.NAME]
+            iface_type = iface.get(Interface.TYPE)
+            touched.add(name)
+            # The new controller, ports and base interface are affected
+            pending.extend(itertools.chain.from_iterable(
+                self._state_dependencies(iface)))
+            if not first_change((Interface.KEY, name, iface_type)):
+                continue
+            keys.add((Interface.KEY, name))
+            pending.append(name)
+            present = baseline.iface(name, type=iface_type)
+            if present is None:
+                inverse_iface = {Interface.NAME: name,
+                                 Interface.STATE: InterfaceState.ABSENT}
+                if iface_type:
+                    inverse_iface[Interface.TYPE] = iface_type
+                ifaces.append(inverse_iface)
+            else:
+                ifaces.append(present)
+
+        # The interfaces affected as a side effect of the desired ones, i.e.
+        # all the interfaces connected to them through the controller, port
+        # and VLAN base interface relations. The interfaces already recorded
+        # are skipped, since the interfaces related to them are recorded
+        # along with them.
+        affected = set()
+        while pending:
+            name = pending.pop()
+            if name in affected or service.is_journaled((Interface.KEY, name)):
+                continue
+            affected.add(name)
+            pending.extend(related.get(name, ()))
+        for name in sorted(affected - touched):
+            for present in baseline.ifaces_by_name(name):
+                iface_type = present.get(Interface.TYPE)
+                if first_change((Interface.KEY, name, iface_type)):
+                    keys.add((Interface.KEY, name))
+                    ifaces.append(present)
+
+        for route in new_state.get(NMRoute.KEY, {}).get(NMRoute.CONFIG, []):
+            if first_change((NMRoute.KEY, route_key(route))):
+                routes.append(self._inverse_entry(route))
+        # nmstate removes the routes of the removed interfaces and the
+        # kernel drops the routes whose addresses are removed
+        for name in sorted(affected):
+            for route in baseline.routes(name):
+                if first_change((NMRoute.KEY, route_key(route))):
+                    routes.append(route)
+        for rule in new_state.get(NMRouteRule.KEY, {}).get(
+                NMRouteRule.CONFIG, []):
+            if first_change((NMRouteRule.KEY, route_key(rule))):
+                rules.append(self._inverse_entry(rule))
+
+        inverse_state = {}
+        if ifaces:
+            inverse_state[Interface.KEY] = ifaces
+        if routes:
+            inverse_state[NMRoute.KEY] = {NMRoute.CONFIG: routes}
+        if rules:
+            inverse_state[NMRouteRule.KEY] = {NMRouteRule.CONFIG: rules}
+        if DNS.KEY in new_state and first_change((DNS.KEY,)):
+            dns_config = baseline.state.get(DNS.KEY, {}).get(
+                DNS.CONFIG, {})
+            inverse_state[DNS.KEY] = {DNS.CONFIG: copy.deepcopy(dns_config)}
+        return inverse_state, keys
 
     def __dump_config(self, config, msg="Applying config"):
-        cfg_dump = yaml.dump(config, default_flow_style=False,
-                             allow_unicode=True, encoding=None)
         logger.debug("----------------------------")
-        logger.debug("%s\n%s", msg, cfg_dump)
+        common.log_dump(logger, logging.DEBUG, config, msg)
 
     def __dump_key_config(self, config, msg="Applying config"):
-        cfg_dump = yaml.dump(config, default_flow_style=False,
-                             allow_unicode=True, encoding=None)
         logger.info("----------------------------")
-        logger.info("%s\n%s", msg, cfg_dump)
+        common.log_dump(logger, logging.INFO, config, msg)
 
     def get_vf_config(self, sriov_vf):
         """Create the nmstate schema for the given VF
@@ -476,20 +1066,92 @@ class NmstateNetConfig(os_net_config.NetConfig):
             )
             vf_config = self.get_vf_config(sriov_vf)
             self.sriov_vf_data[sriov_vf.device][sriov_vf.vfid] = vf_config
+            self.sriov_vf_pfs[sriov_vf.name] = sriov_vf.device
             self.add_vf_driver_override(sriov_vf)
         else:
             msg = f"{sriov_vf.device}-{sriov_vf.vfid}: PF is not configured"
             raise objects.InvalidConfigException(msg)
 
+    def _sriov_pf_groups(self, pf_names):
+        """Group the PFs that shall not be configured concurrently
+
+        The PFs sharing a bond, either directly or through their VFs, are
+        placed in the same group and the PFs in a group are configured one
+        after the other.
+
+        :param pf_names: ordered list of PF names
+        :returns: list of groups, each group being a list of PF names
+        """
+        groups = []
+        for pf_name in pf_names:
+            peers = {pf_name}
+            for members in self.member_names.values():
+                member_pfs = {self.sriov_vf_pfs.get(member, member)
+                              for member in members}
+                if pf_name in member_pfs:
+                    peers.update(member_pfs)
+            group = [pf_name]
+            for other in list(groups):
+                if peers.intersection(other):
+                    groups.remove(other)
+                    group = other + group
+            groups.append(group)
+        return groups
+
+    def _configure_sriov_pfs(self, pf_names, configure):
+        """Configure the PFs using a bounded pool of workers
+
+        The independent PFs are configured concurrently, limited by
+        `sriov_concurrency`. The nmstate applies are serialized by
+        `nmstate_apply_lock`, since a nmstate checkpoint covers all the
+        devices, so `configure` shall do the work that overlaps, like the
+        waits for the VF driver bindings, outside of the lock.
+        The failure of a PF is added to `errors`, so that apply() rolls
+        back to the initial settings.
+
+        :param pf_names: ordered list of PF names
+        :param configure: callable that configures the given PF and
+            returns True if the PF is updated
+        :returns: The list of PFs updated, in the order of pf_names
+        """
+        updated_pfs = set()
+
+        def configure_group(group):
+            for pf_name in group:
+                try:
+                    if configure(pf_name):
+                        updated_pfs.add(pf_name)
+                except Exception as exc:
+                    logger.error(
+                        "%s: SR-IOV configuration failed, error %s",
+                        pf_name,
+                        exc,
+                    )
+                    self.errors.append(exc)
+
+        groups = self._sriov_pf_groups(pf_names)
+        if len(groups) > 1 and self.sriov_concurrency > 1:
+            workers = min(self.sriov_concurrency, len(groups))
+            with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                for job in [executor.submit(configure_group, group)
+                            for group in groups]:
+                    job.result()
+        else:
+            for group in groups:
+                configure_group(group)
+        return [pf_name for pf_name in pf_names if pf_name in updated_pfs]
+
     def apply_pf_config(self, activate):
         """Apply the PF Configuration for all the required interfaces
 
             The required nmstate schema based configurations are available in
             `sriov_pf_data`. The generated nmstate schema is applied
-            sequentially for one device after the other. These PF
-            configurations are compared against the current state of those
-            interfaces. If there is a mismatch in the current state and
-            desired state, only then the generated nmstate templates is applied
+            sequentially for one device after the other, since the nmstate
+            applies are serialized and there is no other work to overlap.
+            These PF configurations are compared against the current state of
+            those interfaces, just before each apply. If there is a mismatch
+            in the current state and desired state, only then the generated
+            nmstate templates is applied
 
         :param activate: A boolean which indicates if the config should
             be activated by applying the desired state.
@@ -505,7 +1167,10 @@ class NmstateNetConfig(os_net_config.NetConfig):
             # JIRA: https://issues.redhat.com/browse/RHEL-67120
             cur_state = self.iface_state(name=pf_name)
             self.remove_empty_dispatch_scripts(cur_state, pf_state)
-            if not is_dict_subset(cur_state, pf_state):
+            differences = state_differences(cur_state, pf_state)
+            if differences:
+                logger.info("%s: PF config differs in %s", pf_name,
+                            ', '.join(differences))
                 if not self.noop and activate:
                     logger.debug("%s: Applying the PF config", pf_name)
                     self.nmstate_apply(self.set_ifaces([pf_state]),
@@ -521,11 +1186,10 @@ class NmstateNetConfig(os_net_config.NetConfig):
 
             The required nmstate schema based VF configurations are available
             in `sriov_vf_data` and the PF configuration in `sriov_pf_data`.
-            The generated nmstate schema is applied sequentially for one
-            device after the other. These configurations are compared
-            against the current state of those interfaces. If there is
-            a mismatch in the current state and desired state, the nmstate
-            templates are applied
+            These configurations are compared against the current state of
+            those interfaces, just before each apply. If there is a mismatch
+            in the current state and desired state, the nmstate templates are
+            applied. The independent PFs are configured concurrently.
 
         :param activate: A boolean which indicates if the config should
             be activated by applying the desired state.
@@ -534,7 +1198,8 @@ class NmstateNetConfig(os_net_config.NetConfig):
         :returns: The list of devices configured
         """
 
-        updated_pfs = []
+        # {pf: (linux_vfs, dpdk_vfs)} for the PFs with VFs to configure
+        required_pfs = {}
         for pf in self.sriov_vf_data.keys():
             required_vfs = []
             pf_state = {}
@@ -573,11 +1238,18 @@ class NmstateNetConfig(os_net_config.NetConfig):
                     Ethernet.CONFIG_SUBTREE][
                     Ethernet.SRIOV_SUBTREE][
                     Ethernet.SRIOV.VFS_SUBTREE] = required_vfs
-                cur_state = self.iface_state(name=pf_state['name'])
-                # compare the desired state with the current state
+                required_pfs[pf] = (linux_vfs, dpdk_vfs)
+
+        def configure_vfs(pf):
+            pf_state = self.sriov_pf_data[pf]
+            linux_vfs, dpdk_vfs = required_pfs[pf]
+            with self.nmstate_apply_lock:
+                # The current state is read just before the apply, since
+                # the applies of the other PFs could have changed it.
                 # FIXME: The comparison of the desired state and current
                 # state shall be managed by nmstate itself.
                 # JIRA: https://issues.redhat.com/browse/RHEL-67120
+                cur_state = self.iface_state(name=pf_state['name'])
                 apply_dispatcher_script = False
                 if common.is_vf_driver_change_required(
                     pf, linux_vfs, dpdk_vfs
@@ -587,38 +1259,36 @@ class NmstateNetConfig(os_net_config.NetConfig):
                     )
                     apply_dispatcher_script = True
 
-                if not is_dict_subset(cur_state, pf_state) or \
-                        apply_dispatcher_script:
-                    if not self.noop and activate:
-                        logger.debug(
-                            "%s: Applying the VF parameters",
-                            pf_state["name"],
-                        )
-                        self.nmstate_apply(self.set_ifaces([pf_state]),
-                                           verify=True)
-                        # NetworkManager-dispatcher scripts will bind the VFs
-                        # with the drivers. Wait for the completion of the
-                        # driver bindings.
-                        if linux_vfs:
-                            lnx_driver = common.get_default_vf_driver(
-                                pf, linux_vfs[0]
-                            )
-                            common.wait_for_vf_driver_binding(
-                                pf,
-                                linux_vfs,
-                                lnx_driver,
-                            )
-                        if dpdk_vfs:
-                            common.wait_for_vf_driver_binding(
-                                pf,
-                                dpdk_vfs,
-                                "vfio-pci",
-                            )
-                        updated_pfs.append(pf_state["name"])
-                else:
+                differences = state_differences(cur_state, pf_state)
+                if differences:
+                    logger.info("%s: VF config differs in %s", pf,
+                                ', '.join(differences))
+                if not differences and not apply_dispatcher_script:
                     logger.info(
                         "%s: No changes required for VFs", pf_state["name"]
                     )
+                    return False
+                if self.noop or not activate:
+                    return False
+                logger.debug("%s: Applying the VF parameters",
+                             pf_state["name"])
+                self.nmstate_apply(self.set_ifaces([pf_state]), verify=True)
+            # NetworkManager-dispatcher scripts will bind the VFs
+            # with the drivers. Wait for the completion of the
+            # driver bindings, outside of the lock so that the waits
+            # of the PFs overlap.
+            if linux_vfs:
+                lnx_driver = common.get_default_vf_driver(pf, linux_vfs[0])
+                common.wait_for_vf_driver_binding(pf, linux_vfs, lnx_driver)
+            if dpdk_vfs:
+                common.wait_for_vf_driver_binding(pf, dpdk_vfs, "vfio-pci")
+            return True
+
+        updated_pfs = [
+            self.sriov_pf_data[pf]["name"]
+            for pf in self._configure_sriov_pfs(list(required_pfs),
+                                                configure_vfs)
+        ]
         # Clear the flag once all the VFs are configured
         self.need_vf_config = False
         return updated_pfs
@@ -719,24 +1389,100 @@ class NmstateNetConfig(os_net_config.NetConfig):
         :returns: list state of all interfaces when name is not specified, or
                   the state of the specific interface when name is specified
         """
-        ifaces = netinfo.show_running_config()[Interface.KEY]
-        if type is not None:
-            ifaces = [iface for iface in ifaces
-                      if iface[Interface.TYPE] == type]
         if name != '':
-            for iface in ifaces:
-                if iface[Interface.NAME] != name:
-                    continue
+            iface = self.running_state.iface(name, type=type)
+            if iface is not None:
                 self.__dump_config(iface, msg=f"{name}: Present state")
-                return iface
-        elif type is not None:
+            return iface
+        ifaces = self.running_state.ifaces(type=type)
+        if type is not None:
             self.__dump_config(
                 ifaces, msg=f"Present state for all interfaces of type {type}"
             )
-            return ifaces
         else:
             self.__dump_config(ifaces, msg="Present state for all interfaces")
-            return ifaces
+        return ifaces
+
+    def _iface_dependencies(self, iface):
+        """Dependencies of the present interface with other interfaces
+
+        :param iface: the interface in nmstate schema
+        :returns: list of (name, dependent name) tuples, for the controller,
+            the ports and the VLAN base interface of the interface
+        """
+        name = iface[Interface.NAME]
+        state = self.running_state.iface(name, type=iface.get(Interface.TYPE))
+        if not state:
+            return []
+        return self._state_dependencies(state)
+
+    def _state_dependencies(self, state):
+        """Dependencies of the interface in the given state
+
+        :param state: the present or desired interface in nmstate schema
+        :returns: list of (name, dependent name) tuples, for the controller,
+            the ports and the VLAN base interface of the interface
+        """
+        name = state[Interface.NAME]
+        dependencies = []
+        if state.get(Interface.CONTROLLER):
+            dependencies.append((state[Interface.CONTROLLER], name))
+        vlan = state.get(VLAN.CONFIG_SUBTREE) or {}
+        if vlan.get(VLAN.BASE_IFACE):
+            dependencies.append((vlan[VLAN.BASE_IFACE], name))
+        bridge = state.get(OVSBridge.CONFIG_SUBTREE) or {}
+        for port in bridge.get(OVSBridge.PORT_SUBTREE) or []:
+            dependencies.append((name, port.get(OVSBridge.Port.NAME)))
+        bond = state.get(Bond.CONFIG_SUBTREE) or {}
+        for port in bond.get(Bond.PORT) or []:
+            dependencies.append((name, port))
+        return dependencies
+
+    def absent_batches(self, absent_ifaces):
+        """Orders the interfaces to be removed in dependency ordered batches
+
+        The interfaces depending on another interface being removed, like
+        its VLANs and ports, are removed in an earlier batch than it. All
+        the interfaces of a batch are removed in a single transaction.
+
+        :param absent_ifaces: list of the interfaces in nmstate schema
+        :returns: list of the batches, each a list of interfaces
+        """
+        names = set(iface[Interface.NAME] for iface in absent_ifaces)
+        dependents = {}
+        for iface in absent_ifaces:
+            for name, dependent in self._iface_dependencies(iface):
+                if name in names and dependent in names and \
+                        name != dependent:
+                    dependents.setdefault(name, set()).add(dependent)
+
+        levels = {}
+
+        def level(name, visiting):
+            if name not in levels:
+                visiting.add(name)
+                levels[name] = 1 + max(
+                    [level(dependent, visiting)
+                     for dependent in dependents.get(name, [])
+                     if dependent not in visiting], default=-1)
+                visiting.discard(name)
+            return levels[name]
+
+        batches = []
+        for iface in absent_ifaces:
+            index = level(iface[Interface.NAME], set())
+            while len(batches) <= index:
+                batches.append([])
+            batches[index].append(iface)
+        return [batch for batch in batches if batch]
+
+    def _remove_ifaces(self, absent_ifaces):
+        """Removes the interfaces, a transaction per dependency batch
+
+        :param absent_ifaces: list of the interfaces in nmstate schema
+        """
+        for batch in self.absent_batches(absent_ifaces):
+            self.nmstate_apply(self.set_ifaces(batch), verify=True)
 
     def cleanup_all_ifaces(self, exclude_nics=[]):
         """Cleanup all the interfaces that are available
@@ -752,7 +1498,8 @@ class NmstateNetConfig(os_net_config.NetConfig):
         exclude_nics.extend(common.get_sriov_pf_names())
         exclude_nics.extend(common.get_dpdk_iface_names())
         exclude_types = [OVSBridge.TYPE, OVSInterface.TYPE]
-        ifaces = netinfo.show_running_config()[Interface.KEY]
+        ifaces = self.running_state.ifaces()
+        clean_ifaces = []
         logger.debug("Interface name excluded: %s", ", ".join(exclude_nics))
         logger.debug("Interface type excluded: %s", ", ".join(exclude_types))
         for iface in ifaces:
@@ -783,12 +1530,20 @@ class NmstateNetConfig(os_net_config.NetConfig):
                     Interface.STATE: InterfaceState.ABSENT,
                     Interface.TYPE: iface.get(Interface.TYPE),
                 }
-                state = {Interface.KEY: [clean_iface]}
                 self.__dump_key_config(
                     clean_iface, msg=f"{iface[Interface.NAME]}: Cleaning up"
                 )
-                if not self.noop:
-                    netapplier.apply(state, verify_change=True)
+                clean_ifaces.append(clean_iface)
+
+        for batch in self.absent_batches(clean_ifaces):
+            if not self.noop:
+                batch_state = {Interface.KEY: batch}
+                inverse = self._inverse_state(batch_state)
+                try:
+                    netapplier.apply(batch_state, verify_change=True)
+                    self.state_service.record(*inverse)
+                finally:
+                    self.running_state.invalidate()
 
     def route_state(self, name=''):
         """Return the current routes set according to nmstate.
@@ -798,15 +1553,13 @@ class NmstateNetConfig(os_net_config.NetConfig):
         :returns: list of all interfaces, or those matching name if specified
         """
 
-        routes = netinfo.show_running_config()[
-            NMRoute.KEY][NMRoute.CONFIG]
         if name != "":
-            route = list(x for x in routes if x[
-                NMRoute.NEXT_HOP_INTERFACE] == name)
+            route = self.running_state.routes(name)
             if self.noop:
                 self.__dump_config(route, msg=f"{name}: Present route config")
             return route
         else:
+            routes = self.running_state.routes()
             if self.noop:
                 self.__dump_config(routes, msg="Present route config")
             return routes
@@ -819,8 +1572,7 @@ class NmstateNetConfig(os_net_config.NetConfig):
         :returns: list of all interfaces, or those matching name if specified
         """
 
-        rules = netinfo.show_running_config()[
-            NMRouteRule.KEY][NMRouteRule.CONFIG]
+        rules = self.running_state.rules()
         if self.noop:
             self.__dump_config(rules, msg="Present IP Rules")
         return rules
@@ -881,8 +1633,13 @@ class NmstateNetConfig(os_net_config.NetConfig):
             new_state, msg="Applying the config with nmstate"
         )
         if not self.noop:
+            inverse = None
+            if any(new_state.values()):
+                inverse = self._inverse_state(new_state)
             try:
                 netapplier.apply(new_state, verify_change=verify)
+                if inverse:
+                    self.state_service.record(*inverse)
             except error.NmstateVerificationError as exc:
                 logger.error("**** Verification Error *****")
                 logger.error(
@@ -896,34 +1653,77 @@ class NmstateNetConfig(os_net_config.NetConfig):
                     exc,
                 )
                 self.errors.append(exc)
+            if any(new_state.values()):
+                # The running config is modified (or rolled back by
+                # nmstate on failures), so the snapshot is stale now
+                self.running_state.invalidate()
+
+    def merge_states(self, states):
+        """Merge the desired states into a single desired state
+
+        The interfaces, routes and rules are concatenated in the given
+        order and the DNS of the last state is retained. nmstate removes
+        the absent routes and rules before adding the new ones, so the
+        deletions are still processed ahead of the additions.
+
+        :param states: list of desired states
+        :return merged desired state
+        """
+        merged = {}
+        for state in states:
+            for key, value in state.items():
+                if key == Interface.KEY:
+                    merged.setdefault(key, []).extend(value)
+                elif key == NMRoute.KEY:
+                    routes = merged.setdefault(key, {NMRoute.CONFIG: []})
+                    routes[NMRoute.CONFIG].extend(value[NMRoute.CONFIG])
+                elif key == NMRouteRule.KEY:
+                    rules = merged.setdefault(key, {NMRouteRule.CONFIG: []})
+                    rules[NMRouteRule.CONFIG].extend(
+                        value[NMRouteRule.CONFIG]
+                    )
+                else:
+                    merged[key] = value
+        return merged
+
+    def _apply_phase_state(self, state, pending_states):
+        """Apply the desired state of an apply() phase
+
+        In the single transaction mode, the state is only queued in
+        pending_states and applied later along with the other phases.
+
+        :param state: desired state of the phase
+        :param pending_states: list of states deferred for a single apply
+        """
+        if self.single_transaction:
+            pending_states.append(state)
+        else:
+            self.nmstate_apply(state, verify=True)
 
     def generate_routes(self, interface_name):
         """Generate the route configurations required. Add/Remove routes
 
+        Only the routes that are not present are added and only the present
+        routes that are not desired are removed.
+
         :param interface_name: interface name for which routes are required
         :return: tuple having list of routes to be added and deleted
         """
-        add_routes = self.route_data.get(interface_name, [])
+        desired_routes = self.route_data.get(interface_name, [])
         curr_routes = self.route_state(interface_name)
 
-        del_routes = []
-        clean_routes = False
         self.__dump_config(
             curr_routes, msg=f"{interface_name}: Present route config"
         )
         self.__dump_config(
-            add_routes, msg=f"{interface_name}: Desired route config"
+            desired_routes, msg=f"{interface_name}: Desired route config"
         )
 
-        for c_route in curr_routes:
-            if c_route not in add_routes:
-                clean_routes = True
-                break
-        if clean_routes:
-            for c_route in curr_routes:
-                c_route[NMRoute.STATE] = NMRoute.STATE_ABSENT
-                del_routes.append(c_route)
-                logger.info("Prepare to remove route - %s", c_route)
+        add_routes, del_routes = route_delta(
+            curr_routes, desired_routes, defaulted_keys=ROUTE_DEFAULTED_KEYS)
+        for c_route in del_routes:
+            c_route[NMRoute.STATE] = NMRoute.STATE_ABSENT
+            logger.info("Prepare to remove route - %s", c_route)
         return add_routes, del_routes
 
     def _is_managed_iprules(self, c_rule):
@@ -931,45 +1731,31 @@ class NmstateNetConfig(os_net_config.NetConfig):
 
         :param c_rule: current defined rule
         """
-
-        if os.path.exists(CONFIG_RULES_FILE):
-            mng_iprules = yaml.safe_load(
-                common.get_file_data(CONFIG_RULES_FILE))
-            filtered_c_rule = {
-                key: value for key, value in c_rule.items()
-                if key not in ['family', 'priority']
-            }
-            for iprule in mng_iprules['route-rules']['config']:
-                if filtered_c_rule == iprule:
-                    return True
-            return False
-        else:
-            return False
+        return self.managed_rules.is_managed(c_rule)
 
     def generate_rules(self):
         """Generate the rule configurations required. Add/Remove rules
 
+        Only the rules that are not present are added and only the present
+        rules that are not desired and managed by os-net-config are removed.
+
         :return: tuple having list of rules to be added and deleted
         """
-        add_rules = self.rules_data
+        desired_rules = self.rules_data
         curr_rules = self.rule_state()
         del_rules = []
-        clear_rules = False
 
         self.__dump_config(curr_rules, msg="Present set of ip rules")
 
-        self.__dump_config(add_rules, msg="Desired ip rules")
+        self.__dump_config(desired_rules, msg="Desired ip rules")
 
-        for c_rule in curr_rules:
-            if c_rule not in add_rules:
-                clear_rules = True
-                break
-        if clear_rules:
-            for c_rule in curr_rules:
-                if self._is_managed_iprules(c_rule):
-                    c_rule[NMRouteRule.STATE] = NMRouteRule.STATE_ABSENT
-                    del_rules.append(c_rule)
-                    logger.info("Prepare to remove rule - %s", c_rule)
+        add_rules, stale_rules = route_delta(
+            curr_rules, desired_rules, defaulted_keys=RULE_DEFAULTED_KEYS)
+        for c_rule in stale_rules:
+            if self._is_managed_iprules(c_rule):
+                c_rule[NMRouteRule.STATE] = NMRouteRule.STATE_ABSENT
+                del_rules.append(c_rule)
+                logger.info("Prepare to remove rule - %s", c_rule)
         return add_rules, del_rules
 
     def interface_mac(self, iface):
@@ -1164,8 +1950,10 @@ class NmstateNetConfig(os_net_config.NetConfig):
         absent_state_config = {Interface.KEY: [iface_data]}
         self.__dump_key_config(absent_state_config, msg=f"{name}: Cleaning")
         if not self.noop:
+            inverse = self._inverse_state(absent_state_config)
             try:
                 netapplier.apply(absent_state_config, verify_change=True)
+                self.state_service.record(*inverse)
             except error.NmstateVerificationError as exc:
                 logger.error("**** Verification Error during cleanup *****")
                 logger.error("Exception received: %s", exc)
@@ -1173,6 +1961,7 @@ class NmstateNetConfig(os_net_config.NetConfig):
             except error.NmstateError as exc:
                 logger.error("**** Nmstate Error during cleanup *****")
                 logger.error("Exception received: %s", exc)
+            self.running_state.invalidate()
 
     def _add_common(self, base_opt, ipv6_dispatch_scripts=True):
         """Add common atrributes of the interface
@@ -2314,6 +3103,7 @@ class NmstateNetConfig(os_net_config.NetConfig):
 
                     if member.members:
                         bond_members = [m.name for m in member.members]
+                        self.member_names[member.name] = bond_members
                         bps = self.get_ovs_ports(bridge.name, bond_members)
                         bond_data[OVSBridge.Port.LinkAggregation.PORT_SUBTREE
                                   ] = bps
@@ -2686,6 +3476,7 @@ class NmstateNetConfig(os_net_config.NetConfig):
         )
 
         self.sriov_vf_data[sriov_vf.device][sriov_vf.vfid] = vf_config
+        self.sriov_vf_pfs[sriov_vf.name] = sriov_vf.device
         self.need_vf_config = True
 
     def add_sriov_vf(self, sriov_vf):
@@ -2829,7 +3620,10 @@ class NmstateNetConfig(os_net_config.NetConfig):
             all_iface_names.append(interface_name)
             iface_state = self.iface_state(name=interface_name)
             self.remove_empty_dispatch_scripts(iface_state, iface_data)
-            if not is_dict_subset(iface_state, iface_data):
+            differences = state_differences(iface_state, iface_data)
+            if differences:
+                logger.info("%s: config differs in %s", interface_name,
+                            ', '.join(differences))
                 updated_interfaces[interface_name] = iface_data
             else:
                 logger.info("%s : no change required", interface_name)
@@ -2841,7 +3635,10 @@ class NmstateNetConfig(os_net_config.NetConfig):
             all_iface_names.append(bridge_name)
             bridge_state = self.iface_state(name=bridge_name)
             self.remove_empty_dispatch_scripts(bridge_state, bridge_data)
-            if not is_dict_subset(bridge_state, bridge_data):
+            differences = state_differences(bridge_state, bridge_data)
+            if differences:
+                logger.info("%s: config differs in %s", bridge_name,
+                            ', '.join(differences))
                 updated_interfaces[bridge_name] = bridge_data
             else:
                 logger.info("%s: no change required", bridge_name)
@@ -2854,7 +3651,10 @@ class NmstateNetConfig(os_net_config.NetConfig):
             all_iface_names.append(bond_name)
             bond_state = self.iface_state(name=bond_name)
             self.remove_empty_dispatch_scripts(bond_state, bond_data)
-            if not is_dict_subset(bond_state, bond_data):
+            differences = state_differences(bond_state, bond_data)
+            if differences:
+                logger.info("%s: config differs in %s", bond_name,
+                            ', '.join(differences))
                 updated_interfaces[bond_name] = bond_data
             else:
                 logger.info("%s: no change required", bond_name)
@@ -2866,7 +3666,10 @@ class NmstateNetConfig(os_net_config.NetConfig):
             all_iface_names.append(vlan_name)
             vlan_state = self.iface_state(name=vlan_name)
             self.remove_empty_dispatch_scripts(vlan_state, vlan_data)
-            if not is_dict_subset(vlan_state, vlan_data):
+            differences = state_differences(vlan_state, vlan_data)
+            if differences:
+                logger.info("%s: config differs in %s", vlan_name,
+                            ', '.join(differences))
                 updated_interfaces[vlan_name] = vlan_data
             else:
                 logger.info("%s: no change required", vlan_name)
@@ -2877,18 +3680,21 @@ class NmstateNetConfig(os_net_config.NetConfig):
         if cleanup:
             self.cleanup_all_ifaces(exclude_nics=all_iface_names)
 
+        # Desired states deferred for the single transaction mode
+        pending_states = []
+        rules_applied = []
         if updated_interfaces:
             apply_data = self.set_ifaces(list(updated_interfaces.values()))
             if activate:
-                self.nmstate_apply(apply_data, verify=True)
+                self._apply_phase_state(apply_data, pending_states)
         if del_routes:
             apply_data = self.set_routes(del_routes)
             if activate:
-                self.nmstate_apply(apply_data, verify=True)
+                self._apply_phase_state(apply_data, pending_states)
         if add_routes:
             apply_data = self.set_routes(add_routes)
             if activate:
-                self.nmstate_apply(apply_data, verify=True)
+                self._apply_phase_state(apply_data, pending_states)
 
         if config_rules_dns:
             add_rules, del_rules = self.generate_rules()
@@ -2896,16 +3702,23 @@ class NmstateNetConfig(os_net_config.NetConfig):
             if del_rules:
                 apply_data = self.set_rules(del_rules)
                 if activate:
-                    self.nmstate_apply(apply_data, verify=True)
+                    self._apply_phase_state(apply_data, pending_states)
 
             if add_rules:
-                rules_applied = self.set_rules(add_rules)
+                apply_data = self.set_rules(add_rules)
                 if activate:
-                    self.nmstate_apply(rules_applied, verify=True)
+                    self._apply_phase_state(apply_data, pending_states)
+            # All the desired rules are managed by os-net-config
+            rules_applied = self.rules_data
 
             apply_data = self.set_dns()
             if activate:
-                self.nmstate_apply(apply_data, verify=True)
+                self._apply_phase_state(apply_data, pending_states)
+
+        if pending_states:
+            self.nmstate_apply(
+                self.merge_states(pending_states), verify=True
+            )
 
         if activate:
             if self.errors:
@@ -2916,12 +3729,7 @@ class NmstateNetConfig(os_net_config.NetConfig):
                 self.rollback_to_initial_settings()
                 raise os_net_config.ConfigurationError(message)
 
-            try:
-                if rules_applied:
-                    common.write_yaml_config(CONFIG_RULES_FILE, rules_applied)
-            except NameError:
-                no_rules = self.set_rules(rule_data=[])
-                common.write_yaml_config(CONFIG_RULES_FILE, no_rules)
+            self.managed_rules.save(rules_applied)
 
         self.interface_data = {}
         self.bridge_data = {}
@@ -3294,6 +4102,7 @@ class NmstateNetConfig(os_net_config.NetConfig):
 
             for device in devices_of_type:
                 self._process_device_removal(device)
+        self.commit()
         return ExitCode.SUCCESS
 
     def _process_device_removal(self, device):
@@ -3355,25 +4164,17 @@ class NmstateNetConfig(os_net_config.NetConfig):
         os.makedirs(backup_path, exist_ok=True)
         utils.backup_map_files(backup_path)
 
-        apply_data = self.set_ifaces(self.del_device["ovs_iface"])
-        self.nmstate_apply(apply_data, verify=True)
+        self._remove_ifaces(self.del_device["ovs_iface"])
         self.destroy_dpdk_interfaces()
-        apply_data = self.set_ifaces(self.del_device["vlan"])
-        self.nmstate_apply(apply_data, verify=True)
-        apply_data = self.set_ifaces(self.del_device["iface"])
-        self.nmstate_apply(apply_data, verify=True)
-        apply_data = self.set_ifaces(self.del_device["sriov_vf"])
-        self.nmstate_apply(apply_data, verify=True)
+        self._remove_ifaces(self.del_device["vlan"] +
+                            self.del_device["iface"] +
+                            self.del_device["sriov_vf"] +
+                            self.del_device["ovs_bridge"] +
+                            self.del_device["linux_bridge"] +
+                            self.del_device["linux_bond"])
         for vf in self.del_device["sriov_vf"]:
             utils.remove_entries_for_sriov_dev(vf[Interface.NAME])
-        apply_data = self.set_ifaces(self.del_device["ovs_bridge"])
-        self.nmstate_apply(apply_data, verify=True)
-        apply_data = self.set_ifaces(self.del_device["linux_bridge"])
-        self.nmstate_apply(apply_data, verify=True)
-        apply_data = self.set_ifaces(self.del_device["linux_bond"])
-        self.nmstate_apply(apply_data, verify=True)
-        apply_data = self.set_ifaces(self.del_device["sriov_pf"])
-        self.nmstate_apply(apply_data, verify=True)
+        self._remove_ifaces(self.del_device["sriov_pf"])
         for pf in self.del_device["sriov_pf"]:
             utils.remove_entries_for_sriov_dev(pf[Interface.NAME])
         if self.errors:
@@ -20,17 +20,24 @@
 #
 
 import logging
-import netaddr
-from oslo_utils import strutils
+import re
 
 import os_net_config
 from os_net_config import common
 from os_net_config import utils
 
+netaddr = common.lazy_import('netaddr')
+strutils = common.lazy_import('oslo_utils.strutils')
 
 logger = logging.getLogger(__name__)
 
 _MAPPED_NICS = None
+# The EUI-48 formats accepted by netaddr, checked without importing netaddr
+# so that the interface report stays lightweight
+_MAC_RE = re.compile(
+    r'^(?:[0-9a-f]{1,2}([:-])(?:[0-9a-f]{1,2}\1){4}[0-9a-f]{1,2}'
+    r'|[0-9a-f]{4}([:.])[0-9a-f]{4}\2[0-9a-f]{4}'
+    r'|[0-9a-f]{6}:?[0-9a-f]{6})$', re.IGNORECASE)
 STANDALONE_FAIL_MODE = 'standalone'
 DEFAULT_OVS_BRIDGE_FAIL_MODE = STANDALONE_FAIL_MODE
 DEFAULT_OVS_INTERNAL = True
@@ -144,72 +151,88 @@ def _update_members(json, nic_mapping, persist_mapping):
     return members
 
 
-def mapped_nics(nic_mapping=None):
-    mapping = nic_mapping or {}
-    global _MAPPED_NICS
-    if _MAPPED_NICS:
-        return _MAPPED_NICS
-    _MAPPED_NICS = {}
+def _is_mac(value):
+    return isinstance(value, str) and _MAC_RE.match(value) is not None
 
-    if mapping:
-        # If mapping file provided, nics need not be active
-        available_nics = utils.ordered_available_nics()
-        for nic_alias, nic_mapped in mapping.items():
-
-            if netaddr.valid_mac(nic_mapped):
-                # If 'nic' is actually a mac address, retrieve actual nic name
-                for nic in available_nics:
-                    try:
-                        mac = common.interface_mac(nic)
-                    except IOError:
-                        continue
-                    if nic_mapped == mac:
-                        logger.debug("%s matches device %s", nic_mapped, nic)
-                        nic_mapped = nic
-                        break
-                else:
-                    # The mac could not be found on this system
-                    logger.error(
-                        "mac %s not found in available nics %s",
-                        nic_mapped,
-                        ", ".join(available_nics),
-                    )
-                    continue
 
-            elif nic_mapped not in available_nics:
-                # nic doesn't exist on this system
+def _map_nics(mapping, inventory):
+    # If mapping file provided, nics need not be active
+    available_nics = utils.ordered_available_nics()
+    # Index the available nics by mac address. The nics bound with DPDK
+    # are not in the inventory and their mac address is read from the map.
+    mac_nics = {}
+    for nic in available_nics:
+        mac = inventory.mac(nic)
+        if not mac:
+            try:
+                mac = common.interface_mac(nic)
+            except IOError:
+                continue
+        mac_nics.setdefault(mac, nic)
+
+    for nic_alias, nic_mapped in mapping.items():
+
+        if _is_mac(nic_mapped):
+            # If 'nic' is actually a mac address, retrieve actual nic name
+            if nic_mapped in mac_nics:
+                logger.debug("%s matches device %s", nic_mapped,
+                             mac_nics[nic_mapped])
+                nic_mapped = mac_nics[nic_mapped]
+            else:
+                # The mac could not be found on this system
                 logger.error(
-                    "nic %s not found in available nics %s",
+                    "mac %s not found in available nics %s",
                     nic_mapped,
                     ", ".join(available_nics),
                 )
                 continue
 
-            # Duplicate mappings are not allowed
-            if nic_mapped in _MAPPED_NICS.values():
-                msg = ('interface %s already mapped, '
-                       'check mapping file for duplicates'
-                       % nic_mapped)
-                raise InvalidConfigException(msg)
+        elif nic_mapped not in available_nics:
+            # nic doesn't exist on this system
+            logger.error(
+                "nic %s not found in available nics %s",
+                nic_mapped,
+                ", ".join(available_nics),
+            )
+            continue
 
-            # Using a mapping name that overlaps with a real NIC is not allowed
-            # (However using the name of an inactive NIC as an alias is
-            # permitted).
-            if utils.is_active_nic(nic_alias):
-                msg = ('cannot map %s to alias %s, alias overlaps with active '
-                       'NIC.' % (nic_mapped, nic_alias))
-                raise InvalidConfigException(msg)
-            elif utils.is_real_nic(nic_alias):
-                logger.warning(
-                    "Mapped nic %s overlaps with name of inactive NIC.",
-                    nic_alias,
-                )
+        # Duplicate mappings are not allowed
+        if nic_mapped in _MAPPED_NICS.values():
+            msg = ('interface %s already mapped, '
+                   'check mapping file for duplicates'
+                   % nic_mapped)
+            raise InvalidConfigException(msg)
 
-            _MAPPED_NICS[nic_alias] = nic_mapped
-            logger.info("%s => %s", nic_alias, nic_mapped)
+        # Using a mapping name that overlaps with a real NIC is not allowed
+        # (However using the name of an inactive NIC as an alias is
+        # permitted).
+        if utils.is_active_nic(nic_alias):
+            msg = ('cannot map %s to alias %s, alias overlaps with active '
+                   'NIC.' % (nic_mapped, nic_alias))
+            raise InvalidConfigException(msg)
+        elif utils.is_real_nic(nic_alias):
+            logger.warning(
+                "Mapped nic %s overlaps with name of inactive NIC.",
+                nic_alias,
+            )
+
+        _MAPPED_NICS[nic_alias] = nic_mapped
+        logger.info("%s => %s", nic_alias, nic_mapped)
+
+
+def mapped_nics(nic_mapping=None):
+    mapping = nic_mapping or {}
+    global _MAPPED_NICS
+    if _MAPPED_NICS:
+        return _MAPPED_NICS
+    _MAPPED_NICS = {}
+
+    with utils.nic_inventory() as inventory:
+        if mapping:
+            _map_nics(mapping, inventory)
 
-    # nics not in mapping file must be active in order to be mapped
-    active_nics = utils.ordered_active_nics()
+        # nics not in mapping file must be active in order to be mapped
+        active_nics = utils.ordered_active_nics()
 
     # Add default numbered mappings, but do not overwrite existing entries
     for nic_mapped in set(active_nics).difference(set(_MAPPED_NICS.values())):
@@ -20,7 +20,9 @@ import os
 import yaml
 
 
-from oslo_concurrency import processutils
+from os_net_config import common
+
+processutils = common.lazy_import('oslo_concurrency.processutils')
 
 
 logger = logging.getLogger(__name__)
@@ -22,18 +22,21 @@
 # An entry point os-net-config-sriov is added for invocation of this module.
 
 import argparse
+from concurrent import futures
 import logging
 import os
-import pyudev
 import queue
 import re
 import sys
-import time
+import threading
 
 from json import loads
 from os_net_config import common
 from os_net_config import sriov_bind_config
-from oslo_concurrency import processutils
+
+processutils = common.lazy_import('oslo_concurrency.processutils')
+pyroute2 = common.lazy_import('pyroute2')
+pyudev = common.lazy_import('pyudev')
 
 logger = logging.getLogger(__name__)
 
@@ -51,6 +54,10 @@ MLNX5_VDPA_KMODS = [
 ]
 
 MAX_RETRIES = 10
+# RTEXT_FILTER_VF, requests the VF info of the PF in RTM_GETLINK
+RTEXT_FILTER_VF = 1
+# Values of IFLA_VF_LINK_STATE for the VF states
+VF_LINK_STATES = {'auto': 0, 'enable': 1, 'disable': 2}
 MLNX_LAG_PATH = "/sys/kernel/debug/mlx5/{pf_pci}/lag/state"
 PF_FUNC_RE = re.compile(r"\.(\d+)$", 0)
 
@@ -66,8 +73,47 @@ PORT="$1"
 echo "NUMBER=${PORT##pf*vf}"
 '''
 
-# Create a queue for passing the udev network events
-vf_queue = queue.Queue()
+
+class VfEventQueues(object):
+    """Udev network events of the VFs, demultiplexed by PF
+
+    The VFs of several PFs are created concurrently, so the events are
+    passed to the queue of the PF owning the VF. A PF is registered before
+    its sriov_numvfs is written, the events of the other devices are
+    dropped.
+    """
+
+    def __init__(self):
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def register(self, pf_name):
+        """Return the event queue of the PF, created on the first call"""
+        with self._lock:
+            return self._queues.setdefault(pf_name, queue.Queue())
+
+    def unregister(self, pf_name):
+        with self._lock:
+            self._queues.pop(pf_name, None)
+
+    def put(self, event):
+        """Pass the event to the queues of the PFs of the device"""
+        pf_path = _get_pf_path(event["device"])
+        if not pf_path:
+            logger.debug("%s: Unable to find PF", event["device"])
+            return
+        pf_nics = os.listdir(pf_path)
+        with self._lock:
+            queues = [events for pf_name, events in self._queues.items()
+                      if pf_name in pf_nics]
+        if not queues:
+            logger.debug("%s: No PF waiting for the event", event["device"])
+        for events in queues:
+            events.put(event)
+
+
+# The udev network events, passed to the PFs waiting for VFs
+vf_events = VfEventQueues()
 
 
 # Global variable to store link between pci/pf
@@ -86,7 +132,7 @@ class SRIOVAutoprobeException(ValueError):
 def udev_event_handler(action, device):
     event = {"action": action, "device": device.sys_path}
     logger.info("%s: Received udev event %s", event["device"], event["action"])
-    vf_queue.put(event)
+    vf_events.put(event)
 
 
 def _norm_path(dev, suffix):
@@ -113,6 +159,13 @@ def _driver_unbind(dev):
 
 
 def _wait_for_vf_creation(pf_name, numvfs):
+    try:
+        _wait_for_vf_events(pf_name, numvfs, vf_events.register(pf_name))
+    finally:
+        vf_events.unregister(pf_name)
+
+
+def _wait_for_vf_events(pf_name, numvfs, events):
     vf_count = 0
     pf_config = common.get_sriov_map(pf_name)
     vdpa = False
@@ -121,7 +174,7 @@ def _wait_for_vf_creation(pf_name, numvfs):
     while vf_count < numvfs:
         try:
             # wait for 5 seconds after every udev event
-            event = vf_queue.get(True, 5)
+            event = events.get(True, 5)
             vf_name = os.path.basename(event["device"])
             pf_path = _get_pf_path(event["device"])
             logger.debug("%s: Got udev event - %s", event["device"], event)
@@ -280,6 +333,91 @@ def reset_sriov_pf(pf_name):
     del_udev_rule_for_legacy_sriov_pf(pf_name)
 
 
+def start_numvfs(ifname, numvfs, autoprobe=True):
+    """Write sriov_numvfs for PF, without waiting for the VFs
+
+    The PF is registered for the udev events of its VFs before the write,
+    when the VFs are to be waited for, i.e. with autoprobe.
+
+    :param ifname: interface name (ie: p1p1)
+    :param numvfs: an int that represents the number of VFs to be created.
+    :param autoprobe: the VF drivers are probed, so the VFs are waited for
+    :returns: boolean -- True if the VFs are being created
+    :raises: SRIOVNumvfsException
+    """
+    curr_numvfs = get_numvfs(ifname)
+    logger.debug(f"{ifname}: Interface has {curr_numvfs} configured, "
+                 f"request to set {numvfs}")
+    if not isinstance(numvfs, int):
+        msg = (f"{ifname}: Unable to configure pf with numvfs: {numvfs}\n"
+               f"numvfs must be an integer")
+        raise SRIOVNumvfsException(msg)
+
+    if numvfs == curr_numvfs:
+        return False
+    if curr_numvfs != 0:
+        logger.warning(
+            "%s: not setting numvfs, already configured to %d",
+            ifname, curr_numvfs
+        )
+        return False
+
+    sriov_numvfs_path = common.get_dev_path(ifname, "sriov_numvfs")
+    if autoprobe:
+        vf_events.register(ifname)
+    try:
+        logger.debug(
+            "%s: Setting %s <= %d", ifname, sriov_numvfs_path, numvfs
+        )
+        with open(sriov_numvfs_path, "w") as f:
+            f.write("%d" % numvfs)
+    except IOError as exc:
+        vf_events.unregister(ifname)
+        msg = (f"{ifname} Unable to configure pf with numvfs: {numvfs}\n"
+               f"{exc}")
+        raise SRIOVNumvfsException(msg)
+    return True
+
+
+def check_numvfs(ifname, numvfs):
+    """Check that the sriov_numvfs of PF is set to numvfs
+
+    :returns: int -- the number of current VFs on ifname
+    :raises: SRIOVNumvfsException
+    """
+    curr_numvfs = get_numvfs(ifname)
+    if curr_numvfs != numvfs:
+        msg = (f"{ifname}: Unable to configure pf with numvfs: {numvfs}\n"
+               "sriov_numvfs file is not set to the targeted number of "
+               "vfs")
+        raise SRIOVNumvfsException(msg)
+    return curr_numvfs
+
+
+def wait_for_numvfs(pfs):
+    """Wait for the VFs of the PFs, which are created concurrently
+
+    The waits of the PFs overlap, so the total wait is that of the
+    slowest PF rather than the sum of all of them.
+
+    :param pfs: list of (ifname, numvfs, autoprobe) of the PFs with
+        sriov_numvfs written by start_numvfs()
+    :raises: SRIOVNumvfsException
+    """
+    waits = [(ifname, numvfs) for ifname, numvfs, autoprobe in pfs
+             if autoprobe]
+    if len(waits) > 1:
+        with futures.ThreadPoolExecutor(max_workers=len(waits)) as executor:
+            for job in [executor.submit(_wait_for_vf_creation, *wait)
+                        for wait in waits]:
+                job.result()
+    else:
+        for wait in waits:
+            _wait_for_vf_creation(*wait)
+    for ifname, numvfs, autoprobe in pfs:
+        check_numvfs(ifname, numvfs)
+
+
 def set_numvfs(ifname, numvfs, autoprobe=True):
     """Setting sriov_numvfs for PF
 
@@ -297,43 +435,9 @@ def set_numvfs(ifname, numvfs, autoprobe=True):
     :returns: int -- the number of current VFs on ifname
     :raises: SRIOVNumvfsException
     """
-    curr_numvfs = get_numvfs(ifname)
-    logger.debug(f"{ifname}: Interface has {curr_numvfs} configured, "
-                 f"request to set {numvfs}")
-    if not isinstance(numvfs, int):
-        msg = (f"{ifname}: Unable to configure pf with numvfs: {numvfs}\n"
-               f"numvfs must be an integer")
-        raise SRIOVNumvfsException(msg)
-
-    if numvfs != curr_numvfs:
-        if curr_numvfs != 0:
-            logger.warning(
-                "%s: not setting numvfs, already configured to %d",
-                ifname, curr_numvfs
-            )
-            return curr_numvfs
-
-        sriov_numvfs_path = common.get_dev_path(ifname, "sriov_numvfs")
-        try:
-            logger.debug(
-                "%s: Setting %s <= %d", ifname, sriov_numvfs_path, numvfs
-            )
-            with open(sriov_numvfs_path, "w") as f:
-                f.write("%d" % numvfs)
-        except IOError as exc:
-            msg = (f"{ifname} Unable to configure pf with numvfs: {numvfs}\n"
-                   f"{exc}")
-            raise SRIOVNumvfsException(msg)
-
-        if autoprobe:
-            _wait_for_vf_creation(ifname, numvfs)
-        curr_numvfs = get_numvfs(ifname)
-        if curr_numvfs != numvfs:
-            msg = (f"{ifname}: Unable to configure pf with numvfs: {numvfs}\n"
-                   "sriov_numvfs file is not set to the targeted number of "
-                   "vfs")
-            raise SRIOVNumvfsException(msg)
-    return curr_numvfs
+    if start_numvfs(ifname, numvfs, autoprobe):
+        wait_for_numvfs([(ifname, numvfs, autoprobe)])
+    return get_numvfs(ifname)
 
 
 def restart_ovs_and_pfs_netdevs():
@@ -409,6 +513,8 @@ def configure_sriov_pf(execution_from_cli=False, restart_openvswitch=False):
     dpdk_vfs_pcis_list = []
     vf_lag_sriov_pfs_list = []
     trigger_udev_rule = False
+    configured_pfs = []
+    started_pfs = []
 
     # Cleanup the previous config by puppet-tripleo
     cleanup_puppet_config()
@@ -416,96 +522,118 @@ def configure_sriov_pf(execution_from_cli=False, restart_openvswitch=False):
         common.load_kmods(MLNX5_VDPA_KMODS)
         vdpa_devices = get_vdpa_vhost_devices()
 
-    for item in sriov_map:
-        if item['device_type'] == 'pf':
-            if common.is_pf_attached_to_guest(item['name']):
-                logger.info(
-                    "%s: Attached to guest, skip configuring", item["name"]
-                )
-                continue
-            if pf_configure_status(item):
-                logger.debug("%s: SR-IOV already configured", item["name"])
-                continue
-            _pf_interface_up(item)
-            if item.get('link_mode') == "legacy":
-                # Add a udev rule to configure the VF's when PF's are
-                # released by a guest
-                if not is_partitioned_pf(item['name']):
-                    add_udev_rule_for_legacy_sriov_pf(item['name'],
-                                                      item['numvfs'])
-                # Disable flag for legacy mode
-                configure_tc_offload(item['name'], False)
-            # When configuring vdpa, we need to configure switchdev before
-            # we create the VFs
-            is_mlnx = common.is_mellanox_interface(item['name'])
-            vdpa = item.get('vdpa')
-            # Configure switchdev mode when vdpa
-            # It has to happen before we set_numvfs
-            if vdpa and is_mlnx:
-                configure_switchdev(item['name'])
-            autoprobe = item.get('drivers_autoprobe', True)
-            set_drivers_autoprobe(item['name'], autoprobe)
-            set_numvfs(item['name'], item['numvfs'], autoprobe)
+    # The udev rules are written once, after the rules of all the PFs
+    udev_rules.begin()
+    try:
+        for item in sriov_map:
+            if item['device_type'] == 'pf':
+                if common.is_pf_attached_to_guest(item['name']):
+                    logger.info("%s: Attached to guest, skip configuring",
+                                item["name"])
+                    continue
+                if pf_configure_status(item):
+                    logger.debug("%s: SR-IOV already configured",
+                                 item["name"])
+                    continue
+                _pf_interface_up(item)
+                if item.get('link_mode') == "legacy":
+                    # Add a udev rule to configure the VF's when PF's are
+                    # released by a guest
+                    if not is_partitioned_pf(item['name']):
+                        add_udev_rule_for_legacy_sriov_pf(item['name'],
+                                                          item['numvfs'])
+                    # Disable flag for legacy mode
+                    configure_tc_offload(item['name'], False)
+                # When configuring vdpa, we need to configure switchdev
+                # before we create the VFs
+                is_mlnx = common.is_mellanox_interface(item['name'])
+                vdpa = item.get('vdpa')
+                # Configure switchdev mode when vdpa
+                # It has to happen before we set_numvfs
+                if vdpa and is_mlnx:
+                    configure_switchdev(item['name'])
+                autoprobe = item.get('drivers_autoprobe', True)
+                set_drivers_autoprobe(item['name'], autoprobe)
+                if start_numvfs(item['name'], item['numvfs'], autoprobe):
+                    started_pfs.append((item['name'], item['numvfs'],
+                                        autoprobe))
+                configured_pfs.append((item, is_mlnx))
+
+        # The VFs of all the PFs are created concurrently
+        wait_for_numvfs(started_pfs)
+
+        switchdev_pfs = []
+        for item, is_mlnx in configured_pfs:
             # Configure switchdev, unbind driver and configure vdpa
             if item.get('link_mode') == "switchdev" and is_mlnx:
-                logger.info(f"{item['name']}: Mellanox card")
-                vf_pcis_list = get_vf_pcis_list(item['name'])
-                for vf_pci in vf_pcis_list:
-                    if not vdpa:
-                        # For DPDK, we need to unbind the driver
-                        _driver_unbind(vf_pci)
-                    else:
-                        if vf_pci not in vdpa_devices:
-                            vdpa_queues = item.get('vdpa_queues')
-                            configure_vdpa_vhost_device(vf_pci, vdpa_queues)
-                        else:
-                            logger.info(
-                                "%s: vDPA device already created for %s",
-                                item["name"],
-                                vf_pci,
-                            )
-                if vdpa:
-                    common.restorecon('/dev/vhost-*')
-                logger.info("%s: Adding udev rules", item["name"])
-                # Adding a udev rule to make vf-representors unmanaged by
-                # NetworkManager
-                add_udev_rule_to_unmanage_vf_representors_by_nm()
-
-                # Adding a udev rule to save the sriov_pf name
-                trigger_udev_rule = add_udev_rule_for_sriov_pf(item['name'])\
-                    or trigger_udev_rule
-
-                trigger_udev_rule = add_udev_rule_for_vf_representors(
-                    item['name']) or trigger_udev_rule
+                switchdev_pfs.append(item)
 
+        for item in switchdev_pfs:
+            vdpa = item.get('vdpa')
+            logger.info(f"{item['name']}: Mellanox card")
+            vf_pcis_list = get_vf_pcis_list(item['name'])
+            for vf_pci in vf_pcis_list:
                 if not vdpa:
-                    # This is used for the sriov_bind_config
-                    dpdk_vfs_pcis_list += vf_pcis_list
-
-                    # Configure flow steering mode, default to smfs
-                    configure_flow_steering(item['name'],
-                                            item.get('steering_mode', 'smfs'))
-
-                    # Configure switchdev mode
-                    configure_switchdev(item['name'])
-                    # Add sriovpf to vf_lag_sriov_pfs_list if it's
-                    # a linux bond member (lag_candidate)
-                    if item.get('lag_candidate', False):
-                        vf_lag_sriov_pfs_list.append(item['name'])
-                    # Adding a udev rule to rename vf-representors
+                    # For DPDK, we need to unbind the driver
+                    _driver_unbind(vf_pci)
                 else:
-                    trigger_udev_rule = add_udev_rule_for_vdpa_representors(
-                        item['name']) or trigger_udev_rule
-
-                # Moving the sriov-PFs to switchdev mode will put the netdev
-                # interfaces in down state.
-                # In case we are running during initial deployment,
-                # bring the interfaces up.
-                # In case we are running as part of the sriov_config service
-                # after reboot, net config scripts, which run after
-                # sriov_config service will bring the interfaces up.
-                if execution_from_cli:
-                    if_up_interface(item['name'])
+                    if vf_pci not in vdpa_devices:
+                        vdpa_queues = item.get('vdpa_queues')
+                        configure_vdpa_vhost_device(vf_pci, vdpa_queues)
+                    else:
+                        logger.info(
+                            "%s: vDPA device already created for %s",
+                            item["name"],
+                            vf_pci,
+                        )
+            if vdpa:
+                common.restorecon('/dev/vhost-*')
+            else:
+                # This is used for the sriov_bind_config
+                dpdk_vfs_pcis_list += vf_pcis_list
+            logger.info("%s: Adding udev rules", item["name"])
+            # Adding a udev rule to make vf-representors unmanaged by
+            # NetworkManager
+            add_udev_rule_to_unmanage_vf_representors_by_nm()
+
+            # Adding a udev rule to save the sriov_pf name
+            trigger_udev_rule = add_udev_rule_for_sriov_pf(item['name'])\
+                or trigger_udev_rule
+
+            # Adding a udev rule to rename vf-representors
+            trigger_udev_rule = add_udev_rule_for_vf_representors(
+                item['name']) or trigger_udev_rule
+
+            if vdpa:
+                trigger_udev_rule = add_udev_rule_for_vdpa_representors(
+                    item['name']) or trigger_udev_rule
+    finally:
+        # The rules of all the PFs are written and reloaded once, before
+        # the vf-representors are created by the switchdev mode
+        udev_rules.end()
+
+    for item in switchdev_pfs:
+        if not item.get('vdpa'):
+            # Configure flow steering mode, default to smfs
+            configure_flow_steering(item['name'],
+                                    item.get('steering_mode', 'smfs'))
+
+            # Configure switchdev mode
+            configure_switchdev(item['name'])
+            # Add sriovpf to vf_lag_sriov_pfs_list if it's
+            # a linux bond member (lag_candidate)
+            if item.get('lag_candidate', False):
+                vf_lag_sriov_pfs_list.append(item['name'])
+
+        # Moving the sriov-PFs to switchdev mode will put the netdev
+        # interfaces in down state.
+        # In case we are running during initial deployment,
+        # bring the interfaces up.
+        # In case we are running as part of the sriov_config service
+        # after reboot, net config scripts, which run after
+        # sriov_config service will bring the interfaces up.
+        if execution_from_cli:
+            if_up_interface(item['name'])
 
     if restart_openvswitch:
         restart_ovs_and_pfs_netdevs()
@@ -531,37 +659,41 @@ def configure_sriov_pf(execution_from_cli=False, restart_openvswitch=False):
 def _wait_for_uplink_rep_creation(pf_name):
     uplink_rep_phys_switch_id_path = f"/sys/class/net/{pf_name}/phys_switch_id"
 
-    for i in range(MAX_RETRIES):
-        if common.get_file_data(uplink_rep_phys_switch_id_path):
-            logger.info("%s: Uplink representor ready", pf_name)
-            break
-        time.sleep(1)
-    else:
+    def is_ready():
+        return bool(common.read_sysfs(uplink_rep_phys_switch_id_path))
+
+    target = f"{pf_name} uplink representor"
+    if target not in common.wait_for_sysfs({target: is_ready}, MAX_RETRIES):
         raise RuntimeError("%s: Timeout waiting uplink representor", pf_name)
+    logger.info("%s: Uplink representor ready", pf_name)
 
 
 def _wait_for_lag_creation(lag_sriov_pf_list):
+    targets = {}
     for sriov_pf in lag_sriov_pf_list:
         pf_pci = get_pf_pci(sriov_pf)
         lag_path = MLNX_LAG_PATH.format(pf_pci=pf_pci)
         if os.path.exists(lag_path):
-            for i in range(MAX_RETRIES):
-                lag_state = common.get_file_data(lag_path).strip()
-                if lag_state == "active":
-                    logger.info(
-                        "%s: VF-LAG is enabled after %d retries", sriov_pf, i
-                    )
-                    break
-                time.sleep(1)
-            else:
-                raise RuntimeError("VF-LAG is not created for interface"
-                                   f" {sriov_pf} after {i} retries")
+            targets[sriov_pf] = lambda path=lag_path: \
+                common.read_sysfs(path) == "active"
         else:
             logger.warning(
                 "%s: Lag path %s does not exist for this kernel, skipping..",
                 sriov_pf,
                 lag_path,
             )
+    if not targets:
+        return
+
+    # The VF-LAG of all the PFs are waited for together. The lag state is
+    # in debugfs, which is checked periodically.
+    latencies = common.wait_for_sysfs(targets, MAX_RETRIES)
+    for sriov_pf in targets:
+        if sriov_pf not in latencies:
+            raise RuntimeError("VF-LAG is not created for interface"
+                               f" {sriov_pf} after {MAX_RETRIES} seconds")
+        logger.info("%s: VF-LAG is enabled after %.2f seconds", sriov_pf,
+                    latencies[sriov_pf])
 
 
 def create_rep_link_name_script():
@@ -595,31 +727,8 @@ def del_udev_rule_for_legacy_sriov_pf(pf_name):
 
     If, after ignoring comments, the file is empty, remove the rule file.
     """
-    udev_file = _UDEV_LEGACY_RULE_FILE
     pattern = f'KERNEL=="{pf_name}", RUN+="/bin/os-net-config-sriov -n'
-    if not os.path.exists(udev_file):
-        return
-    file_data = common.get_file_data(udev_file)
-    udev_lines = file_data.splitlines()
-    new_lines = [line for line in udev_lines if pattern not in line]
-    # Ignore comment lines and check if the file is empty
-    non_comment_lines = [
-        line for line in new_lines
-        if line.strip() and not line.strip().startswith("#")
-    ]
-    # Remove the udev file when there are no udev rules.
-    if not non_comment_lines:
-        logger.info("removing %s since there are no udev rules", udev_file)
-        try:
-            os.remove(udev_file)
-        except OSError:
-            logger.warning("failed to remove %s", udev_file)
-            pass
-    else:
-        with open(udev_file, "w") as f:
-            for line in new_lines:
-                f.write(line + "\n")
-    reload_udev_rules()
+    udev_rules.remove(_UDEV_LEGACY_RULE_FILE, pattern)
 
 
 def add_udev_rule_for_vf_representors(pf_name):
@@ -683,36 +792,139 @@ def add_udev_rule_to_unmanage_vf_representors_by_nm():
     return add_udev_rule(udev_data_line, _UDEV_RULE_FILE)
 
 
+class UdevRules(object):
+    """Udev rules files written by os-net-config
+
+    The desired contents of each rules file are rendered in memory from the
+    present contents and the rules added or removed. Outside a transaction,
+    every change is written right away. Within a transaction, the files are
+    written once when the outermost transaction ends. Only the files whose
+    contents changed are written and the udev rules are reloaded once for
+    all of them.
+    """
+
+    def __init__(self):
+        self._depth = 0
+        self._files = {}
+        self._dirty = set()
+
+    def begin(self):
+        self._depth += 1
+
+    def end(self):
+        self._depth -= 1
+        if self._depth == 0:
+            self.flush()
+
+    def _lines(self, udev_file):
+        if udev_file not in self._files:
+            if os.path.exists(udev_file):
+                contents = common.get_file_data(udev_file)
+            else:
+                contents = None
+            lines = contents.splitlines() if contents else []
+            self._files[udev_file] = (contents, lines)
+        return self._files[udev_file][1]
+
+    def add(self, udev_file, udev_data, pattern=None):
+        """Add the rule(s), replacing the present rules matching the pattern
+
+        :param udev_file: path of the rules file
+        :param udev_data: rule or newline separated rules to be added
+        :param pattern: the rules containing the pattern are replaced by
+            udev_data. Each rule in udev_data is its own pattern by default.
+        :returns: True if the contents of the rules file are changed
+        """
+        lines = self._lines(udev_file)
+        changed = False
+        for rule in udev_data.strip().splitlines():
+            rule = rule.strip()
+            if not rule or rule in lines:
+                continue
+            rule_pattern = pattern or rule
+            matches = [i for i, line in enumerate(lines)
+                       if rule_pattern in line]
+            if not lines:
+                lines.append("# This file is autogenerated by os-net-config")
+            if matches:
+                for i in matches:
+                    lines[i] = rule
+            else:
+                lines.append(rule)
+            changed = True
+        if changed:
+            self._changed(udev_file)
+        return changed
+
+    def remove(self, udev_file, pattern):
+        """Remove the rules containing the pattern
+
+        :param udev_file: path of the rules file
+        :param pattern: the rules containing the pattern are removed
+        :returns: True if the contents of the rules file are changed
+        """
+        lines = self._lines(udev_file)
+        new_lines = [line for line in lines if pattern not in line]
+        changed = len(new_lines) != len(lines)
+        lines[:] = new_lines
+        if changed:
+            self._changed(udev_file)
+        return changed
+
+    def _changed(self, udev_file):
+        self._dirty.add(udev_file)
+        if not self._depth:
+            self.flush()
+
+    def _render(self, lines):
+        # The rules file is removed when there are no udev rules
+        if not any(line.strip() and not line.strip().startswith("#")
+                   for line in lines):
+            return None
+        return "".join(line + "\n" for line in lines)
+
+    def flush(self):
+        """Write the changed rules files and reload the udev rules
+
+        :returns: list of the rules files changed
+        """
+        files, self._files = self._files, {}
+        dirty, self._dirty = self._dirty, set()
+        changed = []
+        for udev_file in sorted(dirty):
+            contents, lines = files[udev_file]
+            new_contents = self._render(lines)
+            if new_contents == contents:
+                continue
+            if new_contents is None:
+                if contents is None:
+                    continue
+                logger.info("removing %s since there are no udev rules",
+                            udev_file)
+                try:
+                    os.remove(udev_file)
+                except OSError:
+                    logger.warning("failed to remove %s", udev_file)
+                    continue
+            else:
+                logger.debug("writing udev rules to %s", udev_file)
+                # Readers never see a partially written rules file
+                tmp_file = f"{udev_file}.tmp"
+                with open(tmp_file, "w") as f:
+                    f.write(new_contents)
+                os.replace(tmp_file, udev_file)
+            changed.append(udev_file)
+        if changed:
+            reload_udev_rules()
+        return changed
+
+
+udev_rules = UdevRules()
+
+
 def add_udev_rule(udev_data, udev_file, pattern=None):
     logger.debug("adding udev rule to %s: %s", udev_file, udev_data)
-    trigger_udev_rule = False
-    udev_data = udev_data.strip()
-    if not pattern:
-        pattern = udev_data
-    if not os.path.exists(udev_file):
-        with open(udev_file, "w") as f:
-            data = "# This file is autogenerated by os-net-config\n"\
-                   f"{udev_data}\n"
-            f.write(data)
-    else:
-        file_data = common.get_file_data(udev_file)
-        udev_lines = file_data.splitlines()
-        if pattern in file_data:
-            if udev_data in udev_lines:
-                return trigger_udev_rule
-            with open(udev_file, "w") as f:
-                for line in udev_lines:
-                    if pattern in line:
-                        f.write(udev_data + "\n")
-                    else:
-                        f.write(line + "\n")
-        else:
-            with open(udev_file, "a") as f:
-                f.write(udev_data + "\n")
-
-    reload_udev_rules()
-    trigger_udev_rule = True
-    return trigger_udev_rule
+    return udev_rules.add(udev_file, udev_data, pattern)
 
 
 def reload_udev_rules():
@@ -907,56 +1119,225 @@ def if_up_interface(device):
         raise
 
 
+def _configure_vf_ip_cmds(item):
+    """Configure the VF settings with ip commands, one per setting"""
+    pf_name = item['device']['name']
+    vfid = item['device']['vfid']
+    base_cmd = ('ip', 'link', 'set', 'dev', pf_name, 'vf', str(vfid))
+    if 'macaddr' in item:
+        cmd = base_cmd + ('mac', item['macaddr'])
+        run_ip_config_cmd(*cmd)
+    if 'vlan_id' in item:
+        vlan_cmd = base_cmd + ('vlan', str(item['vlan_id']))
+        if 'qos' in item:
+            vlan_cmd = vlan_cmd + ('qos', str(item['qos']))
+        run_ip_config_cmd(*vlan_cmd)
+    if 'max_tx_rate' in item:
+        cmd = base_cmd + ('max_tx_rate', str(item['max_tx_rate']))
+        run_ip_config_cmd_safe(item['max_tx_rate'] != 0, *cmd)
+    if 'min_tx_rate' in item:
+        cmd = base_cmd + ('min_tx_rate', str(item['min_tx_rate']))
+        run_ip_config_cmd_safe(item['min_tx_rate'] != 0, *cmd)
+    if 'spoofcheck' in item:
+        cmd = base_cmd + ('spoofchk', item['spoofcheck'])
+        run_ip_config_cmd(*cmd)
+    if 'state' in item:
+        cmd = base_cmd + ('state', item['state'])
+        run_ip_config_cmd(*cmd)
+    if 'trust' in item:
+        cmd = base_cmd + ('trust', item['trust'])
+        run_ip_config_cmd(*cmd)
+
+
+def get_vf_info(ipr, pf_index):
+    """Read the settings of all the VFs of a PF in one netlink request
+
+    :param ipr: pyroute2.IPRoute netlink socket
+    :param pf_index: interface index of the PF
+    :returns: dict of the VF settings by VF id, in the pyroute2 VF spec
+        keys, i.e. mac, vlan, qos, min_tx_rate, max_tx_rate, spoofchk,
+        link_state and trust
+    """
+    vfs = {}
+    links = ipr.link('get', index=pf_index, ext_mask=RTEXT_FILTER_VF)
+    vf_list = links[0].get_attr('IFLA_VFINFO_LIST') if links else None
+    if not vf_list:
+        return vfs
+    for vf_info in vf_list.get_attrs('IFLA_VF_INFO'):
+        vf_mac = vf_info.get_attr('IFLA_VF_MAC')
+        if vf_mac is None:
+            continue
+        settings = {'mac': vf_mac['mac'].lower()}
+        vf_vlan = vf_info.get_attr('IFLA_VF_VLAN')
+        if vf_vlan is not None:
+            settings['vlan'] = vf_vlan['vlan']
+            settings['qos'] = vf_vlan['qos']
+        vf_rate = vf_info.get_attr('IFLA_VF_RATE')
+        if vf_rate is not None:
+            settings['min_tx_rate'] = vf_rate['min_tx_rate']
+            settings['max_tx_rate'] = vf_rate['max_tx_rate']
+        for attr, key in (('IFLA_VF_SPOOFCHK', 'spoofchk'),
+                          ('IFLA_VF_LINK_STATE', 'link_state'),
+                          ('IFLA_VF_TRUST', 'trust')):
+            value = vf_info.get_attr(attr)
+            if value is not None:
+                settings[key] = value[key]
+        vfs[vf_mac['vf']] = settings
+    return vfs
+
+
+def vf_netlink_spec(item, current):
+    """Build the pyroute2 VF spec of the settings that need a change
+
+    :param item: the VF entry of the sriov_config.yaml
+    :param current: the present settings of the VF from get_vf_info()
+    :returns: the VF spec for IPRoute.link('set', vf=...), or None if the
+        VF already has the settings
+    """
+    spec = {}
+    if 'macaddr' in item:
+        mac = item['macaddr'].lower()
+        if current.get('mac') != mac:
+            spec['mac'] = mac
+    if 'vlan_id' in item:
+        vlan = {'vlan': int(item['vlan_id']), 'qos': int(item.get('qos', 0))}
+        if (current.get('vlan'), current.get('qos')) != (vlan['vlan'],
+                                                         vlan['qos']):
+            spec['vlan'] = vlan
+    if 'min_tx_rate' in item or 'max_tx_rate' in item:
+        # IFLA_VF_RATE sets both the rates, keep the present one if unset
+        rate = {}
+        for key in ('min_tx_rate', 'max_tx_rate'):
+            rate[key] = int(item.get(key, current.get(key, 0)))
+        if any(current.get(key) != value for key, value in rate.items()):
+            spec['rate'] = rate
+    for key, attr, value in (
+            ('spoofcheck', 'spoofchk', lambda v: int(v == 'on')),
+            ('trust', 'trust', lambda v: int(v == 'on')),
+            ('state', 'link_state', VF_LINK_STATES.get)):
+        if key in item:
+            desired = value(item[key])
+            if desired is not None and current.get(attr) != desired:
+                spec[attr] = desired
+    if not spec:
+        return None
+    spec['vf'] = int(item['device']['vfid'])
+    return spec
+
+
+def configure_vfs_netlink(ipr, pf_name, items):
+    """Configure the VFs of a PF with one RTM_SETLINK per VF
+
+    The VF settings are read back once for the PF, so that the VFs that
+    already have the settings are skipped, and the settings of a VF are
+    sent together. The requests for the VFs use the same netlink socket,
+    but each request waits for its own ack, so that a VF failing with
+    netlink is known and configured with the ip commands instead. The
+    gain is in not forking the ip commands, the requests are not
+    pipelined.
+
+    :param ipr: pyroute2.IPRoute netlink socket
+    :param pf_name: name of the PF
+    :param items: the VF entries of the PF in sriov_config.yaml
+    :returns: the VF entries that could not be configured over netlink
+    """
+    pf_index = ipr.link_lookup(ifname=pf_name)
+    if not pf_index:
+        logger.warning("%s: PF not found for the netlink VF configuration",
+                       pf_name)
+        return list(items)
+    try:
+        vf_info = get_vf_info(ipr, pf_index[0])
+    except pyroute2.NetlinkError as exc:
+        logger.warning("%s: Failed to read the VF info: %s", pf_name, exc)
+        return list(items)
+    failed = []
+    for item in items:
+        vfid = item['device']['vfid']
+        spec = vf_netlink_spec(item, vf_info.get(int(vfid), {}))
+        if spec is None:
+            logger.info("%s: VF %s settings are already configured",
+                        pf_name, vfid)
+            continue
+        logger.info("%s: Configuring VF %s with %s", pf_name, vfid, spec)
+        try:
+            ipr.link('set', index=pf_index[0], vf=spec)
+        except pyroute2.NetlinkError as exc:
+            logger.warning("%s: Failed to configure VF %s over netlink: %s",
+                           pf_name, vfid, exc)
+            failed.append(item)
+    return failed
+
+
 def configure_sriov_vf():
+    """Configure the drivers and the settings of the VFs in the sriov map
+
+    :raises OvsDpdkBindException: if some VFs could not be bound with their
+        driver, once all the VFs are configured
+    """
     sriov_map = common.get_sriov_map()
+    vfs_by_pf = {}
+    overrides = {}
     for item in sriov_map:
-        raise_error = True
         if item['device_type'] == 'vf':
             pf_name = item['device']['name']
             vfid = item['device']['vfid']
-            base_cmd = ('ip', 'link', 'set', 'dev', pf_name, 'vf', str(vfid))
             logger.info(f"{pf_name}: Configuring settings for VF: {vfid} "
                         f"VF name: {item['name']}")
-            raise_error = True
-            if 'driver' in item:
-                common.set_driverctl_override(item['pci_address'],
-                                              item['driver'])
-                common.wait_for_vf_driver_binding(
-                    pf_name,
-                    [vfid],
-                    item['driver']
-                )
-            if 'macaddr' in item:
-                cmd = base_cmd + ('mac', item['macaddr'])
-                run_ip_config_cmd(*cmd)
-            if 'vlan_id' in item:
-                vlan_cmd = base_cmd + ('vlan', str(item['vlan_id']))
-                if 'qos' in item:
-                    vlan_cmd = vlan_cmd + ('qos', str(item['qos']))
-                run_ip_config_cmd(*vlan_cmd)
-            if 'max_tx_rate' in item:
-                cmd = base_cmd + ('max_tx_rate', str(item['max_tx_rate']))
-                if item['max_tx_rate'] == 0:
-                    raise_error = False
-                run_ip_config_cmd_safe(raise_error, *cmd)
-            if 'min_tx_rate' in item:
-                cmd = base_cmd + ('min_tx_rate', str(item['min_tx_rate']))
-                if item['min_tx_rate'] == 0:
-                    raise_error = False
-                run_ip_config_cmd_safe(raise_error, *cmd)
-            if 'spoofcheck' in item:
-                cmd = base_cmd + ('spoofchk', item['spoofcheck'])
-                run_ip_config_cmd(*cmd)
-            if 'state' in item:
-                cmd = base_cmd + ('state', item['state'])
-                run_ip_config_cmd(*cmd)
-            if 'trust' in item:
-                cmd = base_cmd + ('trust', item['trust'])
-                run_ip_config_cmd(*cmd)
+            if item.get('driver'):
+                overrides[item['pci_address']] = item['driver']
+            vfs_by_pf.setdefault(pf_name, []).append(item)
+    if not vfs_by_pf:
+        return
+
+    # The drivers of all the VFs are overridden together and the VFs of
+    # each PF are waited for together. A VF failing to be bound does not
+    # stop the configuration of the other VFs, the failures are reported
+    # once all the VFs are configured.
+    unbound = []
+    if overrides:
+        _, failed_bindings = common.bind_driver_overrides(overrides,
+                                                          save=False)
+        for pf_name, items in vfs_by_pf.items():
+            vfs_by_driver = {}
+            for item in items:
+                if not item.get('driver'):
+                    continue
+                if item['pci_address'] in failed_bindings:
+                    logger.error("%s-%s: Failed to bind the VF %s with %s",
+                                 pf_name, item['device']['vfid'],
+                                 item['name'], item['driver'])
+                    unbound.append(item['name'])
+                    continue
+                vfs_by_driver.setdefault(item['driver'], []).append(
+                    item['device']['vfid'])
+            for driver, vfids in vfs_by_driver.items():
+                common.wait_for_vf_driver_binding(pf_name, vfids, driver)
+
+    # The VF settings are programmed over netlink, without forking the ip
+    # commands. The VFs failing with netlink are configured with the ip
+    # commands, which report the setting that is not supported.
+    failed = []
+    try:
+        with pyroute2.IPRoute() as ipr:
+            for pf_name, items in vfs_by_pf.items():
+                failed.extend(configure_vfs_netlink(ipr, pf_name, items))
+    except (OSError, pyroute2.NetlinkError) as exc:
+        logger.warning("Failed to configure the VFs over netlink: %s", exc)
+        failed = [item for items in vfs_by_pf.values() for item in items]
+    for item in failed:
+        _configure_vf_ip_cmds(item)
+
+    for items in vfs_by_pf.values():
+        for item in items:
             if 'promisc' in item:
                 run_ip_config_cmd('ip', 'link', 'set', 'dev', item['name'],
                                   'promisc', item['promisc'])
 
+    if unbound:
+        msg = f"{', '.join(unbound)}: Failed to bind the VF drivers"
+        raise common.OvsDpdkBindException(msg)
+
 
 def parse_opts(argv):
 
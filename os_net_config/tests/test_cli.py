@@ -15,17 +15,23 @@
 # under the License.
 
 from io import StringIO
+import json
 import os.path
 import random
 import re
+import subprocess
 import sys
+import types
+from unittest import mock
 import yaml
 
 import os_net_config
 from os_net_config import cli
 from os_net_config.cli import ExitCode
 from os_net_config import common
+from os_net_config import objects
 from os_net_config.tests import base
+from os_net_config import utils
 
 
 REALPATH = os.path.dirname(os.path.realpath(__file__))
@@ -47,6 +53,8 @@ class TestCli(base.TestCase):
         super(TestCli, self).setUp()
         rand = str(int(random.random() * 100000))
         common.SRIOV_CONFIG_FILE = '/tmp/sriov_config_' + rand + '.yaml'
+        common.CONFIG_FINGERPRINT_FILE = ('/tmp/config_fingerprint_' + rand +
+                                          '.yaml')
         common._LOG_FILE = '/tmp/' + rand + 'os_net_config.log'
         common.set_noop(False)
         sys.stdout = StringIO()
@@ -75,6 +83,8 @@ class TestCli(base.TestCase):
             os.remove(common._LOG_FILE)
         if os.path.isfile(common.SRIOV_CONFIG_FILE):
             os.remove(common.SRIOV_CONFIG_FILE)
+        if os.path.isfile(common.CONFIG_FINGERPRINT_FILE):
+            os.remove(common.CONFIG_FINGERPRINT_FILE)
 
     def run_cli(self, argstr, exitcodes=(ExitCode.SUCCESS,)):
         for s in [sys.stdout, sys.stderr]:
@@ -599,6 +609,97 @@ class TestCli(base.TestCase):
 
         self.assertEqual(ExitCode.FILES_CHANGED, ret_code)
 
+    def test_config_provider_single_transaction(self):
+        """Test config_provider enables the single transaction mode"""
+
+        class MockProvider(os_net_config.NetConfig):
+            def __init__(self, noop=False, root_dir=''):
+                super(MockProvider, self).__init__(noop, root_dir)
+                self.single_transaction = False
+                self.applied_single_transaction = None
+
+            def add_object(self, obj):
+                pass
+
+            def apply(self, cleanup=False, activate=True,
+                      config_rules_dns=True):
+                self.applied_single_transaction = self.single_transaction
+                return {}
+
+        providers = []
+
+        def mock_load_provider(provider_name, noop, root_dir):
+            providers.append(MockProvider(noop, root_dir))
+            return providers[-1]
+
+        self.stub_out('os_net_config.cli.load_provider', mock_load_provider)
+
+        iface_config = [{"type": "interface", "name": "eth0"}]
+        ret_code = cli.config_provider(
+            "nmstate", "network_config", iface_config,
+            "", False, False, False, single_transaction=True
+        )
+
+        self.assertEqual(ExitCode.SUCCESS, ret_code)
+        self.assertTrue(providers[0].applied_single_transaction)
+
+    def test_config_provider_parse_once(self):
+        """Test config_provider builds again only the VF dependent objects"""
+
+        class MockProvider(os_net_config.NetConfig):
+            def __init__(self, noop=False, root_dir=''):
+                super(MockProvider, self).__init__(noop, root_dir)
+                self.added_objects = []
+
+            def add_object(self, obj):
+                self.added_objects.append(obj.name)
+
+            def apply(self, cleanup=False, activate=True,
+                      config_rules_dns=True):
+                return {}
+
+        provider = MockProvider()
+        self.stub_out('os_net_config.cli.load_provider',
+                      lambda provider_name, noop, root_dir: provider)
+
+        parsed = []
+        object_from_json = objects.object_from_json
+
+        def object_from_json_stub(json):
+            parsed.append(json['name'])
+            if json['name'] == 'vf_iface' and parsed.count('vf_iface') == 1:
+                raise common.SriovVfNotFoundException('VF not created')
+            return object_from_json(json)
+        self.stub_out('os_net_config.objects.object_from_json',
+                      object_from_json_stub)
+
+        iface_config = [{"type": "interface", "name": "eth0"},
+                        {"type": "interface", "name": "vf_iface"},
+                        {"type": "interface", "name": "eth1"}]
+        ret_code = cli.config_provider(
+            "ifcfg", "network_config", iface_config,
+            "", False, False, False
+        )
+
+        self.assertEqual(ExitCode.SUCCESS, ret_code)
+        self.assertEqual(['eth0', 'vf_iface', 'eth1', 'vf_iface'], parsed)
+        self.assertEqual(['eth0', 'vf_iface', 'eth1'],
+                         provider.added_objects)
+
+    def test_parse_opts_single_transaction_flag(self):
+        """Test that --single-transaction flag is parsed correctly"""
+        opts = cli.parse_opts(['os-net-config'])
+        self.assertFalse(opts.single_transaction)
+        opts = cli.parse_opts(['os-net-config', '--single-transaction'])
+        self.assertTrue(opts.single_transaction)
+
+    def test_parse_opts_sriov_concurrency(self):
+        """Test that --sriov-concurrency option is parsed correctly"""
+        opts = cli.parse_opts(['os-net-config'])
+        self.assertIsNone(opts.sriov_concurrency)
+        opts = cli.parse_opts(['os-net-config', '--sriov-concurrency', '8'])
+        self.assertEqual(8, opts.sriov_concurrency)
+
     def test_config_provider_failure(self):
         """Test config_provider function with provider loading failure"""
 
@@ -952,6 +1053,133 @@ class TestCli(base.TestCase):
         if os.path.exists(config_file):
             os.remove(config_file)
 
+    def test_config_provider_flushes_maps(self):
+        applied_maps = []
+
+        class TestProvider(object):
+            def add_object(provider, obj):
+                utils.update_sriov_vf_map('eth1', 2, 'eth1_2')
+
+            def apply(provider, **kwargs):
+                # The provider could run the processes reading the map
+                contents = common.get_file_data(common.SRIOV_CONFIG_FILE)
+                applied_maps.append(yaml.safe_load(contents))
+                return {}
+
+            def commit(provider):
+                pass
+
+        self.stub_out('os_net_config.cli.load_provider',
+                      lambda name, noop, root_dir: TestProvider())
+        ret = cli.config_provider(
+            'ifcfg', 'network_config',
+            [{'type': 'interface', 'name': 'em1'}], '', False, True, False)
+        self.assertEqual(ExitCode.SUCCESS, ret)
+        self.assertEqual([[{'device_type': 'vf', 'name': 'eth1_2',
+                            'min_tx_rate': 0, 'max_tx_rate': 0,
+                            'device': {'name': 'eth1', 'vfid': 2}}]],
+                         applied_maps)
+
+    def test_config_provider_commit(self):
+        commits = []
+
+        class TestProvider(object):
+            def __init__(provider, fail):
+                provider.fail = fail
+
+            def add_object(provider, obj):
+                pass
+
+            def apply(provider, **kwargs):
+                if provider.fail:
+                    raise os_net_config.ConfigurationError('apply failed')
+                return {}
+
+            def commit(provider):
+                commits.append(provider.fail)
+
+        iface_config = [{'type': 'interface', 'name': 'em1'}]
+        # The minimum_config succeeds and is committed, so that the failed
+        # network_config rolls back only its own changes
+        self.stub_out('os_net_config.cli.load_provider',
+                      lambda name, noop, root_dir: TestProvider(False))
+        ret = cli.config_provider('nmstate', 'minimum_config', iface_config,
+                                  '', False, False, False)
+        self.assertEqual(ExitCode.SUCCESS, ret)
+        self.stub_out('os_net_config.cli.load_provider',
+                      lambda name, noop, root_dir: TestProvider(True))
+        ret = cli.config_provider('nmstate', 'network_config', iface_config,
+                                  '', False, False, False)
+        self.assertEqual(ExitCode.ERROR, ret)
+        self.assertEqual([False], commits)
+
+    def test_commit_run(self):
+        commits = []
+        impl_nmstate = types.SimpleNamespace(
+            commit_run=lambda: commits.append(1))
+
+        # The providers keeping no journal are not loaded
+        with mock.patch.dict(sys.modules):
+            sys.modules.pop('os_net_config.impl_nmstate', None)
+            cli.commit_run()
+        with mock.patch.dict(sys.modules, {
+                'os_net_config.impl_nmstate': impl_nmstate}):
+            cli.commit_run()
+        self.assertEqual([1], commits)
+
+    def test_config_file_parsed_once(self):
+        config_data = {
+            'network_config': [{'type': 'interface', 'name': 'eth0'}],
+            'minimum_config': [{'type': 'interface', 'name': 'eth1'}],
+        }
+        config_file = '/tmp/test_config_parsed_once.yaml'
+        with open(config_file, 'w') as f:
+            yaml.dump(config_data, f)
+        self.addCleanup(os.remove, config_file)
+        loads = []
+        orig_load = yaml.load
+
+        def load_stub(stream, Loader):
+            loads.append(Loader)
+            return orig_load(stream, Loader=Loader)
+        self.stub_out('yaml.load', load_stub)
+
+        config = cli.ConfigFile(config_file)
+        network = cli.get_iface_config('network_config', config, {}, False)
+        minimum = cli.get_iface_config('minimum_config', config, {}, False)
+        fallback = cli.get_iface_config('fallback_config', config, {},
+                                        False)
+        self.assertEqual('eth0', network[0]['name'])
+        self.assertEqual('eth1', minimum[0]['name'])
+        self.assertEqual([], fallback)
+        self.assertEqual([cli._YAML_LOADER], loads)
+
+    def test_validate_sections(self):
+        validated = []
+
+        def mock_validate_config(config):
+            validated.append(config)
+            if config[0].get('name') == 'bad':
+                return ['Validation error']
+            return []
+        self.stub_out('os_net_config.cli.validator.validate_config',
+                      mock_validate_config)
+        sections = {'remove_config': [],
+                    'network_config': [{'name': 'bad'}],
+                    'minimum_config': [{'name': 'good'}],
+                    'fallback_config': [{'name': 'bad'}]}
+
+        # Only warnings without strict validation
+        cli.validate_sections(sections)
+        self.assertEqual(3, len(validated))
+
+        # The errors of all the invalid sections are reported together
+        exc = self.assertRaises(objects.InvalidConfigException,
+                                cli.validate_sections, sections,
+                                strict_validate=True)
+        self.assertIn('network_config:\nValidation error', str(exc))
+        self.assertIn('fallback_config:\nValidation error', str(exc))
+
     def test_remove_config_entry(self):
         # Create a invalid network_config entry to trigger validator message
         cfg = {
@@ -1060,6 +1288,141 @@ class TestCli(base.TestCase):
             if os.path.exists(config_file):
                 os.remove(config_file)
 
+    def test_skip_unchanged_config(self):
+        config_file = '/tmp/test_skip_unchanged_config.yaml'
+        config = {'network_config': [
+            {'type': 'interface', 'name': 'nic1', 'use_dhcp': True}]}
+        with open(config_file, 'w') as f:
+            yaml.dump(config, f)
+        self.addCleanup(os.remove, config_file)
+        config_provider_calls = []
+
+        def stub_config_provider(provider, section, config, *args, **kwargs):
+            config_provider_calls.append(section)
+            return ExitCode.SUCCESS
+        self.stub_out('os_net_config.cli.config_provider',
+                      stub_config_provider)
+        self.stub_out('os_net_config.utils.is_dcb_config_required',
+                      lambda: False)
+        argstr = 'ARG0 --provider=ifcfg -c %s' % config_file
+
+        self.run_cli(argstr)
+        self.assertEqual(1, len(config_provider_calls))
+        self.assertTrue(os.path.isfile(common.CONFIG_FINGERPRINT_FILE))
+
+        # unchanged inputs, the run is skipped
+        self.run_cli(argstr)
+        self.assertEqual(1, len(config_provider_calls))
+
+        # --force does not change the fingerprint but applies the config
+        self.run_cli(argstr + ' --force')
+        self.assertEqual(2, len(config_provider_calls))
+        self.run_cli(argstr)
+        self.assertEqual(2, len(config_provider_calls))
+
+        # a different option is a different fingerprint
+        self.run_cli(argstr + ' --no-activate')
+        self.assertEqual(3, len(config_provider_calls))
+
+        # a link that was up after the last run went down
+        self.run_cli(argstr)
+        self.assertEqual(4, len(config_provider_calls))
+        fingerprint = yaml.safe_load(
+            common.get_file_data(common.CONFIG_FINGERPRINT_FILE))
+        fingerprint['links_up'].append('missing0')
+        common.write_yaml_config(common.CONFIG_FINGERPRINT_FILE, fingerprint)
+        self.run_cli(argstr)
+        self.assertEqual(5, len(config_provider_calls))
+
+        # a change in the config file
+        config['network_config'][0]['mtu'] = 9000
+        with open(config_file, 'w') as f:
+            yaml.dump(config, f)
+        self.run_cli(argstr)
+        self.assertEqual(6, len(config_provider_calls))
+
+        # a failed run leaves no fingerprint behind
+        self.stub_out('os_net_config.cli.config_provider',
+                      lambda *args, **kwargs: ExitCode.ERROR)
+        self.run_cli(argstr + ' --force', exitcodes=(ExitCode.ERROR,))
+        self.assertFalse(os.path.isfile(common.CONFIG_FINGERPRINT_FILE))
+
+        # a remove_config run does not record a fingerprint
+        self.stub_out('os_net_config.cli.config_provider',
+                      stub_config_provider)
+        self.run_cli(argstr)
+        self.assertTrue(os.path.isfile(common.CONFIG_FINGERPRINT_FILE))
+        self.run_cli(argstr + ' --remove-config')
+        self.assertEqual(8, len(config_provider_calls))
+        self.assertFalse(os.path.isfile(common.CONFIG_FINGERPRINT_FILE))
+
+    def test_skip_unchanged_config_maps(self):
+        config_file = '/tmp/test_skip_unchanged_config_maps.yaml'
+        config = {'network_config': [
+            {'type': 'interface', 'name': 'nic1', 'use_dhcp': True}]}
+        with open(config_file, 'w') as f:
+            yaml.dump(config, f)
+        self.addCleanup(os.remove, config_file)
+        config_provider_calls = []
+
+        def stub_config_provider(provider, section, config, *args, **kwargs):
+            config_provider_calls.append(section)
+            return ExitCode.SUCCESS
+        self.stub_out('os_net_config.cli.config_provider',
+                      stub_config_provider)
+        self.stub_out('os_net_config.utils.is_dcb_config_required',
+                      lambda: False)
+        argstr = 'ARG0 --provider=ifcfg -c %s' % config_file
+
+        self.run_cli(argstr)
+        self.assertEqual(1, len(config_provider_calls))
+
+        # a change in the SR-IOV map
+        common.write_yaml_config(common.SRIOV_CONFIG_FILE,
+                                 [{'device_type': 'pf', 'name': 'eth1',
+                                   'numvfs': 5}])
+        self.run_cli(argstr)
+        self.assertEqual(2, len(config_provider_calls))
+        self.run_cli(argstr)
+        self.assertEqual(2, len(config_provider_calls))
+
+        # the config is validated before the run is skipped
+        def validate_sections_stub(sections, strict_validate=False):
+            raise objects.InvalidConfigException('invalid config')
+        self.stub_out('os_net_config.cli.validate_sections',
+                      validate_sections_stub)
+        self.run_cli(argstr + ' --detailed-exit-codes',
+                     exitcodes=(ExitCode.SCHEMA_VALIDATION_FAILED,))
+        self.assertFalse(os.path.isfile(common.CONFIG_FINGERPRINT_FILE))
+
+        # a run raising leaves no fingerprint behind
+        self.stub_out('os_net_config.cli.validate_sections',
+                      lambda sections, strict_validate=False: None)
+        self.run_cli(argstr)
+        self.assertEqual(3, len(config_provider_calls))
+        self.assertTrue(os.path.isfile(common.CONFIG_FINGERPRINT_FILE))
+
+        def is_config_unchanged_stub(fingerprint, inventory):
+            raise OSError('unreadable')
+        self.stub_out('os_net_config.cli.is_config_unchanged',
+                      is_config_unchanged_stub)
+        self.assertRaises(OSError, self.run_cli, argstr)
+        self.assertFalse(os.path.isfile(common.CONFIG_FINGERPRINT_FILE))
+
+    def test_config_fingerprint_version_provider(self):
+        options = {'config_file': '/nonexistent/config.yaml',
+                   'mapping_file': '/nonexistent/mapping.yaml'}
+        with utils.nic_inventory() as inventory:
+            fingerprint = cli.config_fingerprint(options, inventory, 'ifcfg')
+            self.assertEqual(fingerprint, cli.config_fingerprint(
+                options, inventory, 'ifcfg'))
+            self.assertNotEqual(fingerprint, cli.config_fingerprint(
+                options, inventory, 'nmstate'))
+            self.stub_out('os_net_config.version.version_info.release_string',
+                          lambda: '99.0.0')
+            self.assertNotEqual(fingerprint, cli.config_fingerprint(
+                options, inventory, 'ifcfg'))
+
     def test_safe_fallback_no_config(self):
         """Test safe_fallback when no fallback_config is provided."""
         ret = cli.safe_fallback(
@@ -1571,3 +1934,56 @@ class TestCli(base.TestCase):
         finally:
             if os.path.exists(config_file):
                 os.remove(config_file)
+
+
+class TestCliStartup(base.TestCase):
+    """The interface report and --version must start quickly.
+
+    Health checks run `os-net-config -i` frequently, so these paths must
+    not load the modules needed only for applying a configuration.
+    """
+
+    HEAVY_MODULES = ('jsonschema', 'libnmstate', 'netaddr',
+                     'oslo_concurrency', 'oslo_utils', 'pbr',
+                     'pkg_resources', 'pyudev')
+
+    def _loaded_heavy_modules(self, argv, heavy_modules=HEAVY_MODULES):
+        code = ("import json, sys\n"
+                "from os_net_config import cli\n"
+                "try:\n"
+                "    cli.main(%r)\n"
+                "except SystemExit:\n"
+                "    pass\n"
+                "sys.stderr.write(json.dumps(sorted(sys.modules)))\n"
+                % argv)
+        proc = subprocess.run([sys.executable, '-c', code],
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, check=True)
+        modules = json.loads(proc.stderr.decode().splitlines()[-1])
+        return [m for m in modules
+                if m.split('.')[0] in heavy_modules]
+
+    def test_import_is_lightweight(self):
+        self.assertEqual([], self._loaded_heavy_modules(['os-net-config',
+                                                         '-h']))
+
+    def test_interface_report_is_lightweight(self):
+        argv = ['os-net-config', '--noop', '-m', '/nonexistent', '-i']
+        self.assertEqual([], self._loaded_heavy_modules(argv))
+
+    def test_interface_report_mapping_is_lightweight(self):
+        # The mac addresses of the mapping file are checked without netaddr
+        mapping_file = '/tmp/test_interface_report_mapping.yaml'
+        with open(mapping_file, 'w') as f:
+            yaml.dump({'interface_mapping': {'nic1': '12:34:56:de:f0:12',
+                                             'nic2': 'em1'}}, f)
+        self.addCleanup(os.remove, mapping_file)
+        argv = ['os-net-config', '--noop', '-m', mapping_file, '-i']
+        self.assertNotIn('netaddr', self._loaded_heavy_modules(argv))
+
+    def test_version_is_lightweight(self):
+        # pbr is what looks up the version
+        heavy_modules = ('jsonschema', 'libnmstate', 'netaddr',
+                         'oslo_concurrency', 'oslo_utils', 'pyudev')
+        self.assertEqual([], self._loaded_heavy_modules(
+            ['os-net-config', '--version'], heavy_modules))
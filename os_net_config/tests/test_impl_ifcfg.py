@@ -3284,6 +3284,44 @@ class TestIfcfgNetConfigApply(base.TestCase):
         self.assertEqual(1, self.ifup_interface_names.count("em2"))
         self.assertEqual(1, self.ifup_interface_names.count("bond0"))
 
+    def test_restart_levels(self):
+        interface = objects.Interface('em1')
+        interface2 = objects.Interface('em2')
+        bond = objects.OvsBond('bond0', members=[interface, interface2])
+        bridge = objects.OvsBridge('br-ex', members=[bond])
+        self.provider.add_bridge(bridge)
+        self.provider.add_bond(bond)
+        self.provider.add_interface(interface)
+        self.provider.add_interface(interface2)
+        levels = self.provider.restart_levels(
+            ['em3', 'br-ex', 'em1', 'bond0', 'em2', 'em1', 'em4'])
+        self.assertEqual([['em3', 'br-ex', 'em4'], ['em1'], ['bond0'],
+                          ['em2']], levels)
+
+    def test_restart_concurrent(self):
+        def test_execute(*args, **kwargs):
+            if args[0] == '/sbin/ifup':
+                self.ifup_interface_names.append(args[1])
+                if args[1] == 'em2':
+                    raise processutils.ProcessExecutionError('em2 failed')
+            return ('stdout', 'stderr')
+        self.stub_out('oslo_concurrency.processutils.execute', test_execute)
+        interface = objects.Interface('em1')
+        interface2 = objects.Interface('em2')
+        bond = objects.LinuxBond('bond0', members=[interface, interface2])
+        self.provider.add_linux_bond(bond)
+        self.provider.add_interface(interface)
+        self.provider.add_interface(interface2)
+
+        self.provider.restart(self.provider.ifup,
+                              ['bond0', 'em1', 'em2', 'em3'])
+        self.assertEqual(['bond0', 'em3'],
+                         sorted(self.ifup_interface_names[:2]))
+        self.assertEqual(['em1', 'em2'],
+                         sorted(self.ifup_interface_names[2:]))
+        # The failure of a branch does not stop the other branches
+        self.assertEqual(1, len(self.provider.errors))
+
     def test_bond_mode_for_linux_bond(self):
         interface1 = objects.Interface('em1')
         interface2 = objects.Interface('em2')
@@ -14,11 +14,15 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import copy
+from libnmstate.schema import DNS
 from libnmstate.schema import Ethernet
 from libnmstate.schema import Ethtool
-
+from libnmstate.schema import Interface
 from libnmstate.schema import InterfaceType
 from libnmstate.schema import OVSBridge
+from libnmstate.schema import Route as NMRoute
+from libnmstate.schema import RouteRule as NMRouteRule
 import os.path
 import random
 import tempfile
@@ -261,6 +265,7 @@ class TestNmstateNetConfig(base.TestCase):
                       show_running_info_stub)
 
         self.temp_route_table_file = tempfile.NamedTemporaryFile()
+        impl_nmstate.state_service().reset()
         self.provider = impl_nmstate.NmstateNetConfig()
 
         def get_totalvfs_stub(iface_name):
@@ -3556,6 +3561,492 @@ interfaces:
             [],
             self.provider._get_dpdk_port_pci_address('nonexistent'))
 
+    def test_running_state_snapshot(self):
+        query_count = []
+
+        def show_running_info_stub():
+            query_count.append(1)
+            running_info_path = os.path.join(
+                os.path.dirname(__file__),
+                'environment/netinfo_running_info_1.yaml')
+            return self.get_running_info(running_info_path)
+        self.stub_out('libnmstate.netinfo.show_running_config',
+                      show_running_info_stub)
+
+        def apply_stub(state, verify_change=True):
+            return
+        self.stub_out('libnmstate.netapplier.apply', apply_stub)
+
+        self.assertEqual('em1', self.provider.iface_state('em1')['name'])
+        self.assertIsNone(self.provider.iface_state('em1', type='bond'))
+        self.assertIsNone(self.provider.iface_state('nonexistent'))
+        self.assertEqual(
+            ['lo'],
+            [i['name'] for i in self.provider.iface_state(type='loopback')])
+        self.provider.route_state('em1')
+        self.provider.rule_state()
+        self.assertEqual(1, len(query_count))
+
+        # The lookups return copies, the snapshot is not modified through
+        # them
+        em1_state = self.provider.iface_state('em1')
+        self.provider.iface_state('em1')['state'] = 'absent'
+        self.provider.iface_state()[0]['name'] = 'changed'
+        self.provider.route_state('em1').append({})
+        self.assertEqual(em1_state, self.provider.iface_state('em1'))
+        self.assertNotEqual('changed',
+                            self.provider.iface_state()[0]['name'])
+        self.assertEqual(self.provider.route_state('em1'),
+                         self.provider.running_state.routes('em1'))
+        self.assertEqual(1, len(query_count))
+
+        # Nothing is changed by an empty desired state
+        self.provider.nmstate_apply(self.provider.set_ifaces([]))
+        self.provider.iface_state('em1')
+        self.assertEqual(1, len(query_count))
+
+        iface = {'name': 'em1', 'type': 'ethernet', 'state': 'down'}
+        self.provider.nmstate_apply(self.provider.set_ifaces([iface]))
+        self.provider.iface_state('em1')
+        self.provider.iface_state('eno1')
+        self.assertEqual(2, len(query_count))
+
+        # In noop mode the running config is not modified
+        self.provider.noop = True
+        self.provider.nmstate_apply(self.provider.set_ifaces([iface]))
+        self.provider.iface_state('em1')
+        self.assertEqual(2, len(query_count))
+
+    def test_state_service(self):
+        queries = []
+
+        def show_running_info_stub():
+            queries.append(1)
+            return {Interface.KEY: [{Interface.NAME: 'em1',
+                                     Interface.TYPE: 'ethernet',
+                                     Interface.STATE: 'up'}]}
+        self.stub_out('libnmstate.netinfo.show_running_config',
+                      show_running_info_stub)
+        applied = []
+
+        def apply_stub(state, verify_change=True):
+            applied.append(state)
+        self.stub_out('libnmstate.netapplier.apply', apply_stub)
+
+        # The providers do not query the running config when created
+        provider = impl_nmstate.NmstateNetConfig()
+        self.assertEqual([], queries)
+        self.assertIs(self.provider.running_state, provider.running_state)
+
+        # Nothing to roll back before any change
+        provider.rollback_to_initial_settings()
+        self.assertEqual([], applied)
+
+        iface = {Interface.NAME: 'em1', Interface.TYPE: 'ethernet',
+                 Interface.STATE: 'down'}
+        vlan = {Interface.NAME: 'em1.10', Interface.TYPE: 'vlan',
+                Interface.STATE: 'up'}
+        route = {NMRoute.DESTINATION: '198.51.100.0/24',
+                 NMRoute.NEXT_HOP_INTERFACE: 'em1'}
+        provider.iface_state('em1')
+        provider.nmstate_apply(provider.set_ifaces([iface]))
+        # Only the first change of an entry is journaled
+        provider.nmstate_apply(provider.set_ifaces([iface]))
+        provider.nmstate_apply(provider.set_routes([route]))
+        self.assertEqual(1, len(queries))
+        provider.nmstate_apply(provider.set_ifaces([vlan]))
+        self.assertEqual(3, len(provider.state_service.journal))
+
+        # The inverse deltas are replayed in the reverse order
+        applied.clear()
+        provider.rollback_to_initial_settings()
+        expected = {
+            Interface.KEY: [
+                {Interface.NAME: 'em1.10', Interface.STATE: 'absent',
+                 Interface.TYPE: 'vlan'},
+                {Interface.NAME: 'em1', Interface.TYPE: 'ethernet',
+                 Interface.STATE: 'up'}],
+            NMRoute.KEY: {NMRoute.CONFIG: [
+                {NMRoute.DESTINATION: '198.51.100.0/24',
+                 NMRoute.NEXT_HOP_INTERFACE: 'em1',
+                 NMRoute.STATE: NMRoute.STATE_ABSENT}]}}
+        self.assertEqual([expected], applied)
+        self.assertEqual([], provider.state_service.journal)
+
+        # The journal is shared by the next provider
+        fallback_provider = impl_nmstate.NmstateNetConfig()
+        fallback_provider.nmstate_apply(provider.set_ifaces([iface]))
+        self.assertEqual(1, len(provider.state_service.journal))
+
+        # The committed changes are not rolled back
+        fallback_provider.state_service.commit()
+        applied.clear()
+        fallback_provider.rollback_to_initial_settings()
+        self.assertEqual([], applied)
+
+    def test_rollback_scoped_to_provider(self):
+        def show_running_info_stub():
+            return {Interface.KEY: [{Interface.NAME: 'em1',
+                                     Interface.TYPE: 'ethernet',
+                                     Interface.STATE: 'up'},
+                                    {Interface.NAME: 'em2',
+                                     Interface.TYPE: 'ethernet',
+                                     Interface.STATE: 'up'}]}
+        self.stub_out('libnmstate.netinfo.show_running_config',
+                      show_running_info_stub)
+        applied = []
+
+        def apply_stub(state, verify_change=True):
+            applied.append(state)
+        self.stub_out('libnmstate.netapplier.apply', apply_stub)
+
+        # The minimum_config is applied successfully and committed
+        minimum_provider = impl_nmstate.NmstateNetConfig()
+        minimum_provider.nmstate_apply(minimum_provider.set_ifaces(
+            [{Interface.NAME: 'em1', Interface.TYPE: 'ethernet',
+              Interface.STATE: 'down'}]))
+        minimum_provider.commit()
+
+        # The failed network_config rolls back only its own changes
+        network_provider = impl_nmstate.NmstateNetConfig()
+        network_provider.nmstate_apply(network_provider.set_ifaces(
+            [{Interface.NAME: 'em2', Interface.TYPE: 'ethernet',
+              Interface.STATE: 'down'}]))
+        applied.clear()
+        network_provider.rollback_to_initial_settings()
+        self.assertEqual([{Interface.KEY: [{Interface.NAME: 'em2',
+                                            Interface.TYPE: 'ethernet',
+                                            Interface.STATE: 'up'}]}],
+                         applied)
+
+    def test_inverse_state_side_effects(self):
+        def show_running_info_stub():
+            return {
+                Interface.KEY: [
+                    {Interface.NAME: 'bond0', Interface.TYPE: 'bond',
+                     Interface.STATE: 'up',
+                     'link-aggregation': {'port': ['em2']}},
+                    {Interface.NAME: 'em2', Interface.TYPE: 'ethernet',
+                     Interface.STATE: 'up', Interface.CONTROLLER: 'bond0'},
+                    {Interface.NAME: 'bond0.10', Interface.TYPE: 'vlan',
+                     Interface.STATE: 'up',
+                     'vlan': {'base-iface': 'bond0', 'id': 10}},
+                    {Interface.NAME: 'em3', Interface.TYPE: 'ethernet',
+                     Interface.STATE: 'up'}],
+                NMRoute.KEY: {NMRoute.CONFIG: [
+                    {NMRoute.DESTINATION: '198.51.100.0/24',
+                     NMRoute.NEXT_HOP_INTERFACE: 'bond0.10'},
+                    {NMRoute.DESTINATION: '203.0.113.0/24',
+                     NMRoute.NEXT_HOP_INTERFACE: 'em3'}]}}
+        self.stub_out('libnmstate.netinfo.show_running_config',
+                      show_running_info_stub)
+        self.provider.running_state.invalidate()
+
+        # The controller and the VLAN of the bond brought down with its
+        # only port are restored along with their routes
+        inverse, keys = self.provider._inverse_state(
+            {Interface.KEY: [{Interface.NAME: 'em2',
+                              Interface.TYPE: 'ethernet',
+                              Interface.STATE: 'absent'}]})
+        self.assertEqual(['em2', 'bond0', 'bond0.10'],
+                         [iface[Interface.NAME]
+                          for iface in inverse[Interface.KEY]])
+        self.assertEqual(
+            [{NMRoute.DESTINATION: '198.51.100.0/24',
+              NMRoute.NEXT_HOP_INTERFACE: 'bond0.10'}],
+            inverse[NMRoute.KEY][NMRoute.CONFIG])
+
+    def test_sriov_pf_groups(self):
+        self.provider.member_names = {'bond0': ['eno1', 'eno2'],
+                                      'bond1': ['em2', 'em1']}
+        groups = self.provider._sriov_pf_groups(
+            ['eno1', 'em1', 'enp59s0f0np0', 'eno2', 'em2'])
+        self.assertEqual([['enp59s0f0np0'], ['eno1', 'eno2'],
+                          ['em1', 'em2']], groups)
+
+    def test_sriov_pf_groups_vf_bond(self):
+        # The PFs whose VFs are bonded together are grouped
+        self.provider.member_names = {'bond_vf': ['eno1v2', 'eno2v2']}
+        self.provider.sriov_vf_pfs = {'eno1v2': 'eno1', 'eno2v2': 'eno2',
+                                      'em1v0': 'em1'}
+        groups = self.provider._sriov_pf_groups(['eno1', 'em1', 'eno2'])
+        self.assertEqual([['em1'], ['eno1', 'eno2']], groups)
+
+    def test_configure_sriov_pfs(self):
+        self.provider.member_names = {'bond0': ['eno1', 'eno2']}
+        configured = []
+
+        def configure(pf_name):
+            configured.append(pf_name)
+            if pf_name == 'em1':
+                raise OSError('em1 failure')
+            return pf_name != 'em2'
+
+        pf_names = ['eno2', 'em1', 'em2', 'enp59s0f0np0', 'eno1']
+        updated = self.provider._configure_sriov_pfs(pf_names, configure)
+        self.assertEqual(['eno2', 'enp59s0f0np0', 'eno1'], updated)
+        self.assertEqual(sorted(pf_names), sorted(configured))
+        # The PFs sharing a bond are configured one after the other
+        self.assertLess(configured.index('eno2'), configured.index('eno1'))
+        self.assertEqual(1, len(self.provider.errors))
+
+    def test_state_differences(self):
+        present = {
+            Interface.NAME: 'eno1',
+            Interface.TYPE: 'ethernet',
+            Interface.MTU: 1500,
+            Ethernet.CONFIG_SUBTREE: {Ethernet.SRIOV_SUBTREE: {
+                Ethernet.SRIOV.VFS_SUBTREE: [
+                    {Ethernet.SRIOV.VFS.ID: vf_id,
+                     Ethernet.SRIOV.VFS.TRUST: False,
+                     Ethernet.SRIOV.VFS.SPOOF_CHECK: True}
+                    for vf_id in range(4)]}},
+            'ipv4': {'address': [{'ip': '192.0.2.5', 'prefix-length': 24}],
+                     'enabled': True},
+        }
+        desired = copy.deepcopy(present)
+        desired['ipv4']['dhcp'] = False
+        del desired[Ethernet.CONFIG_SUBTREE][Ethernet.SRIOV_SUBTREE][
+            Ethernet.SRIOV.VFS_SUBTREE][0][Ethernet.SRIOV.VFS.SPOOF_CHECK]
+        self.assertEqual([], impl_nmstate.state_differences(present,
+                                                            desired))
+        self.assertTrue(impl_nmstate.is_dict_subset(present, desired))
+
+        desired[Interface.MTU] = 9000
+        desired[Ethernet.CONFIG_SUBTREE][Ethernet.SRIOV_SUBTREE][
+            Ethernet.SRIOV.VFS_SUBTREE][2][Ethernet.SRIOV.VFS.TRUST] = True
+        desired['ipv4']['address'].append({'ip': '192.0.2.6',
+                                           'prefix-length': 24})
+        self.assertEqual(['mtu', 'ethernet.sr-iov.vfs[id=2]',
+                          'ipv4.address[ip=192.0.2.6]'],
+                         impl_nmstate.state_differences(present, desired))
+        self.assertFalse(impl_nmstate.is_dict_subset(present, desired))
+        self.assertEqual(['*'], impl_nmstate.state_differences(None,
+                                                               desired))
+
+    def test_route_delta(self):
+        curr = [{NMRoute.DESTINATION: '10.1.0.0/24', NMRoute.TABLE_ID: 200},
+                {NMRoute.DESTINATION: '2001:db8::/64', NMRoute.METRIC: 10},
+                {NMRoute.DESTINATION: '10.3.0.0/24'}]
+        desired = [{NMRoute.DESTINATION: '10.1.0.0/24',
+                    NMRoute.TABLE_ID: '200'},
+                   {NMRoute.DESTINATION: '2001:DB8::0/64',
+                    NMRoute.METRIC: 10},
+                   {NMRoute.DESTINATION: '10.4.0.0/24'}]
+        add, stale = impl_nmstate.route_delta(curr, desired)
+        self.assertEqual([{NMRoute.DESTINATION: '10.4.0.0/24'}], add)
+        self.assertEqual([{NMRoute.DESTINATION: '10.3.0.0/24'}], stale)
+
+        add, stale = impl_nmstate.route_delta(curr, [])
+        self.assertEqual([], add)
+        self.assertEqual(curr, stale)
+
+    def test_route_delta_defaulted_keys(self):
+        # nmstate reports the metric and table-id of the present routes
+        curr = [{NMRoute.DESTINATION: '10.1.0.0/24',
+                 NMRoute.NEXT_HOP_INTERFACE: 'em1',
+                 NMRoute.METRIC: 0, NMRoute.TABLE_ID: 254},
+                {NMRoute.DESTINATION: '10.2.0.0/24',
+                 NMRoute.NEXT_HOP_INTERFACE: 'em1',
+                 NMRoute.METRIC: 0, NMRoute.TABLE_ID: 254}]
+        desired = [{NMRoute.DESTINATION: '10.1.0.0/24',
+                    NMRoute.NEXT_HOP_INTERFACE: 'em1'},
+                   {NMRoute.DESTINATION: '10.2.0.0/24',
+                    NMRoute.NEXT_HOP_INTERFACE: 'em1',
+                    NMRoute.METRIC: '100'}]
+        add, stale = impl_nmstate.route_delta(
+            curr, desired, impl_nmstate.ROUTE_DEFAULTED_KEYS)
+        self.assertEqual(desired[1:], add)
+        self.assertEqual(curr[1:], stale)
+
+    def test_route_key_numeric_values(self):
+        self.assertEqual(
+            impl_nmstate.route_key({NMRoute.DESTINATION: '10.1.0.0/24',
+                                    NMRoute.NEXT_HOP_INTERFACE: 'em1',
+                                    NMRoute.TABLE_ID: 200}),
+            impl_nmstate.route_key({NMRoute.DESTINATION: '10.1.0.0/24',
+                                    NMRoute.NEXT_HOP_INTERFACE: 'em1',
+                                    NMRoute.TABLE_ID: '200'}))
+        # Only the numeric properties are converted to int
+        self.assertNotEqual(
+            impl_nmstate.route_key({NMRoute.NEXT_HOP_INTERFACE: '100'}),
+            impl_nmstate.route_key({NMRoute.NEXT_HOP_INTERFACE: 100}))
+
+    def test_route_delta_removed_metric(self):
+        # The metric and table-id removed from the config are not defaulted
+        curr = [{NMRoute.DESTINATION: '10.1.0.0/24',
+                 NMRoute.NEXT_HOP_INTERFACE: 'em1',
+                 NMRoute.METRIC: 100, NMRoute.TABLE_ID: 254},
+                {NMRoute.DESTINATION: '10.2.0.0/24',
+                 NMRoute.NEXT_HOP_INTERFACE: 'em1',
+                 NMRoute.METRIC: 0, NMRoute.TABLE_ID: 200}]
+        desired = [{NMRoute.DESTINATION: '10.1.0.0/24',
+                    NMRoute.NEXT_HOP_INTERFACE: 'em1'},
+                   {NMRoute.DESTINATION: '10.2.0.0/24',
+                    NMRoute.NEXT_HOP_INTERFACE: 'em1',
+                    NMRoute.TABLE_ID: 254}]
+        add, stale = impl_nmstate.route_delta(
+            curr, desired, impl_nmstate.ROUTE_DEFAULTED_KEYS)
+        self.assertEqual(desired, add)
+        self.assertEqual(curr, stale)
+
+    def test_route_delta_rules(self):
+        defaulted_keys = impl_nmstate.RULE_DEFAULTED_KEYS
+        curr = [{NMRouteRule.IP_FROM: '192.168.1.0/24',
+                 NMRouteRule.PRIORITY: 100,
+                 NMRouteRule.FAMILY: NMRouteRule.FAMILY_IPV4},
+                {NMRouteRule.IP_TO: '192.168.2.0/24',
+                 NMRouteRule.PRIORITY: 200,
+                 NMRouteRule.FAMILY: NMRouteRule.FAMILY_IPV4},
+                {NMRouteRule.IP_TO: '192.168.3.0/24',
+                 NMRouteRule.PRIORITY: 300,
+                 NMRouteRule.FAMILY: NMRouteRule.FAMILY_IPV4}]
+        removed = {NMRouteRule.IP_TO: '192.168.3.0/24',
+                   NMRouteRule.STATE: NMRouteRule.STATE_ABSENT}
+        desired = [{NMRouteRule.IP_FROM: '192.168.1.0/24'},
+                   {NMRouteRule.IP_TO: '192.168.2.0/24',
+                    NMRouteRule.PRIORITY: 250},
+                   removed]
+        add, stale = impl_nmstate.route_delta(curr, desired, defaulted_keys)
+        self.assertEqual([desired[1], removed], add)
+        self.assertEqual(curr[1:], stale)
+
+    def test_managed_rules(self):
+        rules_file = tempfile.NamedTemporaryFile()
+        self.stub_out('os_net_config.impl_nmstate.CONFIG_RULES_FILE',
+                      rules_file.name)
+        managed = [{NMRouteRule.IP_FROM: '192.168.1.0/24',
+                    NMRouteRule.PRIORITY: 100},
+                   {NMRouteRule.ROUTE_TABLE: 200,
+                    NMRouteRule.FAMILY: NMRouteRule.FAMILY_IPV4}]
+        with open(rules_file.name, 'w') as f:
+            yaml.safe_dump(self.provider.set_rules(managed), f)
+        reads = []
+        get_file_data = common.get_file_data
+
+        def stub_get_file_data(filename):
+            reads.append(filename)
+            return get_file_data(filename)
+        self.stub_out('os_net_config.common.get_file_data',
+                      stub_get_file_data)
+
+        self.assertTrue(self.provider._is_managed_iprules(
+            {NMRouteRule.IP_FROM: '192.168.1.0/24',
+             NMRouteRule.PRIORITY: 100,
+             NMRouteRule.FAMILY: NMRouteRule.FAMILY_IPV4}))
+        self.assertTrue(self.provider._is_managed_iprules(
+            {NMRouteRule.ROUTE_TABLE: 200, NMRouteRule.PRIORITY: 32000,
+             NMRouteRule.FAMILY: NMRouteRule.FAMILY_IPV4}))
+        self.assertFalse(self.provider._is_managed_iprules(
+            {NMRouteRule.IP_FROM: '192.168.1.0/24',
+             NMRouteRule.PRIORITY: 200,
+             NMRouteRule.FAMILY: NMRouteRule.FAMILY_IPV4}))
+        self.assertEqual([rules_file.name], reads)
+
+        common.set_noop(False)
+        self.addCleanup(common.set_noop, True)
+        self.provider.managed_rules.save([])
+        self.assertFalse(self.provider._is_managed_iprules(managed[0]))
+        self.assertEqual(self.provider.set_rules([]),
+                         yaml.safe_load(get_file_data(rules_file.name)))
+
+    def _stub_running_ifaces(self, ifaces):
+        def show_running_config_stub():
+            return {Interface.KEY: ifaces}
+        self.stub_out('libnmstate.netinfo.show_running_config',
+                      show_running_config_stub)
+        self.provider.running_state.invalidate()
+
+    def test_absent_batches(self):
+        self._stub_running_ifaces([
+            {Interface.NAME: 'br-ex', Interface.TYPE: 'ovs-bridge',
+             'bridge': {'port': [{'name': 'bond0'}, {'name': 'br-ex'}]}},
+            {Interface.NAME: 'br-ex', Interface.TYPE: 'ovs-interface',
+             'controller': 'br-ex'},
+            {Interface.NAME: 'bond0', Interface.TYPE: 'bond',
+             'controller': 'br-ex',
+             'link-aggregation': {'port': ['eth1', 'eth2']}},
+            {Interface.NAME: 'eth1', Interface.TYPE: 'ethernet'},
+            {Interface.NAME: 'eth2', Interface.TYPE: 'ethernet',
+             'controller': 'bond0'},
+            {Interface.NAME: 'vlan10', Interface.TYPE: 'vlan',
+             'vlan': {'base-iface': 'bond0', 'id': 10}},
+            {Interface.NAME: 'eth5', Interface.TYPE: 'ethernet'}])
+        absent = [{Interface.NAME: name, Interface.TYPE: iface_type,
+                   Interface.STATE: 'absent'}
+                  for name, iface_type in [('br-ex', 'ovs-bridge'),
+                                           ('bond0', 'bond'),
+                                           ('eth5', 'ethernet'),
+                                           ('vlan10', 'vlan'),
+                                           ('eth1', 'ethernet'),
+                                           ('eth2', 'ethernet')]]
+        batches = self.provider.absent_batches(absent)
+        self.assertEqual([['eth5', 'vlan10', 'eth1', 'eth2'], ['bond0'],
+                          ['br-ex']],
+                         [[iface[Interface.NAME] for iface in batch]
+                          for batch in batches])
+        self.assertEqual([], self.provider.absent_batches([]))
+
+    def test_cleanup_all_ifaces_batched(self):
+        ifaces = [{Interface.NAME: 'lo', Interface.TYPE: 'loopback',
+                   Interface.STATE: 'up'},
+                  {Interface.NAME: 'bond0', Interface.TYPE: 'bond',
+                   Interface.STATE: 'up'}]
+        for index in range(40):
+            ifaces.append({Interface.NAME: f'vlan{index}',
+                           Interface.TYPE: 'vlan', Interface.STATE: 'up',
+                           'vlan': {'base-iface': 'bond0', 'id': index}})
+        self._stub_running_ifaces(ifaces)
+        applied = []
+
+        def apply_stub(state, verify_change=True):
+            applied.append(state)
+        self.stub_out('libnmstate.netapplier.apply', apply_stub)
+
+        self.provider.cleanup_all_ifaces(exclude_nics=[])
+        self.assertEqual(2, len(applied))
+        self.assertEqual(40, len(applied[0][Interface.KEY]))
+        self.assertEqual([{Interface.NAME: 'bond0', Interface.TYPE: 'bond',
+                           Interface.STATE: 'absent'}],
+                         applied[1][Interface.KEY])
+
+    def test_generate_routes(self):
+        curr_routes = [
+            {NMRoute.DESTINATION: '10.1.0.0/24',
+             NMRoute.NEXT_HOP_INTERFACE: 'em1'},
+            {NMRoute.DESTINATION: '10.2.0.0/24',
+             NMRoute.NEXT_HOP_INTERFACE: 'em1'}]
+        self.provider.route_state = lambda name: curr_routes
+        self.provider.route_data['em1'] = [
+            {NMRoute.DESTINATION: '10.2.0.0/24',
+             NMRoute.NEXT_HOP_INTERFACE: 'em1'},
+            {NMRoute.DESTINATION: '10.3.0.0/24',
+             NMRoute.NEXT_HOP_INTERFACE: 'em1'}]
+        add_routes, del_routes = self.provider.generate_routes('em1')
+        self.assertEqual([{NMRoute.DESTINATION: '10.3.0.0/24',
+                           NMRoute.NEXT_HOP_INTERFACE: 'em1'}], add_routes)
+        self.assertEqual([{NMRoute.DESTINATION: '10.1.0.0/24',
+                           NMRoute.NEXT_HOP_INTERFACE: 'em1',
+                           NMRoute.STATE: NMRoute.STATE_ABSENT}], del_routes)
+
+    def test_generate_routes_removed_metric(self):
+        # The route whose metric is dropped from the config is replaced
+        curr_routes = [
+            {NMRoute.DESTINATION: '10.1.0.0/24',
+             NMRoute.NEXT_HOP_INTERFACE: 'em1',
+             NMRoute.METRIC: 100, NMRoute.TABLE_ID: 254}]
+        self.provider.route_state = lambda name: curr_routes
+        self.provider.route_data['em1'] = [
+            {NMRoute.DESTINATION: '10.1.0.0/24',
+             NMRoute.NEXT_HOP_INTERFACE: 'em1'}]
+        add_routes, del_routes = self.provider.generate_routes('em1')
+        self.assertEqual([{NMRoute.DESTINATION: '10.1.0.0/24',
+                           NMRoute.NEXT_HOP_INTERFACE: 'em1'}], add_routes)
+        self.assertEqual([{NMRoute.DESTINATION: '10.1.0.0/24',
+                           NMRoute.NEXT_HOP_INTERFACE: 'em1',
+                           NMRoute.METRIC: 100, NMRoute.TABLE_ID: 254,
+                           NMRoute.STATE: NMRoute.STATE_ABSENT}], del_routes)
+
 
 class TestNmstateNetConfigApply(base.TestCase):
 
@@ -3580,6 +4071,7 @@ class TestNmstateNetConfigApply(base.TestCase):
         self.stub_out('libnmstate.netinfo.show_running_config',
                       show_running_info_stub)
 
+        impl_nmstate.state_service().reset()
         self.provider = impl_nmstate.NmstateNetConfig()
 
         def get_totalvfs_stub(iface_name):
@@ -3608,6 +4100,49 @@ class TestNmstateNetConfigApply(base.TestCase):
                                    Loader=yaml.SafeLoader),
                          updated_files)
 
+    def test_single_transaction(self):
+        applied_states = []
+
+        def apply_stub(iface_data='', verify_change=True):
+            applied_states.append(iface_data)
+        self.stub_out('libnmstate.netapplier.apply', apply_stub)
+
+        self.add_object(_BASE_IFACE_CFG)
+        self.provider.single_transaction = True
+        updated_files = self.provider.apply()
+        self.assertEqual(yaml.load(_BASE_IFACE_CFG_APPLIED,
+                                   Loader=yaml.SafeLoader),
+                         updated_files)
+        self.assertEqual(1, len(applied_states))
+        self.assertEqual(['em1', 'eno2'],
+                         sorted(iface[Interface.NAME] for iface in
+                                applied_states[0][Interface.KEY]))
+        self.assertIn(DNS.KEY, applied_states[0])
+
+    def test_merge_states(self):
+        del_route = {NMRoute.DESTINATION: '10.1.0.0/24',
+                     NMRoute.STATE: NMRoute.STATE_ABSENT}
+        add_route = {NMRoute.DESTINATION: '10.2.0.0/24'}
+        del_rule = {NMRouteRule.PRIORITY: 100,
+                    NMRouteRule.STATE: NMRouteRule.STATE_ABSENT}
+        add_rule = {NMRouteRule.PRIORITY: 200}
+        states = [self.provider.set_ifaces([{Interface.NAME: 'em1'}]),
+                  self.provider.set_routes([del_route]),
+                  self.provider.set_routes([add_route]),
+                  self.provider.set_rules([del_rule]),
+                  self.provider.set_rules([add_rule]),
+                  self.provider.set_dns()]
+        merged = self.provider.merge_states(states)
+        self.assertEqual([{Interface.NAME: 'em1'}], merged[Interface.KEY])
+        self.assertEqual([del_route, add_route],
+                         merged[NMRoute.KEY][NMRoute.CONFIG])
+        self.assertEqual([del_rule, add_rule],
+                         merged[NMRouteRule.KEY][NMRouteRule.CONFIG])
+        self.assertEqual(states[-1][DNS.KEY], merged[DNS.KEY])
+        # The input states are left untouched
+        self.assertEqual([del_route],
+                         states[1][NMRoute.KEY][NMRoute.CONFIG])
+
 
 class TestNmstateNetConfigDeviceRemoval(base.TestCase):
 
@@ -2001,6 +2001,13 @@ class TestNicMapping(base.TestCase):
         expected = {'nic1': 'em2'}
         self.assertEqual(expected, objects.mapped_nics(nic_mapping=mapping))
 
+    def test_is_mac(self):
+        for mac in ('12:34:56:de:f0:12', '12-34-56-DE-F0-12',
+                    '1234.56de.f012', '123456def012', '123456:def012'):
+            self.assertTrue(objects._is_mac(mac), mac)
+        for name in ('em1', 'ens3f0np0', '12:34:56:de:f0', 123456):
+            self.assertFalse(objects._is_mac(name), name)
+
     def test_mapped_nics_no_active(self):
         self._stub_active_nics([])
         expected = {}
@@ -14,6 +14,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import contextlib
 import os
 import os.path
 import random
@@ -242,6 +243,40 @@ class TestSriovConfig(base.TestCase):
         f = open(udev_file.name, 'r')
         self.assertEqual(exp_udev_content, f.read())
 
+    def test_udev_rules_transaction(self):
+        """Test the udev rules written and reloaded once in a transaction
+
+        """
+        self.setUp_udev_stubs()
+
+        exp_udev_content = '# This file is autogenerated by os-net-config\n'\
+            'KERNEL=="p2p1", RUN+="/bin/os-net-config-sriov -n %k:8"\n'\
+            'KERNEL=="p2p3", RUN+="/bin/os-net-config-sriov -n %k:12"\n'
+        udev_content = '# This file is autogenerated by os-net-config\n'\
+            'KERNEL=="p2p1", RUN+="/bin/os-net-config-sriov -n %k:10"\n'\
+            'KERNEL=="p2p2", RUN+="/bin/os-net-config-sriov -n %k:10"\n'
+        with open(sriov_config._UDEV_LEGACY_RULE_FILE, "w") as f:
+            f.write(udev_content)
+
+        self._action_order = []
+        sriov_config.udev_rules.begin()
+        sriov_config.add_udev_rule_for_legacy_sriov_pf("p2p1", 8)
+        sriov_config.add_udev_rule_for_legacy_sriov_pf("p2p3", 12)
+        sriov_config.del_udev_rule_for_legacy_sriov_pf("p2p2")
+        with open(sriov_config._UDEV_LEGACY_RULE_FILE, 'r') as f:
+            self.assertEqual(udev_content, f.read())
+        sriov_config.udev_rules.end()
+        self.assertEqual(['reload_udev_rules'], self._action_order)
+        with open(sriov_config._UDEV_LEGACY_RULE_FILE, 'r') as f:
+            self.assertEqual(exp_udev_content, f.read())
+
+        # The rules file is not written when the contents are unchanged
+        self._action_order = []
+        sriov_config.udev_rules.begin()
+        sriov_config.add_udev_rule_for_legacy_sriov_pf("p2p1", 8)
+        sriov_config.udev_rules.end()
+        self.assertEqual([], self._action_order)
+
     def setUp_pf_stubs(self, vendor_id="0x8086"):
 
         run_cmd = []
@@ -290,6 +325,14 @@ class TestSriovConfig(base.TestCase):
         self.stub_out('os_net_config.sriov_config.set_numvfs',
                       set_numvfs_stub)
 
+        self.start_numvfs = sriov_config.start_numvfs
+
+        def start_numvfs_stub(*args):
+            self._save_action('start_numvfs')
+            return self.start_numvfs(*args)
+        self.stub_out('os_net_config.sriov_config.start_numvfs',
+                      start_numvfs_stub)
+
         def get_pf_pci_stub(name):
             pci_address = {"p2p1": "0000:01:01.0",
                            "p2p2": "0000:01:02.0",
@@ -343,17 +386,16 @@ class TestSriovConfig(base.TestCase):
             'udev_monitor_setup',
             'udev_monitor_start',
             'get_numvfs',
-            'reload_udev_rules',
-            'set_numvfs',
-            'get_numvfs',
-            '_wait_for_vf_creation',
+            'start_numvfs',
             'get_numvfs',
             'get_numvfs',
-            'reload_udev_rules',
-            'set_numvfs',
+            'start_numvfs',
             'get_numvfs',
             '_wait_for_vf_creation',
+            '_wait_for_vf_creation',
             'get_numvfs',
+            'get_numvfs',
+            'reload_udev_rules',
             'udev_monitor_stop',
         ]
 
@@ -390,16 +432,16 @@ class TestSriovConfig(base.TestCase):
             'udev_monitor_setup',
             'udev_monitor_start',
             'get_numvfs',
-            'set_numvfs',
+            'start_numvfs',
             'get_numvfs',
-            '_wait_for_vf_creation',
             'get_numvfs',
-            'get_numvfs',
-            'reload_udev_rules',
-            'set_numvfs',
+            'start_numvfs',
             'get_numvfs',
             '_wait_for_vf_creation',
+            '_wait_for_vf_creation',
+            'get_numvfs',
             'get_numvfs',
+            'reload_udev_rules',
             'udev_monitor_stop',
         ]
 
@@ -440,15 +482,14 @@ class TestSriovConfig(base.TestCase):
             'udev_monitor_setup',
             'udev_monitor_start',
             'get_numvfs',
-            'reload_udev_rules',
-            'set_numvfs',
+            'start_numvfs',
             'get_numvfs',
             'get_numvfs',
+            'start_numvfs',
             'get_numvfs',
-            'reload_udev_rules',
-            'set_numvfs',
             'get_numvfs',
             'get_numvfs',
+            'reload_udev_rules',
             'udev_monitor_stop',
         ]
 
@@ -490,17 +531,16 @@ class TestSriovConfig(base.TestCase):
             'udev_monitor_setup',
             'udev_monitor_start',
             'get_numvfs',
-            'reload_udev_rules',
-            'set_numvfs',
+            'start_numvfs',
             'get_numvfs',
-            '_wait_for_vf_creation',
             'get_numvfs',
-            'get_numvfs',
-            'reload_udev_rules',
-            'set_numvfs',
+            'start_numvfs',
             'get_numvfs',
             '_wait_for_vf_creation',
+            '_wait_for_vf_creation',
+            'get_numvfs',
             'get_numvfs',
+            'reload_udev_rules',
             'udev_monitor_stop',
         ]
 
@@ -540,22 +580,16 @@ class TestSriovConfig(base.TestCase):
             'get_vdpa_vhost_devices',
             'get_numvfs',
             'configure_switchdev',
-            'set_numvfs',
+            'start_numvfs',
             'get_numvfs',
-            '_wait_for_vf_creation',
-            'get_numvfs',
-            'reload_udev_rules',
-            'reload_udev_rules',
-            'reload_udev_rules',
-            'reload_udev_rules',
             'get_numvfs',
             'configure_switchdev',
-            'set_numvfs',
+            'start_numvfs',
             'get_numvfs',
             '_wait_for_vf_creation',
+            '_wait_for_vf_creation',
+            'get_numvfs',
             'get_numvfs',
-            'reload_udev_rules',
-            'reload_udev_rules',
             'reload_udev_rules',
             'trigger_udev_rules',
             'udev_monitor_stop',
@@ -578,6 +612,37 @@ class TestSriovConfig(base.TestCase):
         self.assertEqual(10, sriov_config.get_numvfs('p2p1'))
         self.assertEqual(12, sriov_config.get_numvfs('p2p2'))
 
+    def test_wait_for_lag_creation(self):
+        """Test the VF-LAG of the PFs waited for together"""
+        lag_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lag_dir)
+        self.stub_out('os_net_config.sriov_config.MLNX_LAG_PATH',
+                      os.path.join(lag_dir, '{pf_pci}'))
+        self.stub_out('os_net_config.sriov_config.get_pf_pci',
+                      lambda name: name)
+        for pf_name, state in [('p2p1', 'active\n'), ('p2p2', 'disabled\n')]:
+            with open(os.path.join(lag_dir, pf_name), 'w') as f:
+                f.write(state)
+
+        class TestMonitor(object):
+            def poll(monitor, timeout=None):
+                if timeout == 0:
+                    return None
+                with open(os.path.join(lag_dir, 'p2p2'), 'w') as f:
+                    f.write('active\n')
+                return True
+
+        self.stub_out('os_net_config.common.udev_monitor',
+                      lambda subsystems: contextlib.nullcontext(TestMonitor()))
+        # p3p1 has no lag path and is skipped
+        sriov_config._wait_for_lag_creation(['p2p1', 'p2p2', 'p3p1'])
+
+        with open(os.path.join(lag_dir, 'p2p2'), 'w') as f:
+            f.write('disabled\n')
+        self.stub_out('os_net_config.sriov_config.MAX_RETRIES', 0)
+        self.assertRaises(RuntimeError, sriov_config._wait_for_lag_creation,
+                          ['p2p1', 'p2p2'])
+
     def test_cleanup_puppet_config_deprecation(self):
         """Test the cleanup of puppet-tripleo generated config file.
 
@@ -667,6 +732,41 @@ class TestSriovConfig(base.TestCase):
         self.assertEqual(None, sriov_config.main(['ARG0', '-n', 'p2p1:15']))
         self.assertEqual(10, sriov_config.get_numvfs('p2p1'))
 
+    def test_vf_events_demultiplexed(self):
+        """Test the udev events are passed to the PF of the VF"""
+
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        devices = {}
+        for pf_name, vf_pci in (('p2p1', '0000:01:00.2'),
+                                ('p2p2', '0000:01:01.2')):
+            os.makedirs(os.path.join(tmpdir, vf_pci, 'physfn', 'net',
+                                     pf_name))
+            devices[pf_name] = os.path.join(tmpdir, vf_pci, 'net',
+                                            f'{pf_name}_0')
+            os.makedirs(devices[pf_name])
+        vf_events = sriov_config.VfEventQueues()
+        self.stub_out('os_net_config.sriov_config.vf_events', vf_events)
+        self.stub_out('os_net_config.sriov_config.vf_to_pf', {})
+
+        # The events of the PFs not waiting for VFs are dropped
+        p2p1_events = vf_events.register('p2p1')
+        vf_events.put({'action': 'add', 'device': devices['p2p1']})
+        vf_events.put({'action': 'add', 'device': devices['p2p2']})
+        self.assertEqual(1, p2p1_events.qsize())
+
+        # The VFs of the PFs are waited for together
+        for ifname in ['p2p1', 'p2p2']:
+            self._write_numvfs(ifname, 1)
+        vf_events.register('p2p2')
+        vf_events.put({'action': 'add', 'device': devices['p2p2']})
+        sriov_config.wait_for_numvfs([('p2p1', 1, True), ('p2p2', 1, True)])
+        self.assertEqual(['p2p1_0', 'p2p2_0'],
+                         sorted(sriov_config.vf_to_pf.keys()))
+        self.assertRaises(sriov_config.SRIOVNumvfsException,
+                          sriov_config.wait_for_numvfs,
+                          [('p2p1', 2, False)])
+
     def test_configure_sriov_vf(self):
         """Test configuration of SR-IOV VF settings"""
 
@@ -697,6 +797,100 @@ class TestSriovConfig(base.TestCase):
         for cmd in exp_cmds:
             self.assertIn(cmd, run_cmd)
 
+    def test_configure_sriov_vf_bind_failure(self):
+        """Test the VFs failing to be bound do not stop the other VFs"""
+
+        vf_config = [{"device_type": "vf", "device": {"name": pf_name,
+                      "vfid": 0}, "driver": "vfio-pci", "trust": "on",
+                      "pci_address": pci_address, "name": f"{pf_name}_0"}
+                     for pf_name, pci_address in (('p2p1', '0000:01:00.2'),
+                                                  ('p2p2', '0000:01:01.2'))]
+
+        def bind_driver_overrides_stub(overrides, save=None):
+            return ['0000:01:01.2'], ['0000:01:00.2']
+        self.stub_out('os_net_config.common.bind_driver_overrides',
+                      bind_driver_overrides_stub)
+        waits = []
+
+        def wait_for_vf_driver_binding_stub(pf, vfs, req_driver):
+            waits.append((pf, vfs, req_driver))
+        self.stub_out('os_net_config.common.wait_for_vf_driver_binding',
+                      wait_for_vf_driver_binding_stub)
+        run_cmd = []
+
+        def run_ip_config_cmd_stub(*args, **kwargs):
+            run_cmd.append(' '.join(args))
+        self.stub_out('os_net_config.sriov_config.run_ip_config_cmd',
+                      run_ip_config_cmd_stub)
+
+        common.write_yaml_config(common.SRIOV_CONFIG_FILE, vf_config)
+        self.assertRaisesRegex(common.OvsDpdkBindException, '^p2p1_0: ',
+                               sriov_config.configure_sriov_vf)
+
+        # Only the bound VF is waited for, but all the VFs are configured
+        self.assertEqual([('p2p2', [0], 'vfio-pci')], waits)
+        self.assertIn("ip link set dev p2p1 vf 0 trust on", run_cmd)
+        self.assertIn("ip link set dev p2p2 vf 0 trust on", run_cmd)
+
+    def test_configure_sriov_vf_netlink(self):
+        """Test the netlink configuration of the SR-IOV VF settings"""
+
+        vf_config = [{"device_type": "vf", "device": {"name": "p2p1",
+                      "vfid": vfid}, "vlan_id": 101, "qos": 5,
+                      "macaddr": "AA:BB:CC:DD:EE:0%d" % vfid,
+                      "spoofcheck": "on", "state": "auto", "trust": "on",
+                      "max_tx_rate": 100, "name": "p2p1_%d" % vfid}
+                     for vfid in range(3)]
+        present = {'mac': 'aa:bb:cc:dd:ee:00', 'vlan': 101, 'qos': 5,
+                   'min_tx_rate': 0, 'max_tx_rate': 100, 'spoofchk': 1,
+                   'link_state': 0, 'trust': 1}
+        setlinks = []
+
+        class FakeIPRoute(object):
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def link_lookup(self, ifname):
+                return [5] if ifname == 'p2p1' else []
+
+            def link(self, command, index, vf):
+                if vf['vf'] == 2:
+                    raise sriov_config.pyroute2.NetlinkError(95)
+                setlinks.append((command, index, vf))
+
+        def get_vf_info_stub(ipr, pf_index):
+            return {0: dict(present),
+                    1: dict(present, mac='aa:bb:cc:dd:ee:01', trust=0,
+                            vlan=0)}
+        self.stub_out('os_net_config.sriov_config.pyroute2.IPRoute',
+                      FakeIPRoute)
+        self.stub_out('os_net_config.sriov_config.get_vf_info',
+                      get_vf_info_stub)
+        run_cmd = []
+
+        def run_ip_config_cmd_stub(*args, **kwargs):
+            run_cmd.append(' '.join(args))
+        self.stub_out('os_net_config.sriov_config.run_ip_config_cmd',
+                      run_ip_config_cmd_stub)
+
+        common.write_yaml_config(common.SRIOV_CONFIG_FILE, vf_config)
+        sriov_config.configure_sriov_vf()
+
+        # VF 0 is already configured and VF 1 gets a single request
+        self.assertEqual([('set', 5, {'vf': 1, 'trust': 1,
+                                      'vlan': {'vlan': 101, 'qos': 5}})],
+                         setlinks)
+        # VF 2 falls back to the ip commands
+        self.assertEqual(["ip link set dev p2p1 vf 2 mac AA:BB:CC:DD:EE:02",
+                          "ip link set dev p2p1 vf 2 vlan 101 qos 5",
+                          "ip link set dev p2p1 vf 2 max_tx_rate 100",
+                          "ip link set dev p2p1 vf 2 spoofchk on",
+                          "ip link set dev p2p1 vf 2 state auto",
+                          "ip link set dev p2p1 vf 2 trust on"], run_cmd)
+
     def test_del_udev_rule_for_legacy_sriov_pf_file_not_exists(self):
         # Test when udev file doesn't exist
         sriov_config.del_udev_rule_for_legacy_sriov_pf('eth1')
@@ -14,11 +14,15 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import contextlib
+import logging
 import os
 import os.path
 import random
 import shutil
 import tempfile
+import time
+import types
 from unittest import mock
 import yaml
 
@@ -129,6 +133,39 @@ class TestUtils(base.TestCase):
             os.symlink(drv_dir, drv_link)
         os.symlink(pci_path, dev_link)
 
+    def stub_drivers_probe(self, bind=True):
+        """Bind the probed devices with their driver_override
+
+        The writes to the sysfs files are handled like the kernel does.
+        :param bind: False to fail the probing of the devices
+        :returns: the directory of the saved driver overrides
+        """
+        drv_dir = tempfile.mkdtemp()
+        probe_path = os.path.join(drv_dir, 'drivers_probe')
+        conf_dir = os.path.join(drv_dir, 'driverctl.d')
+        self.stub_out('os_net_config.common._SYS_BUS_PCI_DRIVERS_PROBE',
+                      probe_path)
+        self.stub_out('os_net_config.common.DRIVERCTL_CONF_DIR', conf_dir)
+        write_sysfs = common._write_sysfs
+
+        def write_sysfs_stub(path, value):
+            if path == probe_path:
+                if not bind:
+                    raise OSError("No such device")
+                override_path = common.get_pci_dev_path(value,
+                                                        'driver_override')
+                driver = common.get_file_data(override_path).strip()
+                if driver:
+                    os.makedirs(os.path.join(drv_dir, driver), exist_ok=True)
+                    os.symlink(os.path.join(drv_dir, driver),
+                               common.get_pci_dev_path(value, 'driver'))
+            elif path.endswith('/driver/unbind'):
+                os.remove(os.path.dirname(path))
+            else:
+                write_sysfs(path, value)
+        self.stub_out('os_net_config.common._write_sysfs', write_sysfs_stub)
+        return conf_dir
+
     def test_ordered_active_nics(self):
 
         tmpdir = tempfile.mkdtemp()
@@ -156,6 +193,56 @@ class TestUtils(base.TestCase):
 
         shutil.rmtree(tmpdir)
 
+    def test_nic_inventory(self):
+        net_dir = tempfile.mkdtemp()
+        pci_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, net_dir)
+        self.addCleanup(shutil.rmtree, pci_dir)
+        self.stub_out('os_net_config.common.SYS_CLASS_NET', net_dir)
+        os.makedirs(os.path.join(pci_dir, 'i40e'))
+
+        def add_nic(name, pci_address, address, operstate, vf=False):
+            nic_dir = os.path.join(net_dir, name)
+            pci_path = os.path.join(pci_dir, pci_address)
+            os.makedirs(nic_dir)
+            os.makedirs(pci_path)
+            os.symlink(pci_path, os.path.join(nic_dir, 'device'))
+            os.symlink(os.path.join(pci_dir, 'i40e'),
+                       os.path.join(pci_path, 'driver'))
+            if vf:
+                os.makedirs(os.path.join(pci_path, 'physfn'))
+            for attr, value in [('address', address),
+                                ('operstate', operstate)]:
+                with open(os.path.join(nic_dir, attr), 'w') as f:
+                    f.write(value + '\n')
+            return nic_dir
+
+        em1 = add_nic('em1', '0000:8a:00.0', 'a0:36:9f:00:00:01', 'up')
+        os.makedirs(os.path.join(em1, 'bonding_slave'))
+        with open(os.path.join(em1, 'bonding_slave/perm_hwaddr'), 'w') as f:
+            f.write('a0:36:9f:00:00:0a\n')
+        add_nic('em2', '0000:8a:00.1', 'a0:36:9f:00:00:02', 'down')
+        add_nic('em1v0', '0000:8a:02.0', 'a0:36:9f:00:00:03', 'up', vf=True)
+        os.makedirs(os.path.join(net_dir, 'lo'))
+
+        inventory = utils.NicInventory()
+        self.assertEqual(['em1', 'em1v0', 'em2', 'lo'], inventory.names())
+        self.assertEqual('em1', inventory.find_by_mac('a0:36:9f:00:00:0a'))
+        self.assertEqual('em2', inventory.find_by_pci('0000:8a:00.1'))
+        self.assertEqual('a0:36:9f:00:00:0a', inventory.mac('em1'))
+        em1v0 = inventory.get('em1v0')
+        self.assertTrue(em1v0['is_vf'])
+        self.assertEqual('i40e', em1v0['driver'])
+        self.assertEqual('0000:8a:02.0', em1v0['pci_address'])
+
+        self.assertEqual(['em1'], utils.ordered_active_nics())
+        self.assertEqual(['em1', 'em2'], utils.ordered_available_nics())
+        with utils.nic_inventory():
+            self.assertTrue(utils.is_active_nic('em1'))
+            self.assertFalse(utils.is_active_nic('em2'))
+            self.assertTrue(utils.is_real_nic('em2'))
+            self.assertFalse(utils.is_real_nic('em3'))
+
     def test_is_pf_attached_to_guest(self):
         def stub_get_sriov_pci_address(iface):
             return "0000:8a:00.1"
@@ -428,6 +515,49 @@ class TestUtils(base.TestCase):
                               'device': {"name": "eth1", "vfid": 2}}]
         self.assertListEqual(test_sriov_vf_map, sriov_vf_map)
 
+    def test_sriov_map_transaction(self):
+        def get_numvfs_stub(pf_name):
+            return 10
+        self.stub_out('os_net_config.sriov_config.get_numvfs',
+                      get_numvfs_stub)
+        utils.update_sriov_pf_map('eth1', 10, False)
+        read_files = []
+        get_file_data = common.get_file_data
+
+        def get_file_data_stub(filename):
+            read_files.append(filename)
+            return get_file_data(filename)
+        self.stub_out('os_net_config.common.get_file_data',
+                      get_file_data_stub)
+
+        with common.map_transaction():
+            for vfid in range(4):
+                utils.update_sriov_vf_map('eth1', vfid, f'eth1_{vfid}',
+                                          pci_address=f'0000:8a:02.{vfid}')
+            utils.update_sriov_vf_map('eth1', 2, 'eth1_2', vlan_id=10)
+            self.assertEqual('eth1_3', utils._get_vf_name_from_map('eth1', 3))
+            self.assertEqual(
+                'eth1_1',
+                utils.get_sriov_dev_from_pci_address('0000:8a:02.1')['name'])
+            # The map is not written until the end of the transaction
+            contents = get_file_data(common.SRIOV_CONFIG_FILE)
+            self.assertEqual(1, len(yaml.safe_load(contents)))
+
+        self.assertEqual([common.SRIOV_CONFIG_FILE], read_files)
+        sriov_map = common.get_sriov_map()
+        self.assertEqual(5, len(sriov_map))
+        self.assertEqual(10, sriov_map[3]['vlan_id'])
+
+    def test_sriov_map_transaction_remove(self):
+        utils.update_sriov_vf_map('eth1', 2, 'eth1_2')
+        self.stub_out('os_net_config.utils.disable_sriov_config_service',
+                      lambda: None)
+        with common.map_transaction():
+            utils.remove_entries_for_sriov_dev('eth1_2')
+            self.assertTrue(os.path.exists(common.SRIOV_CONFIG_FILE))
+            self.assertIsNone(utils._get_vf_name_from_map('eth1', 2))
+        self.assertFalse(os.path.exists(common.SRIOV_CONFIG_FILE))
+
     def test_udev_rule_for_sriov_vf(self):
         def get_numvfs_stub(pf_name):
             return 10
@@ -536,6 +666,7 @@ class TestUtils(base.TestCase):
     def test_get_vf_devname_net_dir_not_found(self):
         tmpdir = tempfile.mkdtemp()
         self.stub_out('os_net_config.common.SYS_CLASS_NET', tmpdir)
+        self.stub_out('os_net_config.common.VF_BINDING_TIMEOUT', 0)
 
         self.assertRaises(common.SriovVfNotFoundException,
                           utils.get_vf_devname, "eth1", 1)
@@ -559,6 +690,7 @@ class TestUtils(base.TestCase):
     def test_get_vf_devname_vf_dir_not_found(self):
         tmpdir = tempfile.mkdtemp()
         self.stub_out('os_net_config.common.SYS_CLASS_NET', tmpdir)
+        self.stub_out('os_net_config.common.VF_BINDING_TIMEOUT', 0)
 
         def test_get_vf_name_from_map(pf_name, vfid):
             return None
@@ -583,6 +715,170 @@ class TestUtils(base.TestCase):
         self.assertEqual(utils.get_vf_devname("eth1", 1), "eth1_1")
         shutil.rmtree(tmpdir)
 
+    def prepare_vf_sysfs(self, pf, vfs):
+        net_dir = tempfile.mkdtemp()
+        pci_dir = tempfile.mkdtemp()
+        self.stub_out('os_net_config.common.SYS_CLASS_NET', net_dir)
+        self.stub_out('os_net_config.common._SYS_BUS_PCI_DEV', pci_dir)
+        self.addCleanup(shutil.rmtree, net_dir)
+        self.addCleanup(shutil.rmtree, pci_dir)
+        os.makedirs(os.path.join(net_dir, pf, 'device'))
+        for vf in vfs:
+            pci_path = os.path.join(pci_dir, f'0000:8a:02.{vf}')
+            os.makedirs(pci_path)
+            os.symlink(pci_path,
+                       os.path.join(net_dir, pf, f'device/virtfn{vf}'))
+
+    def bind_vf(self, pf, vf, driver):
+        pci_path = os.path.join(common._SYS_BUS_PCI_DEV, f'0000:8a:02.{vf}')
+        drv_dir = os.path.join(common._SYS_BUS_PCI_DEV, driver)
+        os.makedirs(drv_dir, exist_ok=True)
+        os.symlink(drv_dir, os.path.join(pci_path, 'driver'))
+        if driver != 'vfio-pci':
+            os.makedirs(os.path.join(pci_path, f'net/{pf}v{vf}'))
+
+    def test_wait_for_vf_driver_binding_on_events(self):
+        self.prepare_vf_sysfs('eth1', [0, 1, 2])
+        self.bind_vf('eth1', 0, 'iavf')
+        events = []
+
+        timeouts = []
+
+        class TestMonitor(object):
+            def poll(monitor, timeout=None):
+                if timeout == 0 or len(events) == 2:
+                    return None
+                timeouts.append(timeout)
+                # Every event binds the next VF
+                vf = len(events) + 1
+                events.append(vf)
+                self.bind_vf('eth1', vf, 'iavf')
+                return vf
+
+        self.stub_out('os_net_config.common.udev_monitor',
+                      lambda subsystems: contextlib.nullcontext(TestMonitor()))
+        common.wait_for_vf_driver_binding('eth1', [0, 1, 2], 'iavf')
+        self.assertEqual([1, 2], events)
+        # The VFs are checked again periodically, even without events
+        self.assertTrue(all(timeout <= common.SYSFS_POLL_INTERVAL
+                            for timeout in timeouts))
+
+    def test_wait_for_vf_driver_binding_deadline(self):
+        self.prepare_vf_sysfs('eth1', [0, 1, 2])
+        self.stub_out('os_net_config.common.SYSFS_POLL_INTERVAL', 0.01)
+        self.stub_out('os_net_config.common.VF_BINDING_TIMEOUT', 0.2)
+        self.stub_out('os_net_config.common.udev_monitor',
+                      lambda subsystems: contextlib.nullcontext())
+        start = time.monotonic()
+        bound = []
+
+        def is_vf_bound(pf, vf, pci_address, req_driver):
+            # The VFs get bound 0.15 seconds apart
+            if time.monotonic() - start >= 0.15 * vf:
+                bound.append(vf)
+                return True
+            return False
+
+        self.stub_out('os_net_config.common._is_vf_bound', is_vf_bound)
+        common.wait_for_vf_driver_binding('eth1', [0, 1, 2], 'vfio-pci')
+        # The binding of a VF does not extend the wait for the others
+        self.assertEqual([0, 1], bound)
+
+    def test_wait_for_vf_driver_binding_timeout(self):
+        self.prepare_vf_sysfs('eth1', [0, 1])
+        self.bind_vf('eth1', 0, 'vfio-pci')
+        self.stub_out('os_net_config.common.VF_BINDING_TIMEOUT', 0)
+
+        class TestMonitor(object):
+            def poll(monitor, timeout=None):
+                raise AssertionError('No event is expected')
+
+        self.stub_out('os_net_config.common.udev_monitor',
+                      lambda subsystems: contextlib.nullcontext(TestMonitor()))
+        common.wait_for_vf_driver_binding('eth1', [0, 1], 'vfio-pci')
+
+    def test_udev_monitor_closed(self):
+        released = []
+
+        class TestMonitor(object):
+            def filter_by(monitor, subsystem):
+                monitor.subsystems.append(subsystem)
+
+            def start(monitor):
+                pass
+
+            def poll(monitor, timeout=None):
+                return None
+
+            def __del__(monitor):
+                released.append(monitor.subsystems)
+
+        def from_netlink(context):
+            monitor = TestMonitor()
+            monitor.subsystems = []
+            return monitor
+
+        pyudev = types.SimpleNamespace(
+            Context=lambda: None,
+            Monitor=types.SimpleNamespace(from_netlink=from_netlink))
+        self.stub_out('os_net_config.common.pyudev', pyudev)
+        with common.udev_monitor(['pci', 'net']) as monitor:
+            self.assertIsNone(monitor.poll(timeout=0))
+            self.assertEqual([], released)
+        # The monitor is released on leaving the context
+        self.assertEqual([['pci', 'net']], released)
+
+    def test_udev_monitor_unavailable(self):
+        def from_netlink(context):
+            raise OSError('netlink is not available')
+
+        pyudev = types.SimpleNamespace(
+            Context=lambda: None,
+            Monitor=types.SimpleNamespace(from_netlink=from_netlink))
+        self.stub_out('os_net_config.common.pyudev', pyudev)
+        with common.udev_monitor(['net']) as monitor:
+            self.assertIsNone(monitor)
+
+    def test_wait_for_sysfs_on_events(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        paths = [os.path.join(tmpdir, name) for name in ('a', 'b')]
+        state = {'value': None}
+        events = []
+
+        class TestMonitor(object):
+            def poll(monitor, timeout=None):
+                if timeout == 0:
+                    return None
+                # Every event satisfies the next target
+                events.append(timeout)
+                if len(events) == 1:
+                    os.makedirs(paths[0])
+                elif len(events) == 2:
+                    state['value'] = 'ready'
+                else:
+                    os.makedirs(paths[1])
+                return len(events)
+
+        self.stub_out('os_net_config.common.udev_monitor',
+                      lambda subsystems: contextlib.nullcontext(TestMonitor()))
+        latencies = common.wait_for_sysfs(
+            {'a': paths[0], 'b': paths[1],
+             'c': lambda: state['value'] == 'ready'}, 10)
+        self.assertEqual(['a', 'b', 'c'], sorted(latencies))
+        self.assertEqual(3, len(events))
+        self.assertTrue(all(timeout <= common.SYSFS_POLL_INTERVAL
+                            for timeout in events))
+
+    def test_wait_for_sysfs_timeout(self):
+        self.stub_out('os_net_config.common.SYSFS_POLL_INTERVAL', 0.01)
+        self.stub_out('os_net_config.common.udev_monitor',
+                      lambda subsystems: contextlib.nullcontext())
+
+        latencies = common.wait_for_sysfs({'a': lambda: True,
+                                           'b': lambda: False}, 0.05)
+        self.assertEqual(['a'], list(latencies))
+
     def test_get_pci_address_success(self):
         self.prepare_sysfs("eth1", "0000:8a:00.1", "i40e")
         pci = common.get_pci_address("eth1")
@@ -652,6 +948,7 @@ class TestUtils(base.TestCase):
         def test_get_dpdk_pci_address(name):
             return '0000:85:00.1'
         self.prepare_sysfs("nic2", "0000:8a:00.1", "i40e")
+        self.stub_drivers_probe()
         self.stub_out('oslo_concurrency.processutils.execute', test_execute)
         self.stub_out('os_net_config.common._get_dpdk_mac_address',
                       test_get_dpdk_mac_address)
@@ -699,6 +996,7 @@ class TestUtils(base.TestCase):
         os.makedirs(pci_path)
         os.makedirs(drv_dir)
         os.symlink(drv_dir, drv_link)
+        self.stub_drivers_probe()
         self.stub_out('os_net_config.common.get_dpdk_map', test_get_dpdk_map)
         self.stub_out('oslo_concurrency.processutils.execute', test_execute)
         self.stub_out('os_net_config.common._get_dpdk_mac_address',
@@ -1549,6 +1847,40 @@ dpdk {
         result = utils.get_interface_maxmtu("eth0")
         self.assertEqual(-1, result)
 
+    def test_link_info_cache(self):
+        """Test the link attributes are fetched once within the cache"""
+        commands = []
+
+        def test_execute(*cmd, **kwargs):
+            commands.append(cmd)
+            json_output = ('[{"ifname": "eth0", "max_mtu": 9000,'
+                           ' "address": "00:11:22:33:44:55",'
+                           ' "operstate": "UP"},'
+                           ' {"ifname": "bond0", "max_mtu": 65535,'
+                           ' "operstate": "DOWN",'
+                           ' "linkinfo": {"info_kind": "bond"}}]')
+            return json_output, None
+
+        self.stub_out('oslo_concurrency.processutils.execute', test_execute)
+
+        with utils.link_info_cache():
+            self.assertEqual(9000, utils.get_interface_maxmtu("eth0"))
+            self.assertEqual(65535, utils.get_interface_maxmtu("bond0"))
+            self.assertEqual(-1, utils.get_interface_maxmtu("eth1"))
+            self.assertEqual({'max_mtu': 65535, 'address': None,
+                              'operstate': 'DOWN', 'kind': 'bond'},
+                             utils.get_link_info("bond0"))
+            self.assertEqual(1, len(commands))
+            utils.reset_link_info()
+            self.assertEqual('UP', utils.get_link_info("eth0")['operstate'])
+            self.assertEqual(2, len(commands))
+        self.assertEqual(('ip', '-d', '-j', 'link', 'show'), commands[0])
+
+        # Outside the cache, the link is fetched on every call
+        utils.get_interface_maxmtu("eth0")
+        self.assertEqual(('ip', '-d', '-j', 'link', 'show', 'eth0'),
+                         commands[-1])
+
     def test_remove_dpdk_interface_detach_device_not_found(self):
         def fake_detach(pci):
             return 0  # Device not found now returns 0 (already detached)
@@ -1842,111 +2174,133 @@ dpdk {
         # Should log warning but not raise exception
         utils.disable_sriov_config_service()
 
-    def test_unset_driverctl_override_success(self):
-        """Test successful unset_driverctl_override operation."""
-        def fake_execute(*args, **kwargs):
-            return ('', '')
-        self.stub_out('oslo_concurrency.processutils.execute',
-                      fake_execute)
+    def test_set_driver_overrides(self):
+        self.prepare_sysfs("eth1", "0000:03:00.0", "i40e")
+        conf_dir = self.stub_drivers_probe()
+        os.makedirs(common.get_pci_dev_path('0000:03:00.1'))
 
-        result = common.unset_driverctl_override('0000:03:00.0')
-        self.assertEqual(0, result)
+        rebound = common.set_driver_overrides({'0000:03:00.0': 'vfio-pci',
+                                               '0000:03:00.1': 'vfio-pci'})
+        self.assertEqual(['0000:03:00.0', '0000:03:00.1'], rebound)
+        self.assertEqual(
+            {'0000:03:00.0': 'vfio-pci', '0000:03:00.1': 'vfio-pci'},
+            common.get_pci_device_drivers(['0000:03:00.0', '0000:03:00.1']))
+        with open(os.path.join(conf_dir, 'pci-0000:03:00.0')) as f:
+            self.assertEqual('vfio-pci\n', f.read())
 
-    def test_unset_driverctl_override_error_but_override_removed(self):
-        """Test unset_driverctl_override succeeds when override removed."""
-        from oslo_concurrency import processutils
+        # The devices already bound with the driver are not rebound
+        self.assertEqual([], common.set_driver_overrides(
+            {'0000:03:00.0': 'vfio-pci'}))
 
-        call_count = [0]
+    def test_set_driver_overrides_bind_failure(self):
+        self.prepare_sysfs("eth1", "0000:03:00.0", "i40e")
+        conf_dir = self.stub_drivers_probe(bind=False)
 
-        def fake_execute(*args, **kwargs):
-            call_count[0] += 1
-            if call_count[0] == 1:
-                # First call (unset-override) fails
-                raise processutils.ProcessExecutionError(
-                    'driverctl: failed to bind device 0000:03:00.0 to '
-                    'driver i40e')
-            else:
-                # Second call (list-override) shows no override exists
-                return ('', '')
-        self.stub_out('oslo_concurrency.processutils.execute',
-                      fake_execute)
+        self.assertRaises(common.OvsDpdkBindException,
+                          common.set_driver_overrides,
+                          {'0000:03:00.0': 'vfio-pci'})
+        self.assertFalse(os.path.exists(
+            os.path.join(conf_dir, 'pci-0000:03:00.0')))
+
+    def test_bind_driver_overrides_partial_failure(self):
+        # The device missing in sysfs does not stop the binding of the other
+        self.prepare_sysfs("eth1", "0000:03:00.0", "i40e")
+        self.stub_drivers_probe()
+
+        rebound, failed = common.bind_driver_overrides(
+            {'0000:03:00.1': 'vfio-pci', '0000:03:00.0': 'vfio-pci'})
+        self.assertEqual(['0000:03:00.0'], rebound)
+        self.assertEqual(['0000:03:00.1'], failed)
+        self.assertEqual('vfio-pci',
+                         common.get_pci_device_driver('0000:03:00.0'))
 
-        # Mock logger to verify the info message is logged
-        mocked_logger = mock.Mock()
-        self.stub_out('os_net_config.common.logger.info', mocked_logger)
+    def test_unset_driverctl_override_success(self):
+        """Test successful unset_driverctl_override operation."""
+        self.prepare_sysfs("eth1", "0000:03:00.0", "i40e")
+        conf_dir = self.stub_drivers_probe()
+        common.set_driver_overrides({'0000:03:00.0': 'vfio-pci'})
+        self.assertTrue(os.path.exists(
+            os.path.join(conf_dir, 'pci-0000:03:00.0')))
 
         result = common.unset_driverctl_override('0000:03:00.0')
         self.assertEqual(0, result)
+        override_path = common.get_pci_dev_path('0000:03:00.0',
+                                                'driver_override')
+        self.assertEqual('\n', common.get_file_data(override_path))
+        self.assertFalse(os.path.exists(
+            os.path.join(conf_dir, 'pci-0000:03:00.0')))
 
-        # Verify the expected log message was called
-        expected_calls = [
-            mock.call('%s: running %s', '0000:03:00.0',
-                      'driverctl unset-override 0000:03:00.0'),
-            mock.call('%s: Driver override successfully removed despite '
-                      'driverctl error (likely bind-back failure when '
-                      'sriov_drivers_autoprobe=0)', '0000:03:00.0')
-        ]
-        mocked_logger.assert_has_calls(expected_calls)
+    def test_unset_driverctl_override_bind_back_failure(self):
+        """Test unset_driverctl_override succeeds when override removed.
 
-    def test_unset_driverctl_override_error_and_override_still_exists(self):
-        """Test unset_driverctl_override fails when override exists."""
-        from oslo_concurrency import processutils
+        When driver autoprobing is disabled, the default driver could not
+        be bound back once the override is removed.
+        """
+        self.prepare_sysfs("eth1", "0000:03:00.0", "vfio-pci")
+        self.stub_drivers_probe(bind=False)
 
-        call_count = [0]
+        result = common.unset_driverctl_override('0000:03:00.0')
+        self.assertEqual(0, result)
+        self.assertEqual(
+            {'0000:03:00.0': None},
+            common.get_pci_device_drivers(['0000:03:00.0']))
 
-        def fake_execute(*args, **kwargs):
-            call_count[0] += 1
-            if call_count[0] == 1:
-                # First call (unset-override) fails
-                raise processutils.ProcessExecutionError(
-                    'driverctl: some other error occurred')
-            else:
-                # Second call (list-override) shows override still exists
-                return ('0000:03:00.0 vfio-pci\n', '')
-        self.stub_out('oslo_concurrency.processutils.execute',
-                      fake_execute)
+    def test_unset_driverctl_override_failure(self):
+        """Test unset_driverctl_override fails when the device is missing"""
+        self.prepare_sysfs("eth1", "0000:03:00.0", "vfio-pci")
+        self.stub_drivers_probe()
 
         # Mock logger to verify the error message is logged
         mocked_logger = mock.Mock()
         self.stub_out('os_net_config.common.logger.error', mocked_logger)
 
-        result = common.unset_driverctl_override('0000:03:00.0')
+        result = common.unset_driverctl_override('0000:03:00.1')
         self.assertEqual(1, result)
 
         # Verify the error was logged
         expected_msg = '%s: Failed to remove driver override. %s'
-        mocked_logger.assert_called_with(expected_msg, '0000:03:00.0',
+        mocked_logger.assert_called_with(expected_msg, '0000:03:00.1',
                                          mock.ANY)
 
-    def test_unset_driverctl_override_list_command_fails(self):
-        """Test unset_driverctl_override when list-override command fails."""
-        from oslo_concurrency import processutils
-
-        call_count = [0]
-
-        def fake_execute(*args, **kwargs):
-            call_count[0] += 1
-            if call_count[0] == 1:
-                # First call (unset-override) fails
-                raise processutils.ProcessExecutionError(
-                    'driverctl: failed to bind device')
-            else:
-                # Second call (list-override) also fails
-                raise processutils.ProcessExecutionError(
-                    'driverctl: list command failed')
-        self.stub_out('oslo_concurrency.processutils.execute',
-                      fake_execute)
-
-        # Mock logger
-        mocked_logger = mock.Mock()
-        self.stub_out('os_net_config.common.logger.warning', mocked_logger)
-        mocked_error_logger = mock.Mock()
-        self.stub_out('os_net_config.common.logger.error', mocked_error_logger)
-
-        result = common.unset_driverctl_override('0000:03:00.0')
-        self.assertEqual(1, result)
-
-        # Verify warning was logged for list-override failure
-        self.assertTrue(mocked_logger.called)
-        # Verify error was logged for overall failure
-        self.assertTrue(mocked_error_logger.called)
+    def test_log_dump(self):
+        dumps = []
+        yaml_dump = yaml.dump
+
+        def stub_dump(*args, **kwargs):
+            dumps.append(args)
+            return yaml_dump(*args, **kwargs)
+        self.stub_out('yaml.dump', stub_dump)
+        self.stub_out('os_net_config.common.MAX_LOG_DUMP_SIZE', 64)
+        log = mock.Mock()
+        state = {'interfaces': [{'name': f'eth{i}'} for i in range(20)]}
+
+        # Not serialized when the level is not enabled
+        log.isEnabledFor.return_value = False
+        common.log_dump(log, logging.INFO, state, "Present state")
+        self.assertEqual([], dumps)
+        self.assertFalse(log.log.called)
+
+        # Truncated unless debug logging is enabled
+        log.isEnabledFor.side_effect = lambda level: level >= logging.INFO
+        common.log_dump(log, logging.INFO, state, "Present state")
+        self.assertEqual(1, len(dumps))
+        message = log.log.call_args[0][3]
+        self.assertIn("truncated", message)
+        self.assertTrue(message.startswith(yaml_dump(state)[:64]))
+
+        log.isEnabledFor.side_effect = None
+        log.isEnabledFor.return_value = True
+        common.log_dump(log, logging.DEBUG, state, "Present state")
+        self.assertEqual(yaml_dump(state), log.log.call_args[0][3])
+
+        # The dump file has the full dump and the log the truncated one
+        dump_file = os.path.join(tempfile.mkdtemp(), 'dumps.log')
+        common.configure_dump_file(dump_file)
+        self.addCleanup(common.configure_dump_file, None)
+        log.isEnabledFor.return_value = False
+        common.log_dump(log, logging.DEBUG, state, "Present state")
+        with open(dump_file) as f:
+            self.assertIn(yaml_dump(state), f.read())
+        log.isEnabledFor.return_value = True
+        common.log_dump(log, logging.DEBUG, state, "Present state")
+        self.assertIn("truncated", log.log.call_args[0][3])
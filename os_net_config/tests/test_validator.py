@@ -34,6 +34,32 @@ class TestSchemaValidation(base.TestCase):
         schema = validator.get_os_net_config_schema()
         jsonschema.Draft4Validator.check_schema(schema)
 
+    def test_schema_loaded_once(self):
+        validator._load_schema.cache_clear()
+        validator._get_validator.cache_clear()
+        self.addCleanup(validator._get_validator.cache_clear)
+        self.addCleanup(validator._load_schema.cache_clear)
+        loads = []
+        resource_string = validator.pkg_resources.resource_string
+
+        def stub_resource_string(*args):
+            loads.append(args)
+            return resource_string(*args)
+        self.stub_out('pkg_resources.resource_string', stub_resource_string)
+
+        config = [{"type": "interface", "name": "nic1"}]
+        for _ in range(3):
+            self.assertEqual([], validator.validate_config(config))
+        errors = validator.validate_config([{"type": "interface"}])
+        self.assertEqual(1, len(errors))
+        validator.get_schema_for_defined_type("interface")
+        self.assertEqual(1, len(loads))
+
+        # callers get a private copy of the schema
+        schema = validator.get_os_net_config_schema()
+        schema["definitions"].clear()
+        self.assertEqual([], validator.validate_config(config))
+
     def test__validate_config(self):
         schema = {"type": "string"}
         errors = validator._validate_config(42, "foo", schema, False)
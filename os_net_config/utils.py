@@ -14,22 +14,25 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import glob
+import contextlib
+import hashlib
 import json
 import logging
 import os
 import re
 import shutil
 import time
-import yaml
-
-import netaddr
 
 from os_net_config import common
 from os_net_config import sriov_config
-from oslo_concurrency import processutils
+
+netaddr = common.lazy_import('netaddr')
+processutils = common.lazy_import('oslo_concurrency.processutils')
 
 logger = logging.getLogger(__name__)
+# Cached attributes of all the links, used within link_info_cache()
+_link_info = None
+_link_info_depth = 0
 # sriov_config service shall be created and enabled so that the various
 # SR-IOV PF and VF configurations shall be done during reboot as well using
 # sriov_config.py installed in path /usr/bin/os-net-config-sriov
@@ -86,6 +89,138 @@ def write_config(filename, data):
         f.write(str(data))
 
 
+def _read_sysfs(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read().rstrip()
+    except OSError:
+        return None
+
+
+def _readlink_basename(path):
+    try:
+        return os.path.basename(os.readlink(path))
+    except OSError:
+        return None
+
+
+class NicInventory(object):
+    """Attributes of all the network devices, read in a single sysfs scan
+
+    Each NIC is a dict with the keys name, address, perm_hwaddr, operstate,
+    has_device, pci_address, is_vf, driver and vendor.
+    """
+
+    def __init__(self):
+        self.nics = {}
+        self._by_mac = {}
+        self._by_pci = {}
+        try:
+            names = sorted(os.listdir(common.SYS_CLASS_NET))
+        except OSError:
+            names = []
+        for name in names:
+            nic = self._read_nic(name)
+            self.nics[name] = nic
+            for mac in (nic['perm_hwaddr'], nic['address']):
+                if mac:
+                    self._by_mac.setdefault(mac, name)
+            if nic['pci_address']:
+                self._by_pci.setdefault(nic['pci_address'], name)
+
+    def _read_nic(self, name):
+        device_dir = common.get_dev_path(name, '_device')
+        has_device = os.path.isdir(device_dir)
+        nic = {
+            'name': name,
+            'address': _read_sysfs(common.get_dev_path(name, '_address')),
+            'perm_hwaddr': _read_sysfs(
+                common.get_dev_path(name, '_bonding_slave/perm_hwaddr')),
+            'operstate': _read_sysfs(
+                common.get_dev_path(name, '_operstate')),
+            'has_device': has_device,
+            'pci_address': None,
+            'is_vf': False,
+            'driver': None,
+            'vendor': None,
+        }
+        if nic['operstate']:
+            nic['operstate'] = nic['operstate'].lower()
+        if has_device:
+            nic['pci_address'] = _readlink_basename(device_dir)
+            nic['is_vf'] = os.path.isdir(
+                common.get_dev_path(name, 'physfn'))
+            nic['driver'] = _readlink_basename(
+                common.get_dev_path(name, 'driver'))
+            nic['vendor'] = _read_sysfs(common.get_dev_path(name, 'vendor'))
+        return nic
+
+    def get(self, name):
+        return self.nics.get(name)
+
+    def names(self):
+        return list(self.nics.keys())
+
+    def find_by_mac(self, mac):
+        return self._by_mac.get(mac)
+
+    def find_by_pci(self, pci_address):
+        return self._by_pci.get(pci_address)
+
+    def mac(self, name):
+        """MAC address of the NIC, the permanent one for bond ports"""
+        nic = self.nics.get(name)
+        if nic:
+            return nic['perm_hwaddr'] or nic['address']
+
+    def is_real_nic(self, name):
+        nic = self.nics.get(name)
+        return bool(nic and nic['has_device'] and nic['address'])
+
+    def is_available_nic(self, name, check_active=True):
+        nic = self.nics.get(name)
+        if not self.is_real_nic(name) or nic['operstate'] is None:
+            return False
+        if check_active and nic['operstate'] != 'up':
+            return False
+        return not nic['is_vf']
+
+    def digest(self):
+        """Digest of the physical NICs, their MAC and PCI addresses
+
+        VFs and the virtual devices are left out, so that the digest does
+        not change when os-net-config creates them.
+        """
+        digest = hashlib.sha256()
+        for name, nic in self.nics.items():
+            if nic['has_device'] and not nic['is_vf']:
+                digest.update(("%s %s %s\n" % (name, self.mac(name),
+                                               nic['pci_address'])).encode())
+        return digest.hexdigest()
+
+    def links_up(self):
+        return [name for name, nic in self.nics.items()
+                if nic['operstate'] == 'up']
+
+
+# The NicInventory used within nic_inventory()
+_nic_inventory = None
+
+
+@contextlib.contextmanager
+def nic_inventory():
+    """Scan the NICs once and use the inventory within the context"""
+    global _nic_inventory
+    if _nic_inventory is not None:
+        yield _nic_inventory
+        return
+    _nic_inventory = NicInventory()
+    try:
+        yield _nic_inventory
+    finally:
+        _nic_inventory = None
+
+
 def is_active_nic(interface_name):
     return _is_available_nic(interface_name, True)
 
@@ -94,6 +229,9 @@ def is_real_nic(interface_name):
     if interface_name == 'lo':
         return True
 
+    if _nic_inventory is not None:
+        return _nic_inventory.is_real_nic(interface_name)
+
     device_dir = common.get_dev_path(interface_name, '_device')
     has_device_dir = os.path.isdir(device_dir)
 
@@ -111,10 +249,13 @@ def is_real_nic(interface_name):
 
 
 def _is_available_nic(interface_name, check_active=True):
-    try:
-        if interface_name == 'lo':
-            return False
+    if interface_name == 'lo':
+        return False
 
+    if _nic_inventory is not None:
+        return _nic_inventory.is_available_nic(interface_name, check_active)
+
+    try:
         if not is_real_nic(interface_name):
             return False
 
@@ -164,23 +305,22 @@ def _ordered_nics(check_active):
     embedded_nics = []
     nics = []
     logger.info("Finding active nics")
-    for name in glob.iglob(common.SYS_CLASS_NET + '/*'):
-        nic = name[(len(common.SYS_CLASS_NET) + 1):]
-        if _is_available_nic(nic, check_active):
-            if _is_embedded_nic(nic):
-                logger.info("%s: an embedded active nic", nic)
-                embedded_nics.append(nic)
+    with nic_inventory() as inventory:
+        for nic in inventory.names():
+            if _is_available_nic(nic, check_active):
+                if _is_embedded_nic(nic):
+                    logger.info("%s: an embedded active nic", nic)
+                    embedded_nics.append(nic)
+                else:
+                    logger.info("%s: an active nic", nic)
+                    nics.append(nic)
             else:
-                logger.info("%s: an active nic", nic)
-                nics.append(nic)
-        else:
-            logger.info("%s: not an active nic", nic)
+                logger.info("%s: not an active nic", nic)
 
     # Adding nics which are bound to DPDK as it will not be found in '/sys'
     # after it is bound to DPDK driver.
-    contents = common.get_file_data(common.DPDK_MAPPING_FILE)
-    if contents:
-        dpdk_map = yaml.safe_load(contents)
+    dpdk_map = common.get_dpdk_map()
+    if dpdk_map:
         for item in dpdk_map:
             # If the DPDK drivers are bound to a VF, the same needs
             # to be skipped for the NIC ordering
@@ -430,16 +570,15 @@ def delete_dpdk_map_entry(identifier):
             continue  # Skip this entry
         new_map.append(item)
     if not new_map:
-        if os.path.exists(common.DPDK_MAPPING_FILE):
-            logger.info(
-                "DPDK mapping file %s is empty after removing '%s', "
-                "deleting the file.",
-                common.DPDK_MAPPING_FILE,
-                identifier,
-            )
-            os.remove(common.DPDK_MAPPING_FILE)
+        logger.info(
+            "DPDK mapping file %s is empty after removing '%s', "
+            "deleting the file.",
+            common.DPDK_MAPPING_FILE,
+            identifier,
+        )
+        common.dpdk_map_store.remove()
     else:
-        common.write_yaml_config(common.DPDK_MAPPING_FILE, new_map)
+        common.dpdk_map_store.save(new_map)
     if not removed:
         logger.warning(
             "%s: No DPDK mapping entry found in the mapping file.",
@@ -575,21 +714,22 @@ def get_dpdk_devargs(ifname, noop):
 # on subsequent runs of os-net-config.
 def _update_dpdk_map(ifname, pci_address, mac_address, driver):
     dpdk_map = common.get_dpdk_map()
-    for item in dpdk_map:
-        if item['pci_address'] == pci_address:
-            item['name'] = ifname
-            item['mac_address'] = mac_address
-            item['driver'] = driver
-            break
+    item = common.dpdk_map_store.lookup(
+        'pci_address', pci_address, dpdk_map
+    )
+    if item:
+        item['name'] = ifname
+        item['mac_address'] = mac_address
+        item['driver'] = driver
     else:
-        new_item = {}
-        new_item['pci_address'] = pci_address
-        new_item['name'] = ifname
-        new_item['mac_address'] = mac_address
-        new_item['driver'] = driver
-        dpdk_map.append(new_item)
+        item = {}
+        item['pci_address'] = pci_address
+        item['name'] = ifname
+        item['mac_address'] = mac_address
+        item['driver'] = driver
+        dpdk_map.append(item)
 
-    common.write_yaml_config(common.DPDK_MAPPING_FILE, dpdk_map)
+    common.dpdk_map_store.save(dpdk_map, item)
 
 
 def get_totalvfs(iface_name):
@@ -615,19 +755,11 @@ def get_totalvfs(iface_name):
 
 
 def get_sriov_dev_from_pci_address(pci_address):
-    sriov_map = common.get_sriov_map()
-    for item in sriov_map:
-        if item['pci_address'] == pci_address:
-            return item
-    return None
+    return common.sriov_map_store.lookup('pci_address', pci_address)
 
 
 def get_sriov_dev_from_name(dev_name):
-    sriov_map = common.get_sriov_map()
-    for item in sriov_map:
-        if item['name'] == dev_name:
-            return item
-    return None
+    return common.sriov_map_store.lookup('name', dev_name)
 
 
 def remove_entries_for_sriov_dev(identifier):
@@ -688,13 +820,13 @@ def remove_entries_for_sriov_dev(identifier):
             common.SRIOV_CONFIG_FILE
         )
         try:
-            os.remove(common.SRIOV_CONFIG_FILE)
+            common.sriov_map_store.remove()
         except OSError:
             logger.error("Failed to remove sriov map file")
             pass
         disable_sriov_config_service()
     else:
-        common.write_yaml_config(common.SRIOV_CONFIG_FILE, new_map)
+        common.sriov_map_store.save(new_map)
 
 
 def update_sriov_pf_map(ifname, numvfs, noop, promisc=None,
@@ -716,44 +848,43 @@ def update_sriov_pf_map(ifname, numvfs, noop, promisc=None,
 
     # Allow configuring the sriov map even if the PF is attached to the guest
     sriov_map = common.get_sriov_map()
-    for item in sriov_map:
-        if item['device_type'] == 'pf' and item['name'] == ifname:
-            item['numvfs'] = numvfs
-            item['drivers_autoprobe'] = drivers_autoprobe
-            item['vdpa'] = vdpa
-            if promisc is not None:
-                item['promisc'] = promisc
-            item['link_mode'] = link_mode
-            if steering_mode is not None:
-                item['steering_mode'] = steering_mode
-            if lag_candidate is not None:
-                item['lag_candidate'] = lag_candidate
-            if pci_address:
-                item['pci_address'] = pci_address
-            if mac_address:
-                item['mac_address'] = mac_address
-            break
+    item = common.sriov_map_store.lookup('pf', ifname, sriov_map)
+    if item:
+        item['numvfs'] = numvfs
+        item['drivers_autoprobe'] = drivers_autoprobe
+        item['vdpa'] = vdpa
+        if promisc is not None:
+            item['promisc'] = promisc
+        item['link_mode'] = link_mode
+        if steering_mode is not None:
+            item['steering_mode'] = steering_mode
+        if lag_candidate is not None:
+            item['lag_candidate'] = lag_candidate
+        if pci_address:
+            item['pci_address'] = pci_address
+        if mac_address:
+            item['mac_address'] = mac_address
     else:
-        new_item = {}
-        new_item['device_type'] = 'pf'
-        new_item['name'] = ifname
-        new_item['numvfs'] = numvfs
-        new_item['drivers_autoprobe'] = drivers_autoprobe
-        new_item['vdpa'] = vdpa
+        item = {}
+        item['device_type'] = 'pf'
+        item['name'] = ifname
+        item['numvfs'] = numvfs
+        item['drivers_autoprobe'] = drivers_autoprobe
+        item['vdpa'] = vdpa
         if promisc is not None:
-            new_item['promisc'] = promisc
-        new_item['link_mode'] = link_mode
+            item['promisc'] = promisc
+        item['link_mode'] = link_mode
         if steering_mode is not None:
-            new_item['steering_mode'] = steering_mode
+            item['steering_mode'] = steering_mode
         if lag_candidate is not None:
-            new_item['lag_candidate'] = lag_candidate
+            item['lag_candidate'] = lag_candidate
         if pci_address:
-            new_item['pci_address'] = pci_address
+            item['pci_address'] = pci_address
         if mac_address:
-            new_item['mac_address'] = mac_address
-        sriov_map.append(new_item)
+            item['mac_address'] = mac_address
+        sriov_map.append(item)
 
-    common.write_yaml_config(common.SRIOV_CONFIG_FILE, sriov_map)
+    common.sriov_map_store.save(sriov_map, item)
 
 
 def _set_vf_fields(vf_name, vlan_id, qos, spoofcheck, trust, state, macaddr,
@@ -792,37 +923,31 @@ def update_sriov_vf_map(pf_name, vfid, vf_name, vlan_id=0, qos=0,
                         promisc=None, pci_address=None,
                         min_tx_rate=0, max_tx_rate=0, driver=None):
     sriov_map = common.get_sriov_map()
-    for item in sriov_map:
-        if (item['device_type'] == 'vf' and
-           item['device'].get('name') == pf_name and
-           item['device'].get('vfid') == vfid):
-            item.update(_set_vf_fields(vf_name, vlan_id, qos, spoofcheck,
-                                       trust, state, macaddr, promisc,
-                                       pci_address, min_tx_rate, max_tx_rate,
-                                       driver))
-            _clear_empty_values(item)
-            break
+    item = common.sriov_map_store.lookup('vf', (pf_name, vfid), sriov_map)
+    if item:
+        item.update(_set_vf_fields(vf_name, vlan_id, qos, spoofcheck,
+                                   trust, state, macaddr, promisc,
+                                   pci_address, min_tx_rate, max_tx_rate,
+                                   driver))
+        _clear_empty_values(item)
     else:
-        new_item = {}
-        new_item['device_type'] = 'vf'
-        new_item['device'] = {"name": pf_name, "vfid": vfid}
-        new_item.update(_set_vf_fields(vf_name, vlan_id, qos, spoofcheck,
-                                       trust, state, macaddr, promisc,
-                                       pci_address, min_tx_rate, max_tx_rate,
-                                       driver))
-        _clear_empty_values(new_item)
-        sriov_map.append(new_item)
+        item = {}
+        item['device_type'] = 'vf'
+        item['device'] = {"name": pf_name, "vfid": vfid}
+        item.update(_set_vf_fields(vf_name, vlan_id, qos, spoofcheck,
+                                   trust, state, macaddr, promisc,
+                                   pci_address, min_tx_rate, max_tx_rate,
+                                   driver))
+        _clear_empty_values(item)
+        sriov_map.append(item)
 
-    common.write_yaml_config(common.SRIOV_CONFIG_FILE, sriov_map)
+    common.sriov_map_store.save(sriov_map, item)
 
 
 def _get_vf_name_from_map(pf_name, vfid):
-    sriov_map = common.get_sriov_map()
-    for item in sriov_map:
-        if (item['device_type'] == 'vf' and
-           item['device'].get('name') == pf_name and
-           item['device'].get('vfid') == vfid):
-            return item['name']
+    item = common.sriov_map_store.lookup('vf', (pf_name, vfid))
+    if item:
+        return item['name']
 
 
 def nicpart_udev_rules_check():
@@ -890,6 +1015,9 @@ def disable_sriov_config_service():
 
 def configure_sriov_pfs(execution_from_cli=False, restart_openvswitch=False):
     logger.info("Configuring PFs now")
+    # The udev rules for the PFs invoke os-net-config-sriov, which reads
+    # the SR-IOV map from the file
+    common.flush_maps()
     sriov_config.configure_sriov_pf(
         execution_from_cli=execution_from_cli,
         restart_openvswitch=restart_openvswitch)
@@ -921,13 +1049,10 @@ def get_vf_devname(pf_name, vfid):
     # VF by default and hence the path will not be available. In NIC
     # partitioning use cases, the driver will be bound by os-net-config.
     # It is necessary to wait for the above path to be available in order
-    # to read the VF name. Few retries are made to check for the existence
-    # of the vf_path.
-    for i in range(30):
-        if os.path.exists(vf_path):
-            break
-        time.sleep(1)
-    else:
+    # to read the VF name. The udev events are waited for, until the vf_path
+    # is available.
+    if not common.wait_for_sysfs({vf_path: vf_path},
+                                 common.VF_BINDING_TIMEOUT):
         msg = "NIC %s with VF id: %d could not be found" % (pf_name, vfid)
         raise common.SriovVfNotFoundException(msg)
 
@@ -957,36 +1082,94 @@ def backup_map_files(backup_path):
             logger.warning("%s does not exist", src)
 
 
+def _dump_link_info(name=None):
+    """Fetch the attributes of the links with 'ip -d -j link show'
+
+    :param name: Interface name, or None to fetch all the links
+    :return: dict of link attributes keyed by the interface name, or None
+        if the links could not be fetched
+    """
+    cmd = ['ip', '-d', '-j', 'link', 'show']
+    if name:
+        cmd.append(name)
+    try:
+        out, err = processutils.execute(*cmd)
+    except processutils.ProcessExecutionError as exc:
+        # Check if the error is due to device not existing
+        if name and 'does not exist' in str(exc).lower():
+            logger.info("%s: Interface does not exist", name)
+        else:
+            logger.info("%s: Unable to get link info, error: %s",
+                        name or 'all', exc)
+        return None
+    if err:
+        logger.info("%s: Unable to get link info : %s", name or 'all', err)
+        return None
+    link_info = {}
+    for link in json.loads(out) if out else []:
+        link_info[link.get('ifname')] = {
+            'max_mtu': link.get('max_mtu'),
+            'address': link.get('address'),
+            'operstate': link.get('operstate'),
+            'kind': link.get('linkinfo', {}).get('info_kind'),
+        }
+    return link_info
+
+
+@contextlib.contextmanager
+def link_info_cache():
+    """Serve get_link_info() from a single dump of all the links
+
+    The links created within the context are not seen until
+    reset_link_info() is invoked.
+    """
+    global _link_info_depth
+    _link_info_depth += 1
+    try:
+        yield
+    finally:
+        _link_info_depth -= 1
+        if not _link_info_depth:
+            reset_link_info()
+
+
+def reset_link_info():
+    """Drop the cached dump of the links"""
+    global _link_info
+    _link_info = None
+
+
+def get_link_info(name):
+    """Get the max_mtu, MAC address, operstate and kind of the link
+
+    :param name: Interface name
+    :return: dict of the link attributes or None if not available
+    """
+    global _link_info
+    if common.get_noop():
+        return None
+    if not _link_info_depth:
+        link_info = _dump_link_info(name) or {}
+        return link_info.get(name)
+    if _link_info is None:
+        _link_info = _dump_link_info() or {}
+    if name not in _link_info:
+        logger.info("%s: Interface does not exist", name)
+    return _link_info.get(name)
+
+
 def get_interface_maxmtu(name):
-    """Check if requested interface MTU exceeds allowed max_mtu.
+    """Get the max_mtu supported by the interface
 
     :param name: Interface name
-    :return: True, if mtu exceeds limit. Else False
+    :return: max_mtu of the interface, or -1 if not available
     """
-    noop = common.get_noop()
-    cmd = ['ip', '-d', '-j', 'link', 'show', name]
-    if not noop:
-        try:
-            out, err = processutils.execute(*cmd)
-            if err:
-                logger.info("%s: Unable to get max_mtu : %s", name, err)
-                return -1
-            if out:
-                data = json.loads(out)
-                maxmtu = int(data[0].get('max_mtu'))
-                if maxmtu is not None:
-                    logger.debug("%s: Max MTU supported is %s", name, maxmtu)
-                    return maxmtu
-        except processutils.ProcessExecutionError as exc:
-            # Check if the error is due to device not existing
-            if 'does not exist' in str(exc).lower():
-                logger.info(
-                    "%s: Interface does not exist, skipping MTU validation",
-                    name
-                )
-            else:
-                logger.info("%s: Unable to get max_mtu, error: %s", name, exc)
-            return -1
+    link_info = get_link_info(name)
+    if link_info and link_info['max_mtu'] is not None:
+        maxmtu = int(link_info['max_mtu'])
+        logger.debug("%s: Max MTU supported is %s", name, maxmtu)
+        return maxmtu
+    logger.debug("%s: Unable to get max_mtu, skipping MTU validation", name)
     return -1
 
 
@@ -17,20 +17,36 @@
 import collections
 import collections.abc
 import copy
+import functools
 import jsonschema
 import pkg_resources
 import yaml
 
 
-def get_os_net_config_schema():
-    """Returns the schema for os_net_config's config files."""
+@functools.lru_cache(maxsize=None)
+def _load_schema():
+    """Loads and parses schema.yaml once per process.
+
+    The returned dict is shared by every caller and must not be modified.
+    """
     schema_string = pkg_resources.resource_string(__name__, "schema.yaml")
     return yaml.safe_load(schema_string)
 
 
+@functools.lru_cache(maxsize=None)
+def _get_validator():
+    """Returns a Draft7Validator compiled once for the full schema."""
+    return jsonschema.Draft7Validator(_load_schema())
+
+
+def get_os_net_config_schema():
+    """Returns the schema for os_net_config's config files."""
+    return copy.deepcopy(_load_schema())
+
+
 def get_schema_for_defined_type(defined_type):
     """Returns the schema for a given defined type of the full schema."""
-    full_schema = get_os_net_config_schema()
+    full_schema = _load_schema()
     type_schema = copy.deepcopy(full_schema["definitions"][defined_type])
     type_schema["$schema"] = full_schema["$schema"]
     type_schema["definitions"] = full_schema["definitions"]
@@ -44,13 +60,15 @@ def validate_config(config, config_name="Config file"):
     If validation succeeds, returns an empty list.
     `config_name` can be used to prefix errors with a more specific name.
     """
-    return _validate_config(config, config_name,
-                            get_os_net_config_schema(), True)
+    return _validate_config(config, config_name, _load_schema(), True,
+                            validator=_get_validator())
 
 
-def _validate_config(config, config_name, schema, filter_errors):
+def _validate_config(config, config_name, schema, filter_errors,
+                     validator=None):
     error_messages = []
-    validator = jsonschema.Draft7Validator(schema)
+    if validator is None:
+        validator = jsonschema.Draft7Validator(schema)
     v_errors = validator.iter_errors(config)
     v_errors = sorted(v_errors, key=lambda e: e.path)
     for v_error in v_errors: